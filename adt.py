@@ -1,17 +1,128 @@
+import locale
+import math
 import random
+import sys
+import unicodedata
 import uuid
-from datetime import datetime
+from array import array
+from collections import deque
+from itertools import islice
+from datetime import datetime, timedelta
+
+ASC = "asc"
+DESC = "desc"
+
+
+def collation_key(text):
+    """Casefolded, Unicode-normalized key that follows the active locale's collation"""
+    return locale.strxfrm(unicodedata.normalize("NFKC", text).casefold())
+
+
+# Sort key per sortable field; each is computed once per song by Playlist.sort
+SORT_KEYS = {
+    "title": lambda s: collation_key(s.title),
+    "artist": lambda s: collation_key(s.artist),
+    "added_at": lambda s: s.added_ts,
+    # Never-played songs sort as the oldest
+    "last_played": lambda s: s.last_played_ts if s.last_played_ts is not None else float("-inf"),
+    "play_count": lambda s: s.play_count,
+    "is_favorite": lambda s: s.is_favorite,
+}
+
+# Recent changes each playlist keeps for Playlist.changes_since
+CHANGE_LOG_SIZE = 1024
+
+# Timestamps are stored as float seconds of naive local time since this epoch
+EPOCH = datetime(1970, 1, 1)
+
+# Smart shuffle weights: favorites weigh FAVORITE_WEIGHT times as much,
+# every play lowers a song's weight a little, and a played song regains
+# half its missing weight per RECENCY_HALF_LIFE seconds (never dropping
+# below MIN_RECENCY of it)
+FAVORITE_WEIGHT = 3.0
+RECENCY_HALF_LIFE = 24 * 3600
+MIN_RECENCY = 0.1
+# Songs whose weight rose since the alias table was built (new songs and
+# new favorites) are sampled from a side list; past this many the table is rebuilt
+SMART_EXTRA_LIMIT = 256
+# Smart shuffle picks kept for prev
+SMART_HISTORY = 100
+# Rejected candidates after which a smart shuffle pick gives up
+SMART_MAX_TRIES = 10000
+
+
+def to_timestamp(dt):
+    return (dt - EPOCH).total_seconds()
+
+
+def from_timestamp(ts):
+    return EPOCH + timedelta(seconds=ts)
+
+
+def smart_base_weight(song):
+    """A song's smart shuffle weight once its last play is long past, which bounds its weight"""
+    return (FAVORITE_WEIGHT if song.is_favorite else 1.0) / (1.0 + math.log1p(song.play_count))
+
+
+def smart_weight(song, now):
+    """A song's smart shuffle weight at timestamp now"""
+    weight = smart_base_weight(song)
+    if song.last_played_ts is not None:
+        weight *= max(MIN_RECENCY, 1.0 - 0.5 ** ((now - song.last_played_ts) / RECENCY_HALF_LIFE))
+    return weight
+
+
+def song_key(song_id):
+    """Integer key of a song id string, or None if it is not a valid id"""
+    try:
+        return uuid.UUID(song_id).int
+    except (ValueError, TypeError, AttributeError):
+        return None
+
 
 class Song:
+    """A track. Uses __slots__, keeps its UUID as an int and its timestamps
+    as floats; the string/datetime forms are built on access."""
+
+    __slots__ = ("key", "title", "artist", "file_path", "added_ts", "is_favorite", "last_played_ts", "play_count",
+                 "duration")
+
     def __init__(self, title, artist, file_path):
-        self.id = str(uuid.uuid4())
+        self.key = uuid.uuid4().int
         self.title = title
-        self.artist = artist
+        # Many songs share an artist, so keep one copy of each name
+        self.artist = sys.intern(artist)
         self.file_path = file_path
-        self.added_at = datetime.now()
+        self.added_ts = to_timestamp(datetime.now())
         self.is_favorite = False
-        self.last_played = None
+        self.last_played_ts = None
         self.play_count = 0
+        # Seconds, from the metadata cache; None until the file has been read
+        self.duration = None
+
+    @property
+    def id(self):
+        return str(uuid.UUID(int=self.key))
+
+    @id.setter
+    def id(self, value):
+        self.key = uuid.UUID(value).int
+
+    @property
+    def added_at(self):
+        return from_timestamp(self.added_ts)
+
+    @added_at.setter
+    def added_at(self, value):
+        self.added_ts = to_timestamp(value)
+
+    @property
+    def last_played(self):
+        return from_timestamp(self.last_played_ts) if self.last_played_ts is not None else None
+
+    @last_played.setter
+    def last_played(self, value):
+        self.last_played_ts = to_timestamp(value) if value else None
 
     def to_dict(self):
         return {
@@ -21,278 +132,750 @@ class Song:
             "file_path": self.file_path,
             "added_at": self.added_at.isoformat(),
             "is_favorite": self.is_favorite,
-            "last_played": self.last_played.isoformat() if self.last_played else None,
-            "play_count": self.play_count
+            "last_played": self.last_played.isoformat() if self.last_played_ts is not None else None,
+            "play_count": self.play_count,
+            "duration": self.duration
         }
 
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a song from the output of to_dict"""
+        song = cls(data['title'], data['artist'], data['file_path'])
+        song.id = data['id']
+        song.added_at = datetime.fromisoformat(data['added_at'])
+        song.is_favorite = data.get('is_favorite', False)
+        song.play_count = data.get('play_count', 0)
+        song.duration = data.get('duration')
+        if data.get('last_played'):
+            song.last_played = datetime.fromisoformat(data['last_played'])
+        return song
+
 class Node:
+    __slots__ = ("song", "next", "prev")
+
     def __init__(self, song):
         self.song = song
         self.next = None
         self.prev = None
 
+class RecencyIndex:
+    """Played songs ordered by last_played_ts, newest last.
+
+    mark_as_played always produces the newest timestamp, so updates are an
+    O(1) move to the end; songs added out of order (e.g. on load) trigger
+    one re-sort on the next read. newest(limit) is then O(limit).
+    """
+
+    def __init__(self):
+        self._songs = {}  # song.key -> (last_played_ts when indexed, Song)
+        self._sorted = True
+
+    def __len__(self):
+        return len(self._songs)
+
+    def add(self, song):
+        """Insert or reposition a song after its last_played_ts may have changed"""
+        ts = song.last_played_ts
+        entry = self._songs.get(song.key)
+        if entry is not None and entry[0] == ts:
+            return
+        self._songs.pop(song.key, None)
+        if ts is None:
+            return
+        if self._songs and next(reversed(self._songs.values()))[0] > ts:
+            self._sorted = False
+        self._songs[song.key] = (ts, song)
+
+    def discard(self, song):
+        self._songs.pop(song.key, None)
+
+    def newest(self, limit):
+        """The limit most recently played songs, newest first"""
+        if not self._sorted:
+            self._songs = dict(sorted(self._songs.items(), key=lambda item: item[1][0]))
+            self._sorted = True
+        return [song for _, song in islice(reversed(self._songs.values()), limit)]
+
+
+class ShuffleOrder:
+    """A random play order drawn lazily over a playlist's slot array.
+
+    Incremental Fisher-Yates: each draw swaps a random slot not drawn yet
+    to the end of the drawn prefix, so slots[:drawn] is the order played so
+    far and each step is O(1). position is the cursor into that prefix,
+    which lets prev walk back through it. The swaps are logged so turning
+    shuffle off can undo them in O(drawn).
+    """
+
+    __slots__ = ("slots", "seed", "position", "drawn", "_rng", "_swaps")
+
+    def __init__(self, slots, seed):
+        self.slots = slots
+        self.seed = seed
+        self.position = -1
+        self.drawn = 0
+        self._rng = random.Random(seed)
+        self._swaps = []  # Slot each draw swapped in; None once compaction made them meaningless
+
+    def draw(self):
+        """Swap a random undrawn slot into the prefix; returns False if every slot is drawn"""
+        slots = self.slots
+        if self.drawn >= len(slots):
+            return False
+        j = self._rng.randrange(self.drawn, len(slots))
+        slots[self.drawn], slots[j] = slots[j], slots[self.drawn]
+        if self._swaps is not None:
+            self._swaps.append(j)
+        self.drawn += 1
+        return True
+
+    def undo(self):
+        """Put the slots back as they were before the first draw; returns False if that is no longer possible"""
+        if self._swaps is None:
+            return False
+        slots = self.slots
+        for i in range(len(self._swaps) - 1, -1, -1):
+            j = self._swaps[i]
+            slots[i], slots[j] = slots[j], slots[i]
+        return True
+
+    def compact(self, alive):
+        """Drop the slots alive rejects, keeping the order of the rest and the cursor on the same node"""
+        kept = []
+        drawn = position = 0
+        for i, node in enumerate(self.slots):
+            if alive(node):
+                kept.append(node)
+                drawn += i < self.drawn
+                position += i <= self.position
+        self.slots[:] = kept
+        self.drawn = drawn
+        self.position = position - 1
+        self._swaps = None
+
+
+class SmartShuffle:
+    """Weighted random picks (see smart_weight) in O(1) expected time.
+
+    A Walker/Vose alias table over each node's weight bound picks a
+    candidate in O(1), which is then accepted with probability weight /
+    bound, so candidates are drawn in proportion to their current weight.
+    Weights only fall below their bound as songs are played, so
+    mark_as_played needs no update at all; songs that rise above it (new
+    ones and new favorites) move to a small side list until the next
+    rebuild. Candidates among the last window picks are rejected too.
+    """
+
+    def __init__(self, nodes, window):
+        self.window = window
+        self._rng = random.Random()
+        self._picks = deque()  # (pick number, song key) of the last window picks
+        self._last_pick = {}   # song key -> its latest pick number among them
+        self._count = 0
+        self.history = deque(maxlen=SMART_HISTORY)
+        self.back = 0  # Steps prev has gone back through history
+        self.build(nodes)
+
+    def build(self, nodes):
+        """Rebuild the alias table over nodes with Vose's method, in O(n)"""
+        n = len(nodes)
+        bounds = [smart_base_weight(node.song) for node in nodes]
+        self._total = sum(bounds)
+        self._nodes = nodes
+        self._bounds = array('d', bounds)
+        self._prob = array('d', bytes(8 * n))
+        self._alias = array('i', bytes(4 * n))
+        scaled = [bound * n / self._total for bound in bounds] if n else []
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] += scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:
+            # Left over only through rounding: their columns are full
+            self._prob[i] = 1.0
+        self._built_favorites = {node.song.key for node in nodes if node.song.is_favorite}
+        self._extra = {}  # song key -> (node, bound) of songs sampled from the side list
+        self._extra_total = 0.0
+        self._dead = 0
+
+    def stale(self):
+        return len(self._extra) > SMART_EXTRA_LIMIT or self._dead > len(self._nodes) // 2
+
+    def add(self, node):
+        """Sample a node that is not in the table (or outgrew its bound there) from the side list"""
+        key = node.song.key
+        bound = smart_base_weight(node.song)
+        if key in self._extra:
+            self._extra_total -= self._extra[key][1]
+        self._extra[key] = (node, bound)
+        self._extra_total += bound
+
+    def update(self, node):
+        """Account for a change to a song's fields; only a new favorite can outgrow its bound"""
+        key = node.song.key
+        if node.song.is_favorite and (key in self._extra or key not in self._built_favorites):
+            self.add(node)
+
+    def discard(self, node):
+        entry = self._extra.pop(node.song.key, None)
+        if entry:
+            self._extra_total -= entry[1]
+        self._dead += 1
+
+    def _in_window(self, key, live):
+        # A short playlist still has some song to pick
+        window = min(self.window, live - 1)
+        return key in self._last_pick and self._count - self._last_pick[key] < window
+
+    def pick(self, alive, live, now):
+        """Draw a live node by weight outside the repeat window, or None if none is found"""
+        rng = self._rng
+        n = len(self._nodes)
+        for _ in range(SMART_MAX_TRIES):
+            if self._extra and rng.random() * (self._total + self._extra_total) >= self._total:
+                node, bound = self._pick_extra(rng.random() * self._extra_total)
+            elif n:
+                i = int(rng.random() * n)
+                j = i if rng.random() < self._prob[i] else self._alias[i]
+                node, bound = self._nodes[j], self._bounds[j]
+                if node.song.key in self._extra:
+                    continue
+            else:
+                return None
+            if not alive(node) or self._in_window(node.song.key, live):
+                continue
+            if rng.random() * bound < smart_weight(node.song, now):
+                self.remember(node.song.key)
+                return node
+        return None
+
+    def _pick_extra(self, target):
+        for node, bound in self._extra.values():
+            target -= bound
+            if target < 0:
+                break
+        return node, bound
+
+    def remember(self, key):
+        """Count a song as picked, for the repeat window"""
+        self._count += 1
+        self._picks.append((self._count, key))
+        self._last_pick[key] = self._count
+        while len(self._picks) > self.window:
+            count, key = self._picks.popleft()
+            if self._last_pick[key] == count:
+                del self._last_pick[key]
+
+
 class Playlist:
     def __init__(self):
         self.head = None
         self.tail = None
         self.current = None
         self.size = 0
+        # Hash index from song key (see song_key) to its Node for O(1) lookups
+        self._index = {}
+        # Number of entries per file path for O(1) duplicate checks
+        self._paths = {}
+        # Bumped on every change to the songs or their order, so readers can
+        # tell whether anything they derived from the playlist is stale
+        self.version = 0
+        # Ring of (version, op, song, position) for the latest changes
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        # Secondary indexes: favorites in the order they were marked
+        # (playlist order for songs loaded as favorites) and played songs by recency
+        self._favorites = {}
+        self._recent = RecencyIndex()
+        # Every node in no particular order, for shuffle mode to draw from;
+        # removed nodes stay until more than half the slots are dead
+        self._slots = []
+        self._dead = 0
+        # Whether the live slots follow the playlist order (draws aside), so
+        # a new shuffle replays the same way from its seed after a reload
+        self._slots_ordered = True
+        self._shuffle = None  # ShuffleOrder while shuffle mode is on
+        self._smart = None    # SmartShuffle while smart shuffle is on
     
+    def _changed(self, op, song=None, position=None):
+        """Bump the version and log the change that caused it"""
+        self.version += 1
+        self._changes.append((self.version, op, song, position))
+
+    def touch(self, song):
+        """Record a change made to one of the songs from outside the playlist"""
+        self._index_song(song)
+        if self._smart and song.key in self._index:
+            self._smart.update(self._index[song.key])
+        self._changed("update", song)
+
+    def _index_song(self, song):
+        """Bring the favorites and recency indexes in line with the song's fields"""
+        if song.is_favorite:
+            self._favorites.setdefault(song.key, song)
+        else:
+            self._favorites.pop(song.key, None)
+        self._recent.add(song)
+
+    def changes_since(self, version):
+        """Ops that bring a copy at version up to date, or None if they are no longer kept.
+
+        Songs are serialized in their current state. When the songs were
+        reordered (shuffle or sort) the moves are dropped and a final
+        'order' op lists every id instead.
+        """
+        if version == self.version:
+            return []
+        if version > self.version or not self._changes or self._changes[0][0] > version + 1:
+            return None
+
+        entries = [entry for entry in self._changes if entry[0] > version]
+        reordered = any(op == "order" for _, op, _, _ in entries)
+        # Only the last update of each song matters, since all carry its current state
+        last_update = {song.key: i for i, (_, op, song, _) in enumerate(entries) if op == "update"}
+        ops = []
+        for i, (_, op, song, position) in enumerate(entries):
+            if op == "add":
+                ops.append({"op": "add", "position": position, "song": song.to_dict()})
+            elif op == "remove":
+                ops.append({"op": "remove", "id": song.id})
+            elif op == "move" and not reordered:
+                ops.append({"op": "move", "id": song.id, "position": position})
+            elif op == "update" and last_update[song.key] == i:
+                ops.append({"op": "update", "song": song.to_dict()})
+        if reordered:
+            ops.append({"op": "order", "ids": [song.id for song in self.iter_songs()]})
+        return ops
+
     def is_empty(self):
         return self.size == 0
+
+    def __contains__(self, song):
+        return song.key in self._index
     
     def contains_song(self, file_path):
         """Check if a song with the same file path already exists in the playlist"""
-        current = self.head
-        while current:
-            if current.song.file_path == file_path:
-                return True
-            current = current.next
-        return False
+        return file_path in self._paths
+
+    def contains_many(self, file_paths):
+        """Return the subset of file_paths that already exist in the playlist"""
+        return {path for path in file_paths if path in self._paths}
+
+    def _find_node(self, song_id):
+        """Return the node holding the song with the given id, or None"""
+        return self._index.get(song_key(song_id))
+
+    def get_song(self, song_id):
+        """Return the song with the given id, or None if it is not in the playlist"""
+        node = self._find_node(song_id)
+        return node.song if node else None
+
+    def _node_at(self, position):
+        """Return the node at a 0-indexed position by walking from head"""
+        curr = self.head
+        for _ in range(position):
+            curr = curr.next
+        return curr
+
+    def _position_of(self, node):
+        """Return the 0-indexed position of a node by walking from head"""
+        position = 0
+        curr = self.head
+        while curr is not node:
+            curr = curr.next
+            position += 1
+        return position
+
+    def _link_at(self, node, position):
+        """Link a detached node in at position (clamped) and return the final position"""
+        if position <= 0 or not self.head:
+            # Insert at head
+            position = 0
+            node.prev = None
+            node.next = self.head
+            if self.head:
+                self.head.prev = node
+            self.head = node
+            if not self.tail:
+                self.tail = node
+        elif position >= self.size:
+            # Insert at tail
+            position = self.size
+            node.next = None
+            node.prev = self.tail
+            self.tail.next = node
+            self.tail = node
+        else:
+            # Insert in middle, after the node currently at position - 1
+            curr = self._node_at(position - 1)
+            node.next = curr.next
+            node.prev = curr
+            curr.next.prev = node
+            curr.next = node
+        self.size += 1
+        return position
+
+    def _unlink(self, node):
+        """Detach a node from the list, leaving the indexes untouched"""
+        if node.prev:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+
+        if node.next:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
+
+        node.prev = None
+        node.next = None
+        self.size -= 1
 
     def add_song(self, song):
+        self.insert_at(self.size, song)
+
+    def insert_at(self, position, song):
+        """Insert a song at a 0-indexed position, clamped to the playlist bounds"""
         new_node = Node(song)
-        if not self.head:
-            self.head = new_node
-            self.tail = new_node
+        position = self._link_at(new_node, position)
+        self._slots.append(new_node)
+        if position < self.size - 1:
+            self._slots_ordered = False
+        if self._smart:
+            self._smart.add(new_node)
+        if not self.current:
             self.current = new_node  # Set current to first song added
-        else:
-            self.tail.next = new_node
-            new_node.prev = self.tail
-            self.tail = new_node
-        self.size += 1
+        self._index[song.key] = new_node
+        self._index_song(song)
+        self._paths[song.file_path] = self._paths.get(song.file_path, 0) + 1
+        self._changed("add", song, position)
+
+    def get_at(self, position):
+        """Return the song at a 0-indexed position, or None if out of range"""
+        if position < 0 or position >= self.size:
+            return None
+        return self._node_at(position).song
+
+    def index_of(self, song_id):
+        """Return the 0-indexed position of a song, or -1 if it is not in the playlist"""
+        node = self._find_node(song_id)
+        if not node:
+            return -1
+        return self._position_of(node)
 
     def remove_song(self, song_id):
-        current = self.head
-        while current:
-            if current.song.id == song_id:
-                # Update current pointer if we are removing the current song
-                if self.current == current:
-                    self.current = current.next if current.next else current.prev
-
-                if current.prev:
-                    current.prev.next = current.next
-                else:
-                    self.head = current.next
-
-                if current.next:
-                    current.next.prev = current.prev
-                else:
-                    self.tail = current.prev
-
-                self.size -= 1
-                return True
-            current = current.next
-        return False
+        current = self._index.pop(song_key(song_id), None)
+        if not current:
+            return False
+
+        self._favorites.pop(current.song.key, None)
+        self._recent.discard(current.song)
+        file_path = current.song.file_path
+        if self._paths[file_path] > 1:
+            self._paths[file_path] -= 1
+        else:
+            del self._paths[file_path]
+
+        # Update current pointer if we are removing the current song
+        if self.current == current:
+            self.current = current.next if current.next else current.prev
+
+        self._unlink(current)
+        if self._smart:
+            self._smart.discard(current)
+        self._dead += 1
+        if self._dead > len(self._slots) // 2:
+            self._compact_slots()
+        self._changed("remove", current.song)
+        return True
 
     def get_current_song(self):
         return self.current.song if self.current else None
 
     def next_song(self):
+        if self._smart:
+            return self._smart_step(1)
+        if self._shuffle:
+            return self._shuffle_step(1)
         if self.current and self.current.next:
             self.current = self.current.next
         return self.get_current_song()
 
     def prev_song(self):
+        if self._smart:
+            return self._smart_step(-1)
+        if self._shuffle:
+            return self._shuffle_step(-1)
         if self.current and self.current.prev:
             self.current = self.current.prev
         return self.get_current_song()
 
-    def get_all_songs(self):
-        songs = []
-        current = self.head
-        while current:
-            songs.append(current.song.to_dict())
+    def _shuffle_step(self, step):
+        """Move the shuffle cursor to the next live song in direction step, drawing new ones as needed"""
+        order = self._shuffle
+        position = order.position + step
+        while position >= 0:
+            if position >= order.drawn and not order.draw():
+                break
+            node = order.slots[position]
+            if self._alive(node):
+                order.position = position
+                self.current = node
+                break
+            position += step
+        return self.get_current_song()
+
+    def _smart_step(self, step):
+        """Go back or forward through the smart shuffle history, picking a new song past its end"""
+        smart = self._smart
+        history = smart.history
+        while step < 0 and smart.back < len(history) - 1 or step > 0 and smart.back > 0:
+            smart.back -= step
+            node = history[-1 - smart.back]
+            if self._alive(node):
+                self.current = node
+                return self.get_current_song()
+        if step > 0:
+            if smart.stale():
+                smart.build(self._nodes())
+            node = smart.pick(self._alive, self.size, to_timestamp(datetime.now()))
+            if node:
+                history.append(node)
+                self.current = node
+        return self.get_current_song()
+
+    def _nodes(self):
+        nodes = []
+        curr = self.head
+        while curr:
+            nodes.append(curr)
+            curr = curr.next
+        return nodes
+
+    def _alive(self, node):
+        return self._index.get(node.song.key) is node
+
+    def set_shuffle(self, enabled, seed=None, position=-1, window=None):
+        """Turn shuffle mode on or off; the stored order is never touched.
+
+        Turning it on starts a random order from seed (a new one if not
+        given) and draws up to position, so the seed and position from
+        shuffle_state resume the same order over the same songs; when that
+        order is already running only the cursor moves. O(1) in the
+        playlist size, except that a shuffle started after songs were
+        removed or reordered first realigns the slots in one O(n) pass.
+
+        With a window, smart shuffle is turned on instead: weighted picks
+        (see SmartShuffle) that skip the last window songs picked. Its
+        alias table takes one O(n) pass to build.
+        """
+        if self._smart and (not enabled or window is None):
+            self._smart = None
+        order = self._shuffle
+        if order and (not enabled or window is not None or seed is None or order.seed != seed):
+            if not order.undo():
+                self._slots_ordered = False
+            order = self._shuffle = None
+        if not enabled:
+            return
+        if window is not None:
+            if self._smart:
+                self._smart.window = window
+                return
+            self._smart = SmartShuffle(self._nodes(), window)
+            if self.current:
+                self._smart.history.append(self.current)
+                self._smart.remember(self.current.song.key)
+            return
+        if order is None:
+            if not self._slots_ordered or self._dead:
+                self._realign_slots()
+            order = self._shuffle = ShuffleOrder(self._slots, random.getrandbits(32) if seed is None else seed)
+        while order.drawn <= position and order.draw():
+            pass
+        order.position = min(position, order.drawn - 1)
+        if order.position >= 0 and self._alive(order.slots[order.position]):
+            self.current = order.slots[order.position]
+
+    def shuffle_state(self):
+        """{'seed', 'position'} of shuffle mode, {'window'} of smart shuffle, or None when both are off"""
+        if self._smart:
+            return {"window": self._smart.window}
+        if not self._shuffle:
+            return None
+        return {"seed": self._shuffle.seed, "position": self._shuffle.position}
+
+    def _realign_slots(self):
+        """Rebuild the slots from the list, in playlist order"""
+        self._slots[:] = self._nodes()
+        self._dead = 0
+        self._slots_ordered = True
+
+    def _compact_slots(self):
+        if self._shuffle:
+            self._shuffle.compact(self._alive)
+            self._dead = 0
+        else:
+            self._realign_slots()
+
+    def iter_songs(self, start=0, limit=None, after_id=None):
+        """Lazily yield songs in playlist order.
+
+        Starts at position start, or just after the song with after_id when
+        given (nothing is yielded if that song is not in the playlist), and
+        stops after limit songs.
+        """
+        if after_id is not None:
+            node = self._find_node(after_id)
+            current = node.next if node else None
+        elif start <= 0:
+            current = self.head
+        else:
+            current = self._node_at(start) if start < self.size else None
+
+        remaining = self.size if limit is None else limit
+        while current and remaining > 0:
+            yield current.song
             current = current.next
-        return songs
+            remaining -= 1
+
+    def iter_dicts(self, start=0, limit=None, after_id=None):
+        """Like iter_songs, but serializing each song with to_dict as it goes"""
+        for song in self.iter_songs(start, limit, after_id):
+            yield song.to_dict()
+
+    def get_all_songs(self):
+        return list(self.iter_dicts())
 
     def get_favorites(self):
-        favorites = []
-        current = self.head
-        while current:
-            if current.song.is_favorite:
-                favorites.append(current.song.to_dict())
-            current = current.next
-        return favorites
+        """Favorite songs in the order they were marked, from the index in O(k)"""
+        return [song.to_dict() for song in self._favorites.values()]
 
     def toggle_favorite(self, song_id):
-        current = self.head
-        while current:
-            if current.song.id == song_id:
-                current.song.is_favorite = not current.song.is_favorite
-                return True
-            current = current.next
-        return False
+        node = self._find_node(song_id)
+        if not node:
+            return False
+        node.song.is_favorite = not node.song.is_favorite
+        self._index_song(node.song)
+        if self._smart:
+            self._smart.update(node)
+        self._changed("update", node.song)
+        return True
 
     def mark_as_played(self, song_id):
         """Mark a song as played and update play count"""
-        current = self.head
-        while current:
-            if current.song.id == song_id:
-                current.song.last_played = datetime.now()
-                current.song.play_count += 1
-                return True
-            current = current.next
-        return False
+        node = self._find_node(song_id)
+        if not node:
+            return False
+        node.song.last_played_ts = to_timestamp(datetime.now())
+        node.song.play_count += 1
+        self._recent.add(node.song)
+        self._changed("update", node.song)
+        return True
 
     def get_recently_played(self, limit=20):
-        """Get recently played songs sorted by last played time"""
-        recent = []
-        current = self.head
-        while current:
-            if current.song.last_played:
-                recent.append(current.song)
-            current = current.next
-        
-        # Sort by last_played descending (most recent first)
-        recent.sort(key=lambda s: s.last_played, reverse=True)
-        
-        # Return limited results
-        return [song.to_dict() for song in recent[:limit]]
+        """Get recently played songs, most recent first, in O(limit)"""
+        return [song.to_dict() for song in self._recent.newest(limit)]
 
     def shuffle(self):
-        # Convert to list, shuffle, rebuild DLL
+        # Convert to list, shuffle, relink DLL
         if self.size < 2:
             return
 
-        songs = []
+        nodes = []
         current = self.head
         while current:
-            songs.append(current.song)
+            nodes.append(current)
             current = current.next
         
-        random.shuffle(songs)
-        
-        # Rebuild
-        self.head = None
-        self.tail = None
-        self.current = None
-        self.size = 0
-        
-        for song in songs:
-            self.add_song(song)
-        
-        # Reset current to head
-        self.current = self.head
+        random.shuffle(nodes)
+        self._relink(nodes)
 
     def move_song(self, song_id, new_position):
         # Find the node
-        target = None
-        current = self.head
-        while current:
-            if current.song.id == song_id:
-                target = current
-                break
-            current = current.next
-        
+        target = self._find_node(song_id)
         if not target:
             return False
             
-        # Remove from current position
-        if target.prev:
-            target.prev.next = target.next
-        else:
-            self.head = target.next
-            
-        if target.next:
-            target.next.prev = target.prev
-        else:
-            self.tail = target.prev
-            
-        self.size -= 1
-        
-        # Re-insert at new position
-        # This is a simplified insertion, 0-indexed
-        if new_position <= 0:
-            # Insert at head
-            target.next = self.head
-            target.prev = None
-            if self.head:
-                self.head.prev = target
-            self.head = target
-            if not self.tail:
-                self.tail = target
-        elif new_position >= self.size:
-            # Insert at tail
-            target.next = None
-            target.prev = self.tail
-            if self.tail:
-                self.tail.next = target
-            self.tail = target
-            if not self.head:
-                self.head = target
-        else:
-            # Insert in middle
-            curr = self.head
-            for _ in range(new_position - 1):
-                curr = curr.next
-            
-            target.next = curr.next
-            target.prev = curr
-            if curr.next:
-                curr.next.prev = target
-            curr.next = target
-            
-        self.size += 1
+        # Remove from current position and re-insert, 0-indexed
+        self._unlink(target)
+        position = self._link_at(target, new_position)
+        self._slots_ordered = False
+        self._changed("move", target.song, position)
         return True
 
-    def sort_by_title(self):
+    def move(self, from_position, to_position):
+        """Move the song at from_position so that it ends up at to_position"""
+        song = self.get_at(from_position)
+        if not song:
+            return False
+        return self.move_song(song.id, to_position)
+
+    def sort(self, keys):
+        """Sort by a list of (field, ASC/DESC) pairs, most significant first.
+
+        Raises ValueError for an unknown field or direction.
+        """
+        for field, direction in keys:
+            if field not in SORT_KEYS:
+                raise ValueError(f"Unknown sort field: {field}")
+            if direction not in (ASC, DESC):
+                raise ValueError(f"Unknown sort direction: {direction}")
         if self.size < 2: return
-        self.head = self._merge_sort(self.head, lambda s: s.title.lower())
-        self._rebuild_links()
+
+        nodes = []
+        curr = self.head
+        while curr:
+            nodes.append(curr)
+            curr = curr.next
+
+        # One stable Timsort pass per key, least significant first; each pass
+        # computes its key once per song instead of once per comparison
+        for field, direction in reversed(keys):
+            key_func = SORT_KEYS[field]
+            nodes.sort(key=lambda node: key_func(node.song), reverse=direction == DESC)
+        self._relink(nodes)
+
+    def sort_by_title(self):
+        self.sort([("title", ASC)])
 
     def sort_by_date(self):
-        if self.size < 2: return
         # Sort by added_at descending (newest first)
-        self.head = self._merge_sort(self.head, lambda s: s.added_at, reverse=True)
-        self._rebuild_links()
+        self.sort([("added_at", DESC)])
 
-    def _merge_sort(self, head, key_func, reverse=False):
-        if not head or not head.next:
-            return head
-        
-        second = self._split(head)
-        
-        head = self._merge_sort(head, key_func, reverse)
-        second = self._merge_sort(second, key_func, reverse)
-        
-        return self._merge(head, second, key_func, reverse)
-
-    def _split(self, head):
-        fast = head
-        slow = head
-        while fast.next and fast.next.next:
-            fast = fast.next.next
-            slow = slow.next
-        
-        temp = slow.next
-        slow.next = None
-        if temp:
-            temp.prev = None
-        return temp
-
-    def _merge(self, first, second, key_func, reverse):
-        if not first: return second
-        if not second: return first
-        
-        val1 = key_func(first.song)
-        val2 = key_func(second.song)
-        
-        condition = (val1 > val2) if reverse else (val1 < val2)
-        
-        if condition:
-            first.next = self._merge(first.next, second, key_func, reverse)
-            if first.next: first.next.prev = first
-            first.prev = None
-            return first
-        else:
-            second.next = self._merge(first, second.next, key_func, reverse)
-            if second.next: second.next.prev = second
-            second.prev = None
-            return second
+    def set_songs(self, songs):
+        """Make the playlist hold exactly songs, in that order.
+
+        Goes through remove_song, add_song and one relink, so the version
+        and change log describe only the difference. The current song
+        stays current if it is kept.
+        """
+        keys = {song.key for song in songs}
+        for song in [node.song for node in self._index.values() if node.song.key not in keys]:
+            self.remove_song(song.id)
+        for song in songs:
+            if song.key not in self._index:
+                self.add_song(song)
+        if list(self.iter_songs()) != list(songs):
+            current = self.current
+            self._relink([self._index[song.key] for song in songs])
+            self.current = current
+
+    def _relink(self, nodes):
+        """Rethread the list through nodes in the given order"""
+        for node, following in zip(nodes, nodes[1:]):
+            node.next = following
+        nodes[-1].next = None
+        self.head = nodes[0]
+        self._rebuild_links()
+        self._slots_ordered = False
+        self._changed("order")
 
     def _rebuild_links(self):
-        # Rebuild prev pointers and tail after merge sort
+        # Rebuild prev pointers and tail after relinking next pointers
         curr = self.head
         prev = None
         self.size = 0
@@ -304,3 +887,175 @@ class Playlist:
         self.tail = prev
         # Reset current to head if it's lost or just to be safe
         self.current = self.head
+
+
+class TreapNode:
+    __slots__ = ("item", "priority", "size", "left", "right", "parent")
+
+    def __init__(self, item):
+        self.item = item
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+
+class OrderStatisticTree:
+    """Implicit treap: a sequence with O(log n) positional insert, remove, lookup and rank"""
+
+    def __init__(self):
+        self.root = None
+
+    def __len__(self):
+        return self.root.size if self.root else 0
+
+    @staticmethod
+    def _size(t):
+        return t.size if t else 0
+
+    def _update(self, t):
+        t.size = 1 + self._size(t.left) + self._size(t.right)
+
+    def _split(self, t, k):
+        """Split t into (first k items, the rest)"""
+        if not t:
+            return None, None
+        if self._size(t.left) >= k:
+            left, right = self._split(t.left, k)
+            t.left = right
+            if right: right.parent = t
+            if left: left.parent = None
+            t.parent = None
+            self._update(t)
+            return left, t
+        else:
+            left, right = self._split(t.right, k - self._size(t.left) - 1)
+            t.right = left
+            if left: left.parent = t
+            if right: right.parent = None
+            t.parent = None
+            self._update(t)
+            return t, right
+
+    def _merge(self, a, b):
+        """Concatenate two treaps where every item of a precedes every item of b"""
+        if not a: return b
+        if not b: return a
+        if a.priority > b.priority:
+            a.right = self._merge(a.right, b)
+            a.right.parent = a
+            self._update(a)
+            return a
+        else:
+            b.left = self._merge(a, b.left)
+            b.left.parent = b
+            self._update(b)
+            return b
+
+    def build(self, items):
+        """Replace the contents with items in O(n) and return their tree nodes in order"""
+        handles = [TreapNode(item) for item in items]
+        # Cartesian tree construction over random priorities using a right spine stack
+        stack = []
+        for t in handles:
+            last = None
+            while stack and stack[-1].priority < t.priority:
+                last = stack.pop()
+            t.left = last
+            if last: last.parent = t
+            if stack:
+                stack[-1].right = t
+                t.parent = stack[-1]
+            stack.append(t)
+        self.root = stack[0] if stack else None
+        if self.root:
+            self.root.parent = None
+        # Sizes bottom-up: children always appear before parents in post-order
+        order = []
+        pending = [self.root] if self.root else []
+        while pending:
+            t = pending.pop()
+            order.append(t)
+            if t.left: pending.append(t.left)
+            if t.right: pending.append(t.right)
+        for t in reversed(order):
+            self._update(t)
+        return handles
+
+    def insert_at(self, position, item):
+        """Insert item so that it ends up at position and return its tree node"""
+        handle = TreapNode(item)
+        left, right = self._split(self.root, position)
+        self.root = self._merge(self._merge(left, handle), right)
+        self.root.parent = None
+        return handle
+
+    def remove(self, handle):
+        """Remove the item held by a tree node returned from insert_at or build"""
+        left, right = self._split(self.root, self.rank(handle))
+        _, right = self._split(right, 1)
+        self.root = self._merge(left, right)
+        if self.root:
+            self.root.parent = None
+
+    def get_at(self, position):
+        t = self.root
+        while t:
+            left_size = self._size(t.left)
+            if position < left_size:
+                t = t.left
+            elif position == left_size:
+                return t.item
+            else:
+                position -= left_size + 1
+                t = t.right
+        return None
+
+    def rank(self, handle):
+        """Return the 0-indexed position of a tree node by walking up to the root"""
+        position = self._size(handle.left)
+        t = handle
+        while t.parent:
+            if t is t.parent.right:
+                position += self._size(t.parent.left) + 1
+            t = t.parent
+        return position
+
+
+class IndexedPlaylist(Playlist):
+    """Playlist backed by an order-statistic tree for O(log n) positional access.
+
+    The doubly linked list is kept intact, so next_song/prev_song and the
+    current cursor behave exactly as in Playlist.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._tree = OrderStatisticTree()
+        # Node -> TreapNode, used to find a node's rank
+        self._handles = {}
+
+    def _node_at(self, position):
+        return self._tree.get_at(position)
+
+    def _position_of(self, node):
+        return self._tree.rank(self._handles[node])
+
+    def _link_at(self, node, position):
+        position = super()._link_at(node, position)
+        self._handles[node] = self._tree.insert_at(position, node)
+        return position
+
+    def _unlink(self, node):
+        self._tree.remove(self._handles.pop(node))
+        super()._unlink(node)
+
+    def _rebuild_links(self):
+        super()._rebuild_links()
+        nodes = []
+        curr = self.head
+        while curr:
+            nodes.append(curr)
+            curr = curr.next
+        self._handles = dict(zip(nodes, self._tree.build(nodes)))
@@ -1,19 +1,109 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from adt import Playlist, Song
+from flask import (Flask, Request, Response, render_template, request, jsonify, redirect, send_from_directory,
+                   stream_with_context, url_for)
+from adt import Playlist, IndexedPlaylist, RecencyIndex, Song, song_key
+from storage import REGISTRY, SONGS, BackgroundWriter, JsonStore, SqliteStore
+from cache import ResponseCache
+from events import EventBroker
+from search import SearchIndex
+from importer import ImportJob, scan_directory, song_tags
+from metadata import MetadataCache, MetadataWorker
+from content_store import ContentStore
+from locks import LockSet, RWLock, file_lock
+import atexit
+import base64
 import os
 import json
+import locale
+import signal
+import sys
+import threading
+import time
 from werkzeug.utils import secure_filename
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3NoHeaderError
 from datetime import datetime
 import uuid
 
 
+# Sort titles and artists by the system locale's collation (from LC_ALL,
+# LC_COLLATE or LANG); Python otherwise stays in the "C" locale
+try:
+    locale.setlocale(locale.LC_COLLATE, '')
+except locale.Error:
+    # The named locale is not installed; keep code point order
+    pass
+
+class AppRequest(Request):
+    @property
+    def max_content_length(self):
+        """Bulk imports carry many files, so they get a larger limit; each file still gets MAX_CONTENT_LENGTH"""
+        if self.endpoint == 'import_files':
+            return app.config['MAX_IMPORT_LENGTH']
+        return super().max_content_length
+
 app = Flask(__name__)
+app.request_class = AppRequest
 app.config['UPLOAD_FOLDER'] = 'static/music'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max limit
+app.config['MAX_IMPORT_LENGTH'] = 1024 * 1024 * 1024  # Whole /api/import request
+# Use the order-statistic tree backend for O(log n) reordering of large playlists
+app.config['INDEXED_PLAYLISTS'] = False
+# Songs smart shuffle waits before picking one again, unless a request sets its own window
+app.config['SMART_SHUFFLE_WINDOW'] = 20
+# 'json' (snapshot + operation log) or 'sqlite'
+app.config['STORAGE_BACKEND'] = 'json'
 PLAYLISTS_FILE = 'playlists_data.json'
+SQLITE_FILE = 'playlists.db'
+# Single-song mutations are logged; the full snapshot is rewritten every N of them
+COMPACT_EVERY = 1000
+# 'sync' writes every mutation before responding; 'debounced' batches writes
+# in a background thread at most once per FLUSH_INTERVAL seconds
+app.config['DURABILITY'] = 'debounced'
+app.config['FLUSH_INTERVAL'] = 1.0
+# Set MULTI_WORKER=1 in the environment of every worker process (e.g. under
+# gunicorn -w N) to share one SQLite store between them. Writes land before
+# responding and bump per-playlist version stamps; each worker replays the
+# operations it missed, or reloads only the playlists others rewrote, checking
+# before every request and every SYNC_INTERVAL seconds while idle
+app.config['MULTI_WORKER'] = os.environ.get('MULTI_WORKER') == '1'
+if app.config['MULTI_WORKER']:
+    app.config['STORAGE_BACKEND'] = 'sqlite'
+    app.config['DURABILITY'] = 'sync'
+SYNC_INTERVAL = 0.5
+# Held by a worker while it loads or migrates the store at startup
+STARTUP_LOCK_FILE = 'playlists.lock'
+# Bulk imports read tags in this many worker processes (None: one per CPU);
+# set IMPORT_PROCESSES to False to use threads instead
+app.config['IMPORT_WORKERS'] = None
+app.config['IMPORT_PROCESSES'] = True
+# Also match metadata cache misses by a SHA-256 of the file, so renamed or
+# re-uploaded copies are not parsed again (costs a full read of each miss)
+app.config['METADATA_HASH'] = False
+METADATA_CACHE_FILE = 'metadata_cache.json'
+# Hash -> file index of stored audio, used to store identical uploads once
+CONTENT_INDEX_FILE = 'content_index.json'
+# Behind a server that honours X-Sendfile (Apache mod_xsendfile, nginx via
+# X-Accel-Redirect rewriting), let it send /api/stream bodies itself. Otherwise
+# full responses go through the WSGI server's file_wrapper, which servers
+# like gunicorn implement with sendfile()
+app.config['USE_X_SENDFILE'] = False
+# Seconds browsers may keep versioned /api/stream responses without revalidating
+STREAM_MAX_AGE = 365 * 24 * 3600
+
+# Largest page /api/playlist returns when a limit is requested
+MAX_PAGE_SIZE = 1000
+# Songs serialized per chunk of a streamed response
+STREAM_CHUNK = 500
+# Fields of Song.to_dict that ?fields= may select
+SONG_FIELDS = ('id', 'title', 'artist', 'file_path', 'added_at', 'is_favorite', 'last_played', 'play_count',
+               'duration')
+# Upper bound on the serialized responses kept for conditional GETs
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+# Events an /api/events client may fall behind before it is told to resync
+EVENT_QUEUE_SIZE = 100
+# Seconds between keepalive comments on idle event streams
+EVENT_KEEPALIVE = 15
+
+# Finished import jobs kept for /api/import/<job_id>
+IMPORT_JOBS_KEPT = 100
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -21,63 +111,332 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 # Global playlists storage
 playlists = {}
 current_playlist_id = None
+# Shared song catalog (song_key(id) -> Song); playlists hold references into it
+song_catalog = {}
+# Catalog songs by last play, across all playlists
+recently_played = RecencyIndex()
+# Title/artist index over the catalog
+search_index = SearchIndex()
+# Bulk import jobs by id, oldest first
+import_jobs = {}
+import_jobs_lock = threading.Lock()
+# Multi-worker mode: how this worker caught up with other workers' changes
+shared_stats = {'syncs': 0, 'ops_replayed': 0, 'playlists_reloaded': 0, 'songs_reloaded': 0}
+# Bumped when playlists are created, deleted, renamed or switched; together
+# with each Playlist.version it identifies every state the API can serve
+registry_version = 0
+# Versions restart with the process; this tells clients which run they came from
+INSTANCE_EPOCH = uuid.uuid4().hex[:8]
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+broker = EventBroker(EVENT_QUEUE_SIZE)
+# Lock order, always: registry_lock, then playlist locks by playlist id, then
+# catalog_lock. The registry lock guards the playlists dict, playlist names,
+# current_playlist_id and registry_version; each playlist's 'lock' guards the
+# Playlist; catalog_lock guards song_catalog, search_index, recently_played
+# and content references. Song fields shared across playlists (favorite,
+# plays, duration) change only under every playlist's write lock.
+registry_lock = RWLock()
+catalog_lock = RWLock()
 
-def save_playlists():
-    """Save all playlists to JSON file"""
-    playlists_data = {}
-    for playlist_id, playlist_info in playlists.items():
-        songs_data = []
-        for song_dict in playlist_info['playlist'].get_all_songs():
-            songs_data.append(song_dict)
+def create_store():
+    """Open the configured storage backend"""
+    if app.config['STORAGE_BACKEND'] == 'sqlite':
+        return SqliteStore(SQLITE_FILE)
+    return JsonStore(PLAYLISTS_FILE, compact_every=COMPACT_EVERY)
+
+store = create_store()
+# SQLite applies each write in place, so saves rewrite only the playlists they name
+WRITES_IN_PLACE = isinstance(store, SqliteStore)
+# Tags and audio properties by file, shared by every playlist and import
+metadata_cache = MetadataCache(METADATA_CACHE_FILE, hash_content=app.config['METADATA_HASH'],
+                               shared=app.config['MULTI_WORKER'])
+# Uploaded files, deduplicated by content; song file_paths are relative to its root
+content_store = ContentStore(os.path.dirname(app.config['UPLOAD_FOLDER']),
+                             os.path.basename(app.config['UPLOAD_FOLDER']), CONTENT_INDEX_FILE,
+                             # Other workers' songs may use a file this one no longer does
+                             delete_unused=not app.config['MULTI_WORKER'],
+                             # Every worker then sees the same hashes, and so the same stream URLs
+                             shared=app.config['MULTI_WORKER'])
+writer = BackgroundWriter(store, interval=app.config['FLUSH_INTERVAL'],
+                          sync=app.config['DURABILITY'] == 'sync')
+
+def new_playlist():
+    """Create an empty playlist using the configured backend"""
+    if app.config['INDEXED_PLAYLISTS']:
+        return IndexedPlaylist()
+    return Playlist()
+
+def register_song(song):
+    """Add a new song to the catalog and its indexes"""
+    with catalog_lock.writing():
+        song_catalog[song.key] = song
+        search_index.add(song)
+        content_store.retain(song.file_path)
+
+def catalog_song(song_data):
+    """Return the catalog song for a song dict, registering it if it is new"""
+    song = song_catalog.get(song_key(song_data['id']))
+    if not song:
+        song = Song.from_dict(song_data)
+        register_song(song)
+    elif song_data.get('play_count', 0) > song.play_count:
+        # Older data kept a diverging copy per playlist; keep the most played one's stats
+        song.play_count = song_data['play_count']
+        if song_data.get('last_played'):
+            song.last_played = datetime.fromisoformat(song_data['last_played'])
+        touch_song(song.id, None)
+    return song
+
+def release_songs(song_ids):
+    """Drop songs from the catalog once no playlist references them.
+
+    Runs under the catalog lock, as does sharing a catalog song with
+    another playlist, so a song cannot be dropped while being shared.
+    Other playlists are checked without their locks; each check is a
+    single dict lookup.
+    """
+    with catalog_lock.writing():
+        for song_id in song_ids:
+            if not any(info['playlist'].get_song(song_id) for info in list(playlists.values())):
+                song = song_catalog.pop(song_key(song_id), None)
+                if song:
+                    recently_played.discard(song)
+                    search_index.remove(song)
+                    content_store.release(song.file_path)
+
+def static_path(file_path):
+    """Filesystem path of a song file_path, which is relative to the static folder.
+
+    Used wherever a file is looked up in the metadata cache, so each file
+    has one key whichever way it was added.
+    """
+    return os.path.join(os.path.dirname(app.config['UPLOAD_FOLDER']), file_path)
+
+def apply_durations(results):
+    """Fill in durations the metadata worker read, (song key, metadata) pairs"""
+    changed = False
+    with lock_songs():
+        for key, meta in results:
+            song = song_catalog.get(key)
+            if song and song.duration is None and meta['duration'] is not None:
+                song.duration = meta['duration']
+                touch_song(song.id, None)
+                changed = True
+                if WRITES_IN_PLACE:
+                    # Cheaper than a snapshot, which would also rewrite playlists other workers may be changing
+                    writer.record({'op': 'duration', 'playlist_id': None, 'song_id': song.id,
+                                   'duration': song.duration})
+    if changed and not WRITES_IN_PLACE:
+        # One snapshot per batch
+        save_playlists()
+
+metadata_worker = MetadataWorker(metadata_cache, apply_durations)
+
+def current_ids():
+    return [current_playlist_id]
+
+def lock_playlists(playlist_ids=None, write=False, registry_write=False):
+    """Lock the registry, then playlists in id order; returns the LockSet to release.
+
+    playlist_ids is a list, a callable evaluated once the registry is
+    locked (e.g. current_ids), or None for every playlist. Ids not in the
+    registry are skipped.
+    """
+    held = LockSet()
+    if registry_write:
+        held.write(registry_lock)
+    else:
+        held.read(registry_lock)
+    try:
+        if playlist_ids is None:
+            playlist_ids = list(playlists)
+        elif callable(playlist_ids):
+            playlist_ids = playlist_ids()
+        for playlist_id in sorted(set(playlist_ids) & playlists.keys()):
+            if write:
+                held.write(playlists[playlist_id]['lock'])
+            else:
+                held.read(playlists[playlist_id]['lock'])
+    except BaseException:
+        held.release()
+        raise
+    return held
+
+def lock_songs():
+    """Locks for changing song fields, which every playlist holding the song indexes"""
+    return lock_playlists(write=True).write(catalog_lock)
+
+def lock_stats():
+    """How often each kind of lock made a request wait"""
+    return {"registry_contended": registry_lock.contended, "catalog_contended": catalog_lock.contended,
+            "playlist_contended": sum(info['lock'].contended for info in list(playlists.values()))}
+
+def bump_registry():
+    global registry_version
+    registry_version += 1
+
+def touch_song(song_id, playlist):
+    """Reindex and bump every other playlist sharing a song changed through playlist (None: changed directly)"""
+    for info in playlists.values():
+        song = info['playlist'].get_song(song_id)
+        if song and info['playlist'] is not playlist:
+            info['playlist'].touch(song)
+
+def publish_change(playlist_id=None):
+    """Tell event subscribers that a playlist, or the playlist list, changed"""
+    if playlist_id in playlists:
+        broker.publish('playlist', {'playlist_id': playlist_id,
+                                    'version': f"{INSTANCE_EPOCH}:{playlists[playlist_id]['playlist'].version}"})
+    else:
+        broker.publish('playlists', {'current_playlist_id': current_playlist_id})
+
+def save_playlists(notify=True, playlist_ids=None):
+    """Write a full snapshot of all playlists to the store, storing each song once.
+
+    Every playlist stays read-locked until the snapshot is queued, so no
+    operation can be logged between building it and queuing it (the
+    snapshot supersedes operations queued before it). Callers must hold
+    no playlist lock, or all of them: taking the rest while holding some
+    would break the lock order.
+
+    playlist_ids names the playlists a change created, changed or
+    deleted. With SQLite only those are rewritten, which also keeps other
+    workers' changes to the rest in multi-worker mode.
+    """
+    scoped = playlist_ids is not None and WRITES_IN_PLACE
+    with lock_playlists(), catalog_lock.reading():
+        playlists_data = {}
+        for playlist_id, playlist_info in playlists.items():
+            if scoped and playlist_id not in playlist_ids:
+                continue
+            playlists_data[playlist_id] = {
+                'name': playlist_info['name'],
+                'description': playlist_info['description'],
+                'created_at': playlist_info['created_at'],
+                'song_ids': [song.id for song in playlist_info['playlist'].iter_songs()],
+                'shuffle': playlist_info['playlist'].shuffle_state()
+            }
         
-        playlists_data[playlist_id] = {
-            'name': playlist_info['name'],
-            'description': playlist_info['description'],
-            'created_at': playlist_info['created_at'],
-            'songs': songs_data
-        }
+        if scoped:
+            songs = {song.key: song for playlist_id in playlists_data
+                     for song in playlists[playlist_id]['playlist'].iter_songs()}
+            writer.record({
+                'op': 'replace',
+                'playlists': playlists_data,
+                'deleted': [playlist_id for playlist_id in playlist_ids if playlist_id not in playlists],
+                'songs': [song.to_dict() for song in songs.values()],
+                'current_playlist_id': current_playlist_id
+            })
+        else:
+            data = {
+                'songs': [song.to_dict() for song in song_catalog.values()],
+                'playlists': playlists_data,
+                'current_playlist_id': current_playlist_id
+            }
+            writer.snapshot(data)
+    if notify:
+        publish_change()
+
+def record_operation(op_type, **fields):
+    """Persist a single-song mutation through the store; call with the playlist still write-locked
+    so operations are logged in the order they were applied"""
+    writer.record(dict(fields, op=op_type))
+    publish_change(None if op_type == 'switch' else fields['playlist_id'])
+
+def record_shuffle(playlist_id, playlist):
+    """Persist a playlist's shuffle seed and position; its songs did not change, so nobody is notified"""
+    state = playlist.shuffle_state() or {'seed': None, 'position': -1}
+    writer.record(dict(state, op='shuffle', playlist_id=playlist_id))
+
+def apply_operation(op):
+    """Replay one logged operation against the in-memory playlists"""
+    global current_playlist_id
     
-    data = {
-        'playlists': playlists_data,
-        'current_playlist_id': current_playlist_id
-    }
+    if op['op'] == 'switch':
+        current_playlist_id = op['playlist_id']
+        return
+    
+    if op['op'] in ('favorite', 'played', 'duration'):
+        song = song_catalog.get(song_key(op['song_id']))
+        if song:
+            if op['op'] == 'favorite':
+                song.is_favorite = op['is_favorite']
+            elif op['op'] == 'duration':
+                song.duration = op['duration']
+            else:
+                song.play_count = op['play_count']
+                song.last_played = datetime.fromisoformat(op['last_played'])
+            touch_song(op['song_id'], None)
+        return
+    
+    if op['playlist_id'] not in playlists:
+        return
+    playlist = playlists[op['playlist_id']]['playlist']
     
-    with open(PLAYLISTS_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    if op['op'] == 'add':
+        if playlist.get_song(op['song']['id']):
+            # Added by two workers at once: the SQLite store moves the entry to the end
+            playlist.move_song(op['song']['id'], playlist.size)
+        else:
+            playlist.add_song(catalog_song(op['song']))
+    elif op['op'] == 'remove':
+        playlist.remove_song(op['song_id'])
+        release_songs([op['song_id']])
+    elif op['op'] == 'move':
+        playlist.move_song(op['song_id'], op['position'])
+    elif op['op'] == 'shuffle':
+        window = op.get('window')
+        playlist.set_shuffle(op.get('seed') is not None or window is not None, op.get('seed'), op.get('position', -1),
+                             window)
 
-def load_playlists():
-    """Load all playlists from JSON file"""
+def populate_playlists(data, ops):
+    """Build the in-memory playlists from snapshot data and replay operations on top"""
     global current_playlist_id
     
-    if os.path.exists(PLAYLISTS_FILE):
-        try:
-            with open(PLAYLISTS_FILE, 'r') as f:
-                data = json.load(f)
-            
-            playlists_data = data.get('playlists', {})
-            current_playlist_id = data.get('current_playlist_id')
+    if data:
+        playlists_data = data.get('playlists', {})
+        current_playlist_id = data.get('current_playlist_id')
+        
+        for song_data in data.get('songs', []):
+            catalog_song(song_data)
+        
+        for playlist_id, playlist_data in playlists_data.items():
+            playlist = new_playlist()
             
-            for playlist_id, playlist_data in playlists_data.items():
-                playlist = Playlist()
-                
+            if 'song_ids' in playlist_data:
+                for song_id in playlist_data['song_ids']:
+                    playlist.add_song(song_catalog[song_key(song_id)])
+            else:
+                # Older snapshots embed a full copy of every song per playlist
                 for song_data in playlist_data.get('songs', []):
-                    song = Song(song_data['title'], song_data['artist'], song_data['file_path'])
-                    song.id = song_data['id']
-                    song.added_at = datetime.fromisoformat(song_data['added_at'])
-                    song.is_favorite = song_data.get('is_favorite', False)
-                    song.play_count = song_data.get('play_count', 0)
-                    if song_data.get('last_played'):
-                        song.last_played = datetime.fromisoformat(song_data['last_played'])
-                    playlist.add_song(song)
-                
-                playlists[playlist_id] = {
-                    'name': playlist_data['name'],
-                    'description': playlist_data['description'],
-                    'created_at': playlist_data['created_at'],
-                    'playlist': playlist
-                }
-        except Exception as e:
-            print(f"Error loading playlists: {e}")
+                    playlist.add_song(catalog_song(song_data))
+            if playlist_data.get('shuffle'):
+                playlist.set_shuffle(True, **playlist_data['shuffle'])
+            
+            playlists[playlist_id] = {
+                'name': playlist_data['name'],
+                'description': playlist_data['description'],
+                'created_at': playlist_data['created_at'],
+                'playlist': playlist,
+                'lock': RWLock()
+            }
+    
+    for op in ops:
+        apply_operation(op)
+
+def load_playlists():
+    """Load all playlists from the store and replay any logged operations"""
+    try:
+        data, ops = store.load()
+        populate_playlists(data, ops)
+        if ops:
+            # Fold the replayed log into a fresh snapshot
+            save_playlists()
+    except Exception as e:
+        print(f"Error loading playlists: {e}")
+    
+    # Move existing JSON data into a new SQLite database
+    migrate_json_to_sqlite()
     
     # Create default playlist if none exist
     if not playlists:
@@ -85,6 +444,29 @@ def load_playlists():
     
     # Migrate old playlist data if it exists
     migrate_old_playlist_data()
+    
+    for song in song_catalog.values():
+        recently_played.add(song)
+
+def migrate_json_to_sqlite():
+    """Copy playlists_data.json and its operation log into an empty SQLite store"""
+    if not isinstance(store, SqliteStore) or playlists or not os.path.exists(PLAYLISTS_FILE):
+        return
+    
+    try:
+        json_store = JsonStore(PLAYLISTS_FILE)
+        data, ops = json_store.load()
+        populate_playlists(data, ops)
+        save_playlists()
+        writer.flush()
+        
+        # Rename the JSON files to prevent re-migration
+        for path in (PLAYLISTS_FILE, json_store.log_path):
+            if os.path.exists(path):
+                os.rename(path, f"{path}.migrated")
+        print(f"Migrated {len(playlists)} playlists to {SQLITE_FILE}")
+    except Exception as e:
+        print(f"Error migrating playlists to SQLite: {e}")
 
 def migrate_old_playlist_data():
     """Migrate songs from old playlist_data.json to Library playlist"""
@@ -111,20 +493,14 @@ def migrate_old_playlist_data():
                 library_playlist = playlists[library_playlist_id]['playlist']
                 
                 for song_data in old_songs_data:
-                    song = Song(song_data['title'], song_data['artist'], song_data['file_path'])
-                    song.id = song_data['id']
-                    song.added_at = datetime.fromisoformat(song_data['added_at'])
-                    song.is_favorite = song_data.get('is_favorite', False)
-                    song.play_count = song_data.get('play_count', 0)
-                    if song_data.get('last_played'):
-                        song.last_played = datetime.fromisoformat(song_data['last_played'])
-                    library_playlist.add_song(song)
+                    library_playlist.add_song(catalog_song(song_data))
                 
                 # Set Library as current playlist
                 current_playlist_id = library_playlist_id
                 
                 # Save the migrated data
                 save_playlists()
+                writer.flush()
                 
                 # Rename old file to prevent re-migration
                 os.rename(old_playlist_file, f"{old_playlist_file}.migrated")
@@ -144,7 +520,8 @@ def create_default_playlist():
         'name': 'Library',
         'description': 'Your main music library',
         'created_at': datetime.now().isoformat(),
-        'playlist': Playlist()
+        'playlist': new_playlist(),
+        'lock': RWLock()
     }
     save_playlists()
 
@@ -154,16 +531,291 @@ def get_current_playlist():
         return playlists[current_playlist_id]['playlist']
     return None
 
-# Load existing playlists on startup
-load_playlists()
+def encode_cursor(song_id):
+    return base64.urlsafe_b64encode(song_id.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return the song id a cursor points after, or None if it is malformed"""
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def stream_json_array(items, prefix='[', suffix=']'):
+    """Yield a JSON array in chunks without materializing the whole list"""
+    yield prefix
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(json.dumps(item))
+        if len(chunk) >= STREAM_CHUNK:
+            yield ('' if first else ',') + ','.join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ('' if first else ',') + ','.join(chunk)
+    yield suffix
+
+def song_fields(song, fields):
+    """Serialize only the given fields of a song, formatted as in Song.to_dict"""
+    data = {}
+    for field in fields:
+        value = getattr(song, field)
+        data[field] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+def playlist_query():
+    """Parse ?fields=, ?offset=, ?limit= and ?cursor= of a playlist request; returns (query, error response).
+
+    Checked before any ETag is compared, so a malformed request is never
+    answered with 304.
+    """
+    args = request.args
+    query = {'serialize': Song.to_dict, 'paged': any(k in args for k in ('offset', 'limit', 'cursor'))}
+    if args.get('fields'):
+        fields = args['fields'].split(',')
+        unknown = [f for f in fields if f not in SONG_FIELDS]
+        if unknown:
+            return None, (jsonify({"success": False, "message": f"Unknown fields: {', '.join(unknown)}"}), 400)
+        query['serialize'] = lambda song: song_fields(song, fields)
+    if not query['paged']:
+        return query, None
+    
+    try:
+        query['offset'] = int(args.get('offset', 0))
+        query['limit'] = min(int(args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return None, (jsonify({"success": False, "message": "offset and limit must be integers"}), 400)
+    if query['offset'] < 0 or query['limit'] <= 0:
+        return None, (jsonify({"success": False, "message": "offset must be >= 0 and limit > 0"}), 400)
+    
+    query['after_id'] = None
+    if 'cursor' in args:
+        query['after_id'] = decode_cursor(args['cursor'])
+        if song_key(query['after_id']) is None:
+            return None, (jsonify({"success": False, "message": "Invalid or expired cursor"}), 400)
+    return query, None
+
+def playlist_response(playlist, query):
+    """Stream a playlist's songs, optionally paginated and trimmed to some fields (see playlist_query).
+
+    Without offset/limit/cursor the response is a plain JSON array of every
+    song. With them it is an object holding one page and a next_cursor.
+    Cursors point just after a song id, so paging stays stable while songs
+    are inserted or moved elsewhere in the playlist. ?fields=id,title keeps
+    only the listed song fields.
+    """
+    serialize = query['serialize']
+    # Callers hold the playlist's read lock only while this runs: the songs
+    # are picked here, and the body streams from the copied refs afterwards
+    if not query['paged']:
+        songs = list(playlist.iter_songs())
+        items = (serialize(song) for song in songs)
+        return Response(stream_with_context(stream_json_array(items)), mimetype='application/json')
+    
+    offset, limit, after_id = query['offset'], query['limit'], query['after_id']
+    if after_id is not None and not playlist.get_song(after_id):
+        return jsonify({"success": False, "message": "Invalid or expired cursor"}), 400
+    
+    total = playlist.size
+    songs = list(playlist.iter_songs(start=offset, limit=limit, after_id=after_id))
+    last_id = songs[-1].id if songs else None
+    has_more = last_id is not None and next(playlist.iter_songs(after_id=last_id, limit=1), None)
+    next_cursor = encode_cursor(last_id) if has_more else None
+    
+    def generate():
+        yield from stream_json_array(map(serialize, songs), prefix=f'{{"total": {total}, "songs": [', suffix='')
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def playlists_version():
+    """Version token covering the playlist list and every playlist in it"""
+    # Playlist versions only grow, so their sum only repeats across a
+    # deletion, which bumps the registry version
+    total = sum(info['playlist'].version for info in playlists.values())
+    return f"{INSTANCE_EPOCH}.r{registry_version}.{total}"
+
+def current_version():
+    """Version token for responses derived from the current playlist"""
+    current_playlist = get_current_playlist()
+    return f"{INSTANCE_EPOCH}.{current_playlist_id}.{current_playlist.version if current_playlist else 0}"
+
+def conditional_response(version, respond):
+    """Serve a GET whose body depends only on version and the request URL.
+
+    Answers 304 when If-None-Match carries the version's ETag, replays a
+    cached body when one was built at this version, and otherwise calls
+    respond() and caches a successful body as it streams out.
+    """
+    if request.if_none_match.contains(version):
+        response_cache.record_not_modified()
+        response = Response(status=304)
+    else:
+        key = request.full_path
+        body = response_cache.get(key, version)
+        if body is not None:
+            response = Response(body, mimetype='application/json')
+        else:
+            response = app.make_response(respond())
+            if response.status_code != 200:
+                # Errors are not versioned bodies; a tag would let them be revalidated into 304s
+                return response
+            response.response = response_cache.capture(key, version, response.response)
+    response.set_etag(version)
+    # Let browsers keep the body but revalidate it on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def start_store():
+    """Load existing playlists on startup, one worker at a time in multi-worker mode"""
+    if not app.config['MULTI_WORKER']:
+        load_playlists()
+        writer.flush()
+        return
+    # Otherwise workers starting together could each create a default
+    # playlist or run the same migration
+    with file_lock(STARTUP_LOCK_FILE):
+        load_playlists()
+        writer.flush()
+    threading.Thread(target=poll_shared_state, name="shared-state", daemon=True).start()
+
+def refresh_song(song_data):
+    """Catalog song for a song dict read from the shared store, updating the fields other workers change"""
+    song = song_catalog.get(song_key(song_data['id']))
+    if not song:
+        song = catalog_song(song_data)
+        recently_played.add(song)
+        return song
+    stored = Song.from_dict(song_data)
+    if (song.is_favorite, song.play_count, song.last_played, song.duration) != \
+            (stored.is_favorite, stored.play_count, stored.last_played, stored.duration):
+        song.is_favorite = stored.is_favorite
+        song.play_count = stored.play_count
+        song.last_played = stored.last_played
+        song.duration = stored.duration
+        recently_played.add(song)
+        touch_song(song.id, None)
+    return song
+
+def sync_shared_state():
+    """Reload what other workers changed in the shared store: the playlists whose stamps moved and changed songs"""
+    global current_playlist_id
+    
+    if not store.stale_scopes():
+        return
+    with lock_playlists(write=True, registry_write=True), catalog_lock.writing():
+        # Another thread may have caught up while this one waited
+        stale = store.stale_scopes()
+        if not stale:
+            return
+        reload_ids = [playlist_id for playlist_id in stale if playlist_id in playlists]
+        released = []
+        if REGISTRY in stale:
+            version, rows, current_id = store.load_registry()
+            reloaded = {}
+            for playlist_id, name, description, created_at in rows:
+                info = playlists.get(playlist_id)
+                if info is None:
+                    info = {'playlist': new_playlist(), 'lock': RWLock()}
+                    reload_ids.append(playlist_id)
+                info.update(name=name, description=description, created_at=created_at)
+                reloaded[playlist_id] = info
+            for playlist_id in playlists.keys() - reloaded.keys():
+                released += [song.id for song in playlists[playlist_id]['playlist'].iter_songs()]
+                store.mark_seen(playlist_id, None)
+            playlists.clear()
+            playlists.update(reloaded)
+            current_playlist_id = current_id if current_id in playlists else next(iter(playlists), None)
+            bump_registry()
+            store.mark_seen(REGISTRY, version)
+        
+        if SONGS in stale:
+            version, song_dicts = store.load_changed_songs()
+            for song_data in song_dicts:
+                # Songs new to this worker come with the playlists holding them
+                if song_key(song_data['id']) in song_catalog:
+                    refresh_song(song_data)
+            store.mark_seen(SONGS, version)
+            shared_stats['songs_reloaded'] += len(song_dicts)
+        
+        # Replay the operations missed where the store still has them all, else reload whole playlists
+        replayed = set()
+        for playlist_id, (version, ops, size) in store.load_playlist_changes(reload_ids).items():
+            for op in ops:
+                apply_operation(op)
+            shared_stats['ops_replayed'] += len(ops)
+            if playlists[playlist_id]['playlist'].size == size:
+                store.mark_seen(playlist_id, version)
+                publish_change(playlist_id)
+                replayed.add(playlist_id)
+        full_reload = [playlist_id for playlist_id in reload_ids if playlist_id not in replayed]
+        
+        for playlist_id, (version, song_dicts) in store.load_playlist_songs(full_reload).items():
+            playlist = playlists[playlist_id]['playlist']
+            songs = [refresh_song(song_data) for song_data in song_dicts]
+            kept = {song.key for song in songs}
+            released += [song.id for song in playlist.iter_songs() if song.key not in kept]
+            playlist.set_songs(songs)
+            store.mark_seen(playlist_id, version)
+            publish_change(playlist_id)
+        release_songs(released)
+        shared_stats['syncs'] += 1
+        shared_stats['playlists_reloaded'] += len(full_reload)
+    if REGISTRY in stale:
+        publish_change()
+
+def poll_shared_state():
+    """Pick up other workers' changes while no requests arrive, so event subscribers hear of them"""
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try:
+            sync_shared_state()
+        except Exception as e:
+            print(f"Error reloading shared state: {e}")
+
+start_store()
+writer.start()
+atexit.register(writer.stop)
+# Read durations of songs added before they were stored, off the request path
+for song in list(song_catalog.values()):
+    if song.duration is None:
+        metadata_worker.enqueue(song.key, static_path(song.file_path))
+metadata_worker.start()
+atexit.register(metadata_cache.save)
+# Count file references from the loaded catalog, then hash files stored
+# before uploads were deduplicated so new copies of them are recognized
+content_store.reset_refs(song.file_path for song in song_catalog.values())
+threading.Thread(target=content_store.index_files, args=(sorted({song.file_path for song in song_catalog.values()}),),
+                 name="content-index", daemon=True).start()
+
+@app.before_request
+def check_shared_state():
+    """In multi-worker mode, bring anything other workers changed up to date first"""
+    if app.config['MULTI_WORKER']:
+        sync_shared_state()
+
+@app.after_request
+def compact_log(response):
+    """Fold the operation log into a snapshot once the store asks for it"""
+    # Write views have released their locks by now, and save_playlists
+    # needs them all; GETs log nothing
+    if request.method != 'GET' and writer.needs_compaction():
+        # Nothing changed beyond the logged ops, so subscribers need no extra event
+        save_playlists(notify=False)
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({"success": False, "message": f"Upload too large; each file may be at most {limit} MB"}), 413
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/playlists', methods=['GET'])
-def get_playlists():
-    """Get all playlists"""
+def list_playlists():
+    """Serialize the summary of every playlist"""
     playlists_list = []
     for playlist_id, playlist_info in playlists.items():
         playlists_list.append({
@@ -176,34 +828,52 @@ def get_playlists():
         })
     return jsonify(playlists_list)
 
+@app.route('/api/playlists', methods=['GET'])
+def get_playlists():
+    """Get all playlists"""
+    with lock_playlists():
+        return conditional_response(playlists_version(), list_playlists)
+
 @app.route('/api/playlists/<playlist_id>/switch', methods=['POST'])
 def switch_playlist(playlist_id):
     """Switch to a different playlist"""
     global current_playlist_id
     
-    if playlist_id not in playlists:
-        return jsonify({"success": False, "message": "Playlist not found"}), 404
-    
-    current_playlist_id = playlist_id
-    save_playlists()
+    with lock_playlists([], registry_write=True):
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        
+        current_playlist_id = playlist_id
+        bump_registry()
+        record_operation('switch', playlist_id=playlist_id)
     return jsonify({"success": True, "message": "Playlist switched"})
 
 @app.route('/api/playlist', methods=['GET'])
 def get_playlist():
-    current_playlist = get_current_playlist()
-    if current_playlist:
-        return jsonify(current_playlist.get_all_songs())
+    """Songs of the current playlist; supports ?offset=&limit= and ?cursor=&limit="""
+    query, error = playlist_query()
+    if error:
+        return error
+    with lock_playlists(current_ids):
+        current_playlist = get_current_playlist()
+        if current_playlist:
+            response = conditional_response(current_version(), lambda: playlist_response(current_playlist, query))
+            # Starting point for /api/playlists/<id>/changes
+            response.headers['X-Playlist-Id'] = current_playlist_id
+            response.headers['X-Playlist-Version'] = f"{INSTANCE_EPOCH}:{current_playlist.version}"
+            return response
     return jsonify([])
 
 @app.route('/api/current', methods=['GET'])
 def get_current():
-    current_playlist = get_current_playlist()
-    if current_playlist:
-        # Check if playlist is empty
-        if current_playlist.is_empty():
-            return jsonify({"success": False, "message": "Playlist is empty"}), 400
-        song = current_playlist.get_current_song()
-        return jsonify(song.to_dict() if song else None)
+    with lock_playlists(current_ids):
+        current_playlist = get_current_playlist()
+        if current_playlist:
+            # Check if playlist is empty
+            if current_playlist.is_empty():
+                return jsonify({"success": False, "message": "Playlist is empty"}), 400
+            song = current_playlist.get_current_song()
+            return jsonify(song.to_dict() if song else None)
     return jsonify(None)
 
 @app.route('/api/add', methods=['POST'])
@@ -224,183 +894,405 @@ def add_song():
         
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Store relative path for frontend access
-        relative_path = f"music/{filename}"
-        
-        # Check if song already exists in the playlist
-        if current_playlist.contains_song(relative_path):
-            return jsonify({"success": False, "message": "Song already exists in playlist"}), 400
-        
-        # Extract metadata if not provided
-        if not title or not artist:
-            try:
-                audio = MP3(file_path, ID3=EasyID3)
-                if not title:
-                    title = audio.get('title', [os.path.splitext(filename)[0]])[0]
-                if not artist:
-                    artist = audio.get('artist', ['Unknown Artist'])[0]
-            except (ID3NoHeaderError, Exception):
-                # Fallback if no tags or error
-                if not title:
-                    title = os.path.splitext(filename)[0]
-                if not artist:
-                    artist = "Unknown Artist"
+        # Identical audio already stored under any name is reused rather than written again
+        relative_path, _ = content_store.save(file.stream, filename)
+        try:
+            # Saved with the metadata worker's next batch or idle save, not per upload
+            meta = metadata_cache.lookup(static_path(relative_path))
+            # Use the file's tags where none were provided
+            tag_title, tag_artist = song_tags(filename, meta)
+            song = Song(title or tag_title, artist or tag_artist, relative_path)
+            song.duration = meta['duration']
+            
+            with lock_playlists(current_ids, write=True):
+                current_playlist = get_current_playlist()
+                if not current_playlist:
+                    return jsonify({"success": False, "message": "No active playlist"}), 400
+                # Check if song already exists in the playlist
+                if current_playlist.contains_song(relative_path):
+                    return jsonify({"success": False, "message": "Song already exists in playlist"}), 400
+                register_song(song)
+                current_playlist.add_song(song)
+                record_operation('add', playlist_id=current_playlist_id, song=song.to_dict())
+            
+            return jsonify({"success": True, "message": "Song added"})
+        finally:
+            # Songs hold references of their own; without one the stored file is deleted
+            content_store.release(relative_path)
 
-        song = Song(title, artist, relative_path)
-        current_playlist.add_song(song)
-        save_playlists()  # Save after adding
-        
-        return jsonify({"success": True, "message": "Song added"})
 
+def start_import(playlist_id, files, source, uploaded=()):
+    """Start a background job adding files ((absolute path, file_path) pairs) to a playlist.
+
+    uploaded lists file_paths content_store.save returned for it; they are
+    released once the job ends, so files no song took are deleted.
+    """
+    job = ImportJob(playlist_id, source)
+    with import_jobs_lock:
+        import_jobs[job.id] = job
+        finished = [job_id for job_id, j in import_jobs.items() if j.finished_at]
+        for job_id in finished[:max(len(finished) - IMPORT_JOBS_KEPT, 0)]:
+            del import_jobs[job_id]
+    
+    with lock_playlists([]):
+        playlist = playlists[playlist_id]['playlist']
+    
+    def is_known(file_paths):
+        with lock_playlists([playlist_id]):
+            return playlist.contains_many(file_paths)
+    
+    def commit(entries):
+        added = 0
+        with lock_playlists([playlist_id], write=True):
+            if playlists.get(playlist_id, {}).get('playlist') is not playlist:
+                raise ValueError("Playlist was deleted during the import")
+            for file_path, title, artist, duration in entries:
+                # Another import or upload may have added it since is_known was asked
+                if playlist.contains_song(file_path):
+                    continue
+                song = Song(title, artist, file_path)
+                song.duration = duration
+                register_song(song)
+                playlist.add_song(song)
+                added += 1
+        if added:
+            # One snapshot for the whole batch instead of an op per song
+            save_playlists(playlist_ids=[playlist_id])
+        return added
+    
+    job.start(files, is_known, commit,
+              workers=app.config['IMPORT_WORKERS'], processes=app.config['IMPORT_PROCESSES'],
+              cache=metadata_cache,
+              finish=lambda: [content_store.release(file_path) for file_path in uploaded])
+    return job
+
+def import_target():
+    """Playlist id named by the request (form or JSON), defaulting to the current one"""
+    data = request.get_json(silent=True) or {}
+    return request.form.get('playlist_id') or data.get('playlist_id') or current_playlist_id
+
+@app.route('/api/import', methods=['POST'])
+def import_files():
+    """Upload several files at once; tags are read and songs added by a background job"""
+    playlist_id = import_target()
+    if playlist_id not in playlists:
+        return jsonify({"success": False, "message": "Playlist not found"}), 404
+    
+    uploads = [f for f in request.files.getlist('files') if f.filename]
+    if not uploads:
+        return jsonify({"success": False, "message": "No files selected"}), 400
+    
+    for upload in uploads:
+        upload.stream.seek(0, os.SEEK_END)
+        size = upload.stream.tell()
+        upload.stream.seek(0)
+        if size > app.config['MAX_CONTENT_LENGTH']:
+            limit = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+            return jsonify({"success": False, "message": f"{upload.filename} is larger than {limit} MB"}), 413
+    
+    files = []
+    for upload in uploads:
+        file_path, _ = content_store.save(upload.stream, secure_filename(upload.filename))
+        files.append((static_path(file_path), file_path))
+    
+    job = start_import(playlist_id, files, 'upload', uploaded=[file_path for _, file_path in files])
+    return jsonify({"success": True, "job_id": job.id}), 202
+
+@app.route('/api/import/scan', methods=['POST'])
+def import_directory():
+    """Import every audio file under a directory of the music folder, e.g. {"directory": "collection"}"""
+    playlist_id = import_target()
+    if playlist_id not in playlists:
+        return jsonify({"success": False, "message": "Playlist not found"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    directory = os.path.normpath(os.path.join(root, data.get('directory', '')))
+    if directory != root and not directory.startswith(root + os.sep):
+        return jsonify({"success": False, "message": "Directory must be inside the music folder"}), 400
+    if not os.path.isdir(directory):
+        return jsonify({"success": False, "message": "Directory not found"}), 404
+    
+    # Paths relative to the static folder, like those /api/add stores
+    files = ((static_path(file_path), file_path) for _, file_path in scan_directory(directory, os.path.dirname(root)))
+    job = start_import(playlist_id, files, f"scan:{os.path.relpath(directory, root)}")
+    return jsonify({"success": True, "job_id": job.id}), 202
+
+@app.route('/api/import/<job_id>', methods=['GET'])
+def import_status(job_id):
+    """Progress and throughput of an import job"""
+    with import_jobs_lock:
+        job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Import job not found"}), 404
+    return jsonify(job.to_dict())
+
+def stream_version(song):
+    """Version of a song's audio for /api/stream URLs and ETags.
+
+    Files the content store wrote are never rewritten, so their hash names
+    the content; any other file falls back to its size and mtime.
+    """
+    digest = content_store.digest(song.file_path)
+    if digest:
+        return digest[:16]
+    st = os.stat(static_path(song.file_path))
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+@app.route('/api/stream/<song_id>', methods=['GET'])
+def stream_song(song_id):
+    """A song's audio, with Range support for seeking.
+
+    Requests without ?v= (or with an outdated one) are redirected to
+    ?v=<content version>; that URL always returns the same bytes, so it
+    is cacheable forever.
+    """
+    with catalog_lock.reading():
+        song = song_catalog.get(song_key(song_id))
+    if not song:
+        return jsonify({"success": False, "message": "Song not found"}), 404
+    try:
+        version = stream_version(song)
+    except OSError:
+        return jsonify({"success": False, "message": "Audio file not found"}), 404
+    
+    if request.args.get('v') != version:
+        response = redirect(url_for('stream_song', song_id=song.id, v=version))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    # Handles If-None-Match and Range (206) against the strong ETag
+    # Uploads are saved relative to the working directory, which Flask would not assume
+    response = send_from_directory(os.path.abspath(content_store.root), song.file_path, conditional=True,
+                                   etag=version, max_age=STREAM_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/api/remove/<song_id>', methods=['DELETE'])
 def remove_song(song_id):
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    success = current_playlist.remove_song(song_id)
-    if success:
-        save_playlists()  # Save after removing
-    else:
-        # Provide feedback when removing a non-existing song
-        return jsonify({"success": False, "message": "Song not found in playlist"}), 400
+    with lock_playlists(current_ids, write=True):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        success = current_playlist.remove_song(song_id)
+        if success:
+            release_songs([song_id])
+            record_operation('remove', playlist_id=current_playlist_id, song_id=song_id)
+        else:
+            # Provide feedback when removing a non-existing song
+            return jsonify({"success": False, "message": "Song not found in playlist"}), 400
     return jsonify({"success": success})
 
 @app.route('/api/next', methods=['POST'])
 def next_song():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    # Check if playlist is empty
-    if current_playlist.is_empty():
-        return jsonify({"success": False, "message": "Playlist is empty"}), 400
-    
-    song = current_playlist.next_song()
-    return jsonify(song.to_dict() if song else None)
+    # Moving the playing position changes the playlist
+    with lock_playlists(current_ids, write=True):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        # Check if playlist is empty
+        if current_playlist.is_empty():
+            return jsonify({"success": False, "message": "Playlist is empty"}), 400
+        
+        song = current_playlist.next_song()
+        if 'position' in (current_playlist.shuffle_state() or {}):
+            # Smart shuffle keeps no position to save
+            record_shuffle(current_playlist_id, current_playlist)
+        broker.publish('now_playing', {'playlist_id': current_playlist_id, 'song': song.to_dict() if song else None})
+        return jsonify(song.to_dict() if song else None)
 
 @app.route('/api/prev', methods=['POST'])
 def prev_song():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    # Check if playlist is empty
-    if current_playlist.is_empty():
-        return jsonify({"success": False, "message": "Playlist is empty"}), 400
-    
-    song = current_playlist.prev_song()
-    return jsonify(song.to_dict() if song else None)
+    # Moving the playing position changes the playlist
+    with lock_playlists(current_ids, write=True):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        # Check if playlist is empty
+        if current_playlist.is_empty():
+            return jsonify({"success": False, "message": "Playlist is empty"}), 400
+        
+        song = current_playlist.prev_song()
+        if 'position' in (current_playlist.shuffle_state() or {}):
+            # Smart shuffle keeps no position to save
+            record_shuffle(current_playlist_id, current_playlist)
+        broker.publish('now_playing', {'playlist_id': current_playlist_id, 'song': song.to_dict() if song else None})
+        return jsonify(song.to_dict() if song else None)
 
 @app.route('/api/shuffle', methods=['POST'])
 def shuffle_playlist():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    # Check if playlist is empty
-    if current_playlist.is_empty():
-        return jsonify({"success": False, "message": "Cannot shuffle empty playlist"}), 400
-    
-    current_playlist.shuffle()
-    save_playlists()  # Save after shuffling
+    with lock_playlists(current_ids, write=True):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        # Check if playlist is empty
+        if current_playlist.is_empty():
+            return jsonify({"success": False, "message": "Cannot shuffle empty playlist"}), 400
+        
+        current_playlist.shuffle()
+        shuffled_id = current_playlist_id
+    save_playlists(playlist_ids=[shuffled_id])  # Save after shuffling
     return jsonify({"success": True})
 
-@app.route('/api/sort/title', methods=['POST'])
-def sort_by_title():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    # Check if playlist is empty
-    if current_playlist.is_empty():
-        return jsonify({"success": False, "message": "Cannot sort empty playlist"}), 400
-    
-    current_playlist.sort_by_title()
-    save_playlists()  # Save after sorting
-    return jsonify({"success": True})
+@app.route('/api/shuffle/mode', methods=['GET', 'POST'])
+def shuffle_mode():
+    """Shuffle mode of the current playlist; POST {"enabled": bool} turns it on or off.
 
-@app.route('/api/sort/date', methods=['POST'])
-def sort_by_date():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    # Check if playlist is empty
-    if current_playlist.is_empty():
-        return jsonify({"success": False, "message": "Cannot sort empty playlist"}), 400
+    Unlike /api/shuffle the stored order is kept: next and prev walk a
+    random order drawn as they go, and only its seed and position are saved.
+    With "smart": true, /api/next instead picks favorites more often and
+    recently played songs less, never repeating one of the last "window"
+    songs (SMART_SHUFFLE_WINDOW by default).
+    """
+    with lock_playlists(current_ids, write=request.method == 'POST'):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            enabled = bool(data.get('enabled'))
+            window = None
+            if enabled and data.get('smart'):
+                window = data.get('window', app.config['SMART_SHUFFLE_WINDOW'])
+                if not isinstance(window, int) or isinstance(window, bool) or window < 0:
+                    return jsonify({"success": False, "message": "window must be a non-negative integer"}), 400
+            state = current_playlist.shuffle_state()
+            if enabled != bool(state) or (state or {}).get('window') != window:
+                current_playlist.set_shuffle(enabled, window=window)
+                record_shuffle(current_playlist_id, current_playlist)
+        state = current_playlist.shuffle_state()
+        return jsonify({"success": True, "enabled": state is not None, "smart": 'window' in (state or {}),
+                        "window": (state or {}).get('window')})
+
+@app.route('/api/sort', methods=['POST'])
+def sort_playlist():
+    """Sort the current playlist by a list of [field, "asc"|"desc"] keys"""
+    data = request.get_json(silent=True) or {}
+    keys = data.get('keys')
     
-    current_playlist.sort_by_date()
-    save_playlists()  # Save after sorting
+    with lock_playlists(current_ids, write=True):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        # Check if playlist is empty
+        if current_playlist.is_empty():
+            return jsonify({"success": False, "message": "Cannot sort empty playlist"}), 400
+        
+        if not keys or not isinstance(keys, list) or not all(
+                isinstance(k, list) and len(k) == 2 and isinstance(k[0], str) and isinstance(k[1], str) for k in keys):
+            return jsonify({"success": False, "message": "keys must be a list of [field, order] pairs"}), 400
+        
+        try:
+            current_playlist.sort([tuple(k) for k in keys])
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        sorted_id = current_playlist_id
+    save_playlists(playlist_ids=[sorted_id])  # Save after sorting
     return jsonify({"success": True})
 
 @app.route('/api/favorites', methods=['GET'])
 def get_favorites():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify([])
-    
-    return jsonify(current_playlist.get_favorites())
+    with lock_playlists(current_ids):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify([])
+        
+        return conditional_response(current_version(), lambda: jsonify(current_playlist.get_favorites()))
 
 @app.route('/api/favorite/<song_id>', methods=['POST'])
 def toggle_favorite(song_id):
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    success = current_playlist.toggle_favorite(song_id)
-    if success:
-        save_playlists()  # Save after toggling favorite
-    else:
-        # Provide feedback when toggling favorite on a non-existing song
-        return jsonify({"success": False, "message": "Song not found in playlist"}), 400
+    with lock_songs():
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        success = current_playlist.toggle_favorite(song_id)
+        if success:
+            touch_song(song_id, current_playlist)
+            record_operation('favorite', playlist_id=current_playlist_id, song_id=song_id,
+                             is_favorite=current_playlist.get_song(song_id).is_favorite)
+        else:
+            # Provide feedback when toggling favorite on a non-existing song
+            return jsonify({"success": False, "message": "Song not found in playlist"}), 400
     return jsonify({"success": success})
 
 @app.route('/api/recent', methods=['GET'])
 def get_recent():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify([])
-    
-    return jsonify(current_playlist.get_recently_played())
+    with lock_playlists(current_ids):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify([])
+        
+        return conditional_response(current_version(), lambda: jsonify(current_playlist.get_recently_played()))
+
+@app.route('/api/recent/all', methods=['GET'])
+def get_recent_all():
+    """Recently played songs across every playlist; ?limit= defaults to 20"""
+    limit = min(max(request.args.get('limit', 20, type=int), 0), MAX_PAGE_SIZE)
+    with catalog_lock.reading():
+        return jsonify([song.to_dict() for song in recently_played.newest(limit)])
+
+@app.route('/api/search', methods=['GET'])
+def search_songs():
+    """Ranked title/artist search; ?q= is matched as you type, ?playlist_id= narrows to one playlist"""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 0), MAX_PAGE_SIZE)
+    playlist_id = request.args.get('playlist_id')
+    with lock_playlists([playlist_id] if playlist_id else []), catalog_lock.reading():
+        accept = None
+        if playlist_id:
+            if playlist_id not in playlists:
+                return jsonify({"success": False, "message": "Playlist not found"}), 404
+            accept = playlists[playlist_id]['playlist'].__contains__
+        return jsonify([song.to_dict() for song in search_index.search(query, limit, accept)])
 
 @app.route('/api/play/<song_id>', methods=['POST'])
 def mark_played(song_id):
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
-    success = current_playlist.mark_as_played(song_id)
-    if success:
-        save_playlists()  # Save after marking as played
-    else:
-        # Provide feedback when marking a non-existing song as played
-        return jsonify({"success": False, "message": "Song not found in playlist"}), 400
+    with lock_songs():
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        success = current_playlist.mark_as_played(song_id)
+        if success:
+            touch_song(song_id, current_playlist)
+            song = current_playlist.get_song(song_id)
+            recently_played.add(song)
+            record_operation('played', playlist_id=current_playlist_id, song_id=song_id,
+                             play_count=song.play_count, last_played=song.last_played.isoformat())
+            broker.publish('played', {'song_id': song_id, 'play_count': song.play_count,
+                                      'last_played': song.last_played.isoformat()})
+        else:
+            # Provide feedback when marking a non-existing song as played
+            return jsonify({"success": False, "message": "Song not found in playlist"}), 400
     return jsonify({"success": success})
 
 @app.route('/api/reorder', methods=['POST'])
 def reorder_songs():
-    current_playlist = get_current_playlist()
-    if not current_playlist:
-        return jsonify({"success": False, "message": "No active playlist"}), 400
-    
     data = request.get_json()
     song_id = data.get('song_id')
     new_position = data.get('new_position')
     
-    if song_id is None or new_position is None:
-        return jsonify({"success": False, "message": "Missing song_id or new_position"}), 400
-    
-    success = current_playlist.move_song(song_id, new_position)
-    if success:
-        save_playlists()
-    else:
-        # Provide feedback when moving a non-existing song
-        return jsonify({"success": False, "message": "Song not found in playlist"}), 400
+    with lock_playlists(current_ids, write=True):
+        current_playlist = get_current_playlist()
+        if not current_playlist:
+            return jsonify({"success": False, "message": "No active playlist"}), 400
+        
+        if song_id is None or new_position is None:
+            return jsonify({"success": False, "message": "Missing song_id or new_position"}), 400
+        
+        success = current_playlist.move_song(song_id, new_position)
+        if success:
+            record_operation('move', playlist_id=current_playlist_id, song_id=song_id, position=new_position)
+        else:
+            # Provide feedback when moving a non-existing song
+            return jsonify({"success": False, "message": "Song not found in playlist"}), 400
     return jsonify({"success": success})
 
 @app.route('/api/playlists', methods=['POST'])
@@ -414,14 +1306,16 @@ def create_playlist():
     
     # Create new playlist
     playlist_id = str(uuid.uuid4())
-    playlists[playlist_id] = {
-        'name': name,
-        'description': description,
-        'created_at': datetime.now().isoformat(),
-        'playlist': Playlist()
-    }
-    
-    save_playlists()
+    with lock_playlists([], registry_write=True):
+        playlists[playlist_id] = {
+            'name': name,
+            'description': description,
+            'created_at': datetime.now().isoformat(),
+            'playlist': new_playlist(),
+            'lock': RWLock()
+        }
+        bump_registry()
+    save_playlists(playlist_ids=[playlist_id])
     return jsonify({
         "success": True, 
         "message": f"Playlist '{name}' created successfully",
@@ -433,109 +1327,178 @@ def delete_playlist(playlist_id):
     """Delete a playlist"""
     global current_playlist_id
     
-    if playlist_id not in playlists:
-        return jsonify({"success": False, "message": "Playlist not found"}), 404
-    
-    playlist_name = playlists[playlist_id]['name']
-    
-    # Prevent deleting the last playlist
-    if len(playlists) <= 1:
-        return jsonify({"success": False, "message": "Cannot delete the last playlist"}), 400
-    
-    # If deleting current playlist, switch to another one
-    if current_playlist_id == playlist_id:
-        # Find another playlist to switch to
-        for other_id in playlists.keys():
-            if other_id != playlist_id:
-                current_playlist_id = other_id
-                break
-    
-    # Delete the playlist
-    del playlists[playlist_id]
-    save_playlists()
+    # Wait out requests still using the playlist before dropping it
+    with lock_playlists([playlist_id], write=True, registry_write=True):
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        
+        playlist_name = playlists[playlist_id]['name']
+        
+        # Prevent deleting the last playlist
+        if len(playlists) <= 1:
+            return jsonify({"success": False, "message": "Cannot delete the last playlist"}), 400
+        
+        # If deleting current playlist, switch to another one
+        if current_playlist_id == playlist_id:
+            # Find another playlist to switch to
+            for other_id in playlists.keys():
+                if other_id != playlist_id:
+                    current_playlist_id = other_id
+                    break
+        
+        # Delete the playlist
+        deleted = playlists.pop(playlist_id)['playlist']
+        release_songs([song.id for song in deleted.iter_songs()])
+        bump_registry()
+    save_playlists(playlist_ids=[playlist_id])
     
     return jsonify({
         "success": True, 
         "message": f"Playlist '{playlist_name}' deleted successfully"
     })
 
+@app.route('/api/playlists/<playlist_id>/songs', methods=['GET'])
+def get_playlist_songs(playlist_id):
+    """Read any playlist's songs without switching the current playlist"""
+    query, error = playlist_query()
+    if error:
+        return error
+    with lock_playlists([playlist_id]):
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        return playlist_response(playlists[playlist_id]['playlist'], query)
+
+@app.route('/api/playlists/<playlist_id>/changes', methods=['GET'])
+def get_playlist_changes(playlist_id):
+    """Ops since ?since=<epoch>:<version>, or a full snapshot once they are no longer kept"""
+    epoch, _, since = request.args.get('since', '').rpartition(':')
+    
+    with lock_playlists([playlist_id]):
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        try:
+            since_version = int(since)
+        except ValueError:
+            return jsonify({"success": False, "message": "since must be a version from X-Playlist-Version or a previous response"}), 400
+        
+        playlist = playlists[playlist_id]['playlist']
+        version = f"{INSTANCE_EPOCH}:{playlist.version}"
+        ops = playlist.changes_since(since_version) if epoch == INSTANCE_EPOCH else None
+        if ops is None:
+            # Copy the song refs so the snapshot streams after the locks are released
+            songs = list(playlist.iter_songs())
+            prefix = '{"version":%s,"current":%s,"snapshot":[' % (json.dumps(version), json.dumps(playlist_id == current_playlist_id))
+            return Response(stream_with_context(stream_json_array(map(Song.to_dict, songs), prefix, ']}')),
+                            mimetype='application/json')
+        return jsonify({"version": version, "current": playlist_id == current_playlist_id, "ops": ops})
+
 @app.route('/api/playlists/<playlist_id>/songs/<song_id>', methods=['DELETE'])
 def remove_song_from_playlist(playlist_id, song_id):
     """Remove a song from a specific playlist"""
-    if playlist_id not in playlists:
-        return jsonify({"success": False, "message": "Playlist not found"}), 404
-    
-    playlist_obj = playlists[playlist_id]['playlist']
-    success = playlist_obj.remove_song(song_id)
-    
-    if success:
-        save_playlists()
-        return jsonify({"success": True, "message": "Song removed from playlist"})
-    else:
-        return jsonify({"success": False, "message": "Song not found in playlist"}), 404
+    with lock_playlists([playlist_id], write=True):
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        
+        playlist_obj = playlists[playlist_id]['playlist']
+        success = playlist_obj.remove_song(song_id)
+        
+        if success:
+            release_songs([song_id])
+            record_operation('remove', playlist_id=playlist_id, song_id=song_id)
+            return jsonify({"success": True, "message": "Song removed from playlist"})
+        else:
+            return jsonify({"success": False, "message": "Song not found in playlist"}), 404
 
 @app.route('/api/playlists/<playlist_id>/songs', methods=['POST'])
 def add_song_to_playlist(playlist_id):
     """Add a song to a specific playlist"""
-    if playlist_id not in playlists:
-        return jsonify({"success": False, "message": "Playlist not found"}), 404
-    
     data = request.get_json()
     song_id = data.get('song_id')
     source_playlist_id = data.get('source_playlist_id')
     
-    if not song_id or not source_playlist_id:
-        return jsonify({"success": False, "message": "Missing song_id or source_playlist_id"}), 400
-    
-    if source_playlist_id not in playlists:
-        return jsonify({"success": False, "message": "Source playlist not found"}), 404
-    
-    # Find the song in source playlist
-    source_playlist = playlists[source_playlist_id]['playlist']
-    source_songs = source_playlist.get_all_songs()
-    
-    song_data = None
-    for song_dict in source_songs:
-        if song_dict['id'] == song_id:
-            song_data = song_dict
-            break
-    
-    if not song_data:
-        return jsonify({"success": False, "message": "Song not found in source playlist"}), 404
-    
-    # Create new song object and add to target playlist
-    song = Song(song_data['title'], song_data['artist'], song_data['file_path'])
-    song.id = song_data['id']  # Keep same ID
-    song.added_at = datetime.fromisoformat(song_data['added_at'])
-    song.is_favorite = song_data.get('is_favorite', False)
-    song.play_count = song_data.get('play_count', 0)
-    if song_data.get('last_played'):
-        song.last_played = datetime.fromisoformat(song_data['last_played'])
-    
-    target_playlist = playlists[playlist_id]['playlist']
-    target_playlist.add_song(song)
-    save_playlists()
+    # The source is written too: the song it holds gains a playlist, and
+    # removing it there must not release it from the catalog meanwhile
+    with lock_playlists([playlist_id, source_playlist_id], write=True), catalog_lock.writing():
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        
+        if not song_id or not source_playlist_id:
+            return jsonify({"success": False, "message": "Missing song_id or source_playlist_id"}), 400
+        
+        if source_playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Source playlist not found"}), 404
+        
+        # Find the song in source playlist
+        source_playlist = playlists[source_playlist_id]['playlist']
+        source_song = source_playlist.get_song(song_id)
+        
+        if not source_song:
+            return jsonify({"success": False, "message": "Song not found in source playlist"}), 404
+        
+        target_playlist = playlists[playlist_id]['playlist']
+        if target_playlist.contains_song(source_song.file_path):
+            return jsonify({"success": False, "message": "Song already exists in playlist"}), 400
+        
+        # Share the catalog song rather than copying it
+        target_playlist.add_song(source_song)
+        record_operation('add', playlist_id=playlist_id, song=source_song.to_dict())
     
     return jsonify({"success": True, "message": "Song added to playlist"})
 
+@app.route('/api/flush', methods=['POST'])
+def flush():
+    """Write all pending changes to storage now"""
+    writes = writer.flush()
+    return jsonify({"success": True, "writes": writes})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Instrumentation counters"""
+    return jsonify({"persistence": writer.stats(), "response_cache": response_cache.stats(),
+                    "events": broker.stats(),
+                    "metadata_cache": dict(metadata_cache.stats(), pending=metadata_worker.pending()),
+                    "content_store": content_store.stats(),
+                    "locks": lock_stats(),
+                    "shared_state": dict(shared_stats, multi_worker=app.config['MULTI_WORKER'], pid=os.getpid())})
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    """Server-Sent Events: now_playing, played, playlist and playlists changes"""
+    def generate():
+        # Subscribe once streaming starts so an abandoned response cannot leak a queue
+        subscription = broker.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                payload = subscription.next(timeout=EVENT_KEEPALIVE)
+                yield payload if payload is not None else ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/playlists/<playlist_id>/update', methods=['PUT'])
 def update_playlist(playlist_id):
     """Update playlist name and description"""
-    if playlist_id not in playlists:
-        return jsonify({"success": False, "message": "Playlist not found"}), 404
-    
     data = request.get_json()
     name = data.get('name')
     description = data.get('description', '')
     
-    if not name:
-        return jsonify({"success": False, "message": "Playlist name is required"}), 400
-    
-    playlists[playlist_id]['name'] = name
-    playlists[playlist_id]['description'] = description
-    save_playlists()
+    with lock_playlists([], registry_write=True):
+        if playlist_id not in playlists:
+            return jsonify({"success": False, "message": "Playlist not found"}), 404
+        
+        if not name:
+            return jsonify({"success": False, "message": "Playlist name is required"}), 400
+        
+        playlists[playlist_id]['name'] = name
+        playlists[playlist_id]['description'] = description
+        bump_registry()
+    save_playlists(playlist_ids=[playlist_id])
     
     return jsonify({"success": True, "message": "Playlist updated successfully"})
 
 if __name__ == '__main__':
+    # Turn SIGTERM into a normal exit so the atexit flush runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=True)
@@ -0,0 +1,181 @@
+"""Concurrency stress test for the playlist locks.
+
+Serves the app on a local port (werkzeug's threaded server) and runs
+client threads over keep-alive connections with a mixed load on the
+current playlist: reads of /api/playlist, /api/favorites and /api/recent
+alongside reorders, shuffles, favorites, plays and songs removed and
+added back. Each round reports requests/s for its thread count, then
+checks the list invariants of every playlist: prev/next links agree, the
+walk from head ends at tail after size nodes, and the id index and file
+path counts match the nodes. Reads must never see a song twice.
+
+Before per-playlist locks, concurrent /api/reorder and /api/shuffle could
+leave prev/next links pointing at the wrong nodes, so the app had to run
+single-threaded.
+
+Usage: python bench_concurrency.py [seconds per round] [max threads] [songs]
+"""
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from adt import Song
+
+DEFAULT_SECONDS = 3
+DEFAULT_MAX_THREADS = 16
+DEFAULT_SONGS = 500
+# (weight, operation); reads dominate, as they do for the web UI
+MIX = [(40, 'playlist'), (15, 'favorites'), (10, 'recent'), (15, 'reorder'),
+       (5, 'favorite'), (5, 'play'), (2, 'shuffle'), (8, 'readd')]
+
+
+def write_library(path, count):
+    songs = [Song(f"Title {i}", f"Artist {i % 50}", f"music/{i}.mp3").to_dict() for i in range(count)]
+    song_ids = [s['id'] for s in songs]
+    data = {
+        'songs': songs,
+        'playlists': {
+            'library': {'name': 'Library', 'description': '', 'created_at': '2025-01-01T00:00:00',
+                        'song_ids': song_ids},
+            # Source for adding removed songs back; also keeps them in the catalog
+            'all': {'name': 'All', 'description': '', 'created_at': '2025-01-01T00:00:00',
+                    'song_ids': song_ids},
+        },
+        'current_playlist_id': 'library'
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return song_ids
+
+
+def check_playlist(playlist):
+    """Problems with a playlist's links and indexes, as strings"""
+    problems = []
+    nodes = []
+    prev = None
+    node = playlist.head
+    while node and len(nodes) <= playlist.size:
+        if node.prev is not prev:
+            problems.append(f"prev link broken at position {len(nodes)}")
+        nodes.append(node)
+        prev = node
+        node = node.next
+    if len(nodes) != playlist.size or node is not None:
+        problems.append(f"walked {len(nodes)} nodes, size is {playlist.size}")
+    if playlist.tail is not prev:
+        problems.append("tail is not the last node")
+    if {node.song.key: node for node in nodes} != playlist._index:
+        problems.append("id index does not match the nodes")
+    paths = {}
+    for node in nodes:
+        paths[node.song.file_path] = paths.get(node.song.file_path, 0) + 1
+    if paths != playlist._paths:
+        problems.append("file path counts do not match the nodes")
+    return problems
+
+
+class Client(threading.Thread):
+    def __init__(self, port, song_ids, seed, stop):
+        super().__init__(daemon=True)
+        self.conn = http.client.HTTPConnection('127.0.0.1', port)
+        self.song_ids = song_ids
+        self.rng = random.Random(seed)
+        self.stop = stop
+        self.requests = 0
+        self.errors = []
+
+    def call(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        self.requests += 1
+        if response.status >= 500:
+            self.errors.append(f"{method} {path}: {response.status}")
+        return response.status, data
+
+    def run(self):
+        weights, operations = zip(*MIX)
+        while not self.stop.is_set():
+            operation = self.rng.choices(operations, weights)[0]
+            song_id = self.rng.choice(self.song_ids)
+            if operation in ('playlist', 'favorites', 'recent'):
+                status, data = self.call('GET', f'/api/{operation}')
+                ids = [song['id'] for song in json.loads(data)]
+                if status == 200 and len(ids) != len(set(ids)):
+                    self.errors.append(f"/api/{operation} returned a song twice")
+            elif operation == 'reorder':
+                self.call('POST', '/api/reorder', {'song_id': song_id, 'new_position': self.rng.randrange(len(self.song_ids))})
+            elif operation == 'favorite':
+                self.call('POST', f'/api/favorite/{song_id}')
+            elif operation == 'play':
+                self.call('POST', f'/api/play/{song_id}')
+            elif operation == 'shuffle':
+                self.call('POST', '/api/shuffle')
+            else:
+                self.call('DELETE', f'/api/playlists/library/songs/{song_id}')
+                self.call('POST', '/api/playlists/library/songs', {'song_id': song_id, 'source_playlist_id': 'all'})
+        self.conn.close()
+
+
+def main(seconds, max_threads, count):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    song_ids = write_library('playlists_data.json', count)
+
+    import app
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    print(f"{count} songs, {seconds}s per round")
+    print(f"{'threads':>8} {'req/s':>8} {'contended':>10} {'invariants':>11}")
+    failed = False
+    threads = 1
+    while threads <= max_threads:
+        contended_before = sum(app.lock_stats().values())
+        stop = threading.Event()
+        clients = [Client(port, song_ids, seed, stop) for seed in range(threads)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        time.sleep(seconds)
+        stop.set()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+
+        problems = [error for client in clients for error in client.errors]
+        with app.lock_playlists():
+            for playlist_id, info in app.playlists.items():
+                problems += [f"{playlist_id}: {p}" for p in check_playlist(info['playlist'])]
+        contended = sum(app.lock_stats().values()) - contended_before
+        requests = sum(client.requests for client in clients)
+        print(f"{threads:>8} {requests / elapsed:>8.0f} {contended:>10} {'ok' if not problems else 'FAILED':>11}")
+        for problem in problems[:10]:
+            print(f"    {problem}")
+        failed = failed or bool(problems)
+        threads *= 2
+
+    server.shutdown()
+    app.writer.stop()
+    shutil.rmtree(workdir)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [DEFAULT_SECONDS, DEFAULT_MAX_THREADS, DEFAULT_SONGS][len(args):]))
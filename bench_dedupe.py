@@ -0,0 +1,67 @@
+"""Benchmark uploads with content-hash deduplication.
+
+Uploads files through POST /api/add into several playlists, where a
+share of the uploads repeat audio already stored under other names.
+Reports upload throughput, bytes on disk and the bytes deduplication
+saved, from /api/metrics. Before this change each upload was written
+under its own name, so disk use was the sum of every upload. The app
+runs in-process in a temp dir.
+
+Usage: python bench_dedupe.py [uploads] [distinct files] [KiB per file]
+"""
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+DEFAULT_UPLOADS = 2000
+DEFAULT_DISTINCT = 500
+DEFAULT_KIB = 512
+PLAYLISTS = 4
+
+
+def main(uploads, distinct, kib):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+
+    import app
+    client = app.app.test_client()
+    rng = random.Random(1)
+    contents = [rng.randbytes(kib * 1024) for _ in range(distinct)]
+    playlist_ids = [client.post('/api/playlists', json={'name': f'P{i}'}).get_json()['playlist_id']
+                    for i in range(PLAYLISTS)]
+
+    total = 0
+    start = time.perf_counter()
+    for i in range(uploads):
+        client.post(f'/api/playlists/{rng.choice(playlist_ids)}/switch')
+        body = rng.choice(contents)
+        total += len(body)
+        client.post('/api/add', data={'file': (io.BytesIO(body), f'upload_{i}.mp3')},
+                    content_type='multipart/form-data')
+    elapsed = time.perf_counter() - start
+
+    stats = client.get('/api/metrics').get_json()['content_store']
+    on_disk = sum(os.path.getsize(os.path.join(dirpath, name))
+                  for dirpath, _, names in os.walk('static/music') for name in names)
+    mib = 1024 * 1024
+    print(f"{uploads} uploads of {kib} KiB ({distinct} distinct) into {PLAYLISTS} playlists")
+    print(f"  throughput:         {uploads / elapsed:.0f} uploads/s, {total / mib / elapsed:.0f} MiB/s")
+    print(f"  uploaded:           {total / mib:.1f} MiB (disk use without dedupe)")
+    print(f"  on disk:            {on_disk / mib:.1f} MiB in {stats['files']} files")
+    print(f"  duplicate uploads:  {stats['duplicate_uploads']} ({stats['duplicate_upload_bytes'] / mib:.1f} MiB not written)")
+    print(f"  shared by songs:    {stats['bytes_saved'] / mib:.1f} MiB (extra copies avoided across playlists)")
+
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [DEFAULT_UPLOADS, DEFAULT_DISTINCT, DEFAULT_KIB][len(args):]))
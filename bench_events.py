@@ -0,0 +1,166 @@
+"""Load test for the /api/events Server-Sent Events stream.
+
+Serves the app on a local port and opens the given number of subscriber
+connections. A few of them are stalled: they stop reading, which
+exercises the bounded queues. The test runs in two phases:
+
+1. The publisher marks songs as played over HTTP. Each play fans out a
+   'playlist' and a 'played' event to every subscriber, and every active
+   subscriber should receive all of them.
+2. A burst of events is published in-process, faster than any socket
+   drains. Kernel buffers fill and queues hit their cap, and the
+   subscribers that fell behind are sent 'resync' instead of a growing
+   backlog.
+
+Usage: python bench_events.py [subscribers] [plays] [stalled] [burst]
+"""
+import http.client
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from adt import Song
+
+DEFAULT_SUBSCRIBERS = 200
+DEFAULT_PLAYS = 500
+DEFAULT_BURST = 10000
+DEFAULT_STALLED = 10
+SONGS = 1000
+
+
+def write_library(path):
+    songs = [Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3").to_dict() for i in range(SONGS)]
+    data = {
+        'songs': songs,
+        'playlists': {
+            'library': {'name': 'Library', 'description': '', 'created_at': '2025-01-01T00:00:00',
+                        'song_ids': [s['id'] for s in songs]},
+        },
+        'current_playlist_id': 'library'
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+class Subscriber(threading.Thread):
+    def __init__(self, port, stalled, resume):
+        super().__init__(daemon=True)
+        self.stalled = stalled
+        self.resume = resume
+        self.counts = {}
+        self.plays_done = threading.Event()
+        self.done = threading.Event()
+        self.conn = http.client.HTTPConnection('127.0.0.1', port)
+        self.conn.sock = socket.socket()
+        if stalled:
+            # Small receive window so the kernel cannot absorb the whole backlog
+            self.conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.conn.sock.connect(('127.0.0.1', port))
+        self.conn.request('GET', '/api/events')
+        self.response = self.conn.getresponse()
+
+    def run(self):
+        if self.stalled:
+            self.resume.wait()
+        while True:
+            line = self.response.fp.readline()
+            if not line:
+                break
+            if line.startswith(b'event: '):
+                event_type = line[7:].strip().decode()
+                self.counts[event_type] = self.counts.get(event_type, 0) + 1
+                if event_type == 'plays_done':
+                    self.plays_done.set()
+                elif event_type == 'done':
+                    break
+        self.done.set()
+        self.conn.close()
+
+
+def main(subscribers, plays, stalled, burst):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    write_library('playlists_data.json')
+
+    import app
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    resume = threading.Event()
+    clients = [Subscriber(port, i < stalled, resume) for i in range(subscribers)]
+    for client in clients:
+        client.start()
+    while app.broker.stats()['subscribers'] < subscribers:
+        time.sleep(0.01)
+    active = clients[stalled:]
+    print(f"{subscribers} subscribers ({stalled} stalled)")
+
+    # Phase 1: plays over HTTP
+    song_ids = [song.id for song in app.get_current_playlist().iter_songs()]
+    publisher = http.client.HTTPConnection('127.0.0.1', port)
+    start = time.perf_counter()
+    for i in range(plays):
+        publisher.request('POST', f'/api/play/{song_ids[i % len(song_ids)]}')
+        publisher.getresponse().read()
+    published = time.perf_counter()
+    app.broker.publish('plays_done', {})
+    for client in active:
+        client.plays_done.wait()
+    drained = time.perf_counter()
+    stats = app.broker.stats()
+    complete = sum(1 for c in active if c.counts.get('played') == plays and c.counts.get('playlist') == plays)
+    print(f"  {plays} plays over HTTP: {plays / (published - start):.0f} plays/s, "
+          f"{stats['delivered_count'] / (drained - start):.0f} deliveries/s")
+    print(f"    active subscribers drained {(drained - published) * 1000:.0f} ms after the last play; "
+          f"{complete}/{len(active)} received every event")
+
+    # Phase 2: in-process burst
+    peak = 0
+    bursting = True
+
+    def sample():
+        nonlocal peak
+        while bursting:
+            peak = max(peak, app.broker.stats()['pending'])
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    for i in range(burst):
+        app.broker.publish('playlist', {'playlist_id': 'library', 'version': f"burst:{i}"})
+    elapsed = time.perf_counter() - start
+    bursting = False
+    sampler.join()
+    app.broker.publish('done', {})
+    resume.set()
+    for client in clients:
+        client.done.wait()
+    stats = app.broker.stats()
+    active_resynced = sum(1 for c in active if c.counts.get('resync'))
+    stalled_resynced = sum(1 for c in clients[:stalled] if c.counts.get('resync'))
+    print(f"  burst of {burst} events in {elapsed:.2f}s ({burst / elapsed:.0f} events/s published)")
+    print(f"    resync sent to {active_resynced}/{len(active)} active and {stalled_resynced}/{stalled} stalled subscribers")
+    print(f"    peak queued events {peak}, bound {stats['max_pending_per_subscriber'] * subscribers} "
+          f"({stats['max_pending_per_subscriber']} per subscriber)")
+    server.shutdown()
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    defaults = [DEFAULT_SUBSCRIBERS, DEFAULT_PLAYS, DEFAULT_STALLED, DEFAULT_BURST]
+    main(*(args + defaults[len(args):]))
@@ -0,0 +1,86 @@
+"""Benchmark importing a collection of MP3 files.
+
+Before: one POST /api/add per file, tags read in the request thread.
+After: one POST /api/import/scan job, tags read by a thread or process
+pool and the playlist persisted once. The metadata cache is cleared
+before each run so every file is read. Files are small copies of a
+bundled track with its cover art stripped. The app runs in-process in a
+temp dir.
+
+Usage: python bench_import.py [files]
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from mutagen.id3 import ID3
+
+DEFAULT_FILES = 1000
+SAMPLE = os.path.join('static', 'music', 'Adi_Alaye.mp3')
+# Audio kept after the tag, enough for mutagen to find the first frames
+AUDIO_BYTES = 32 * 1024
+
+
+def make_template(sample, path):
+    size = ID3(sample).size
+    with open(sample, 'rb') as src, open(path, 'wb') as dst:
+        dst.write(src.read(size + AUDIO_BYTES))
+    tags = ID3(path)
+    tags.delall('APIC')
+    tags.save(path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def wait(client, job_id):
+    while True:
+        status = client.get(f'/api/import/{job_id}').get_json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.01)
+
+
+def main(n):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    os.makedirs('static/music/collection')
+    audio = make_template(os.path.join(here, SAMPLE), 'template.mp3')
+    for i in range(n):
+        with open(f'static/music/collection/{i}.mp3', 'wb') as f:
+            f.write(audio)
+
+    import app
+    client = app.app.test_client()
+    print(f"Importing {n} files of {len(audio) // 1024} KiB on {os.cpu_count()} CPUs")
+    print(f"{'path':>26} {'s':>8} {'files/s':>9}")
+
+    start = time.perf_counter()
+    for i in range(n):
+        client.post('/api/add', data={'file': (io.BytesIO(audio), f'add_{i}.mp3')},
+                    content_type='multipart/form-data')
+    elapsed = time.perf_counter() - start
+    print(f"{'POST /api/add per file':>26} {elapsed:>8.2f} {n / elapsed:>9.0f}")
+
+    for name, processes in (('scan job, threads', False), ('scan job, processes', True)):
+        app.app.config['IMPORT_PROCESSES'] = processes
+        app.metadata_cache.clear()
+        playlist_id = client.post('/api/playlists', json={'name': name}).get_json()['playlist_id']
+        start = time.perf_counter()
+        job_id = client.post('/api/import/scan', json={'directory': 'collection', 'playlist_id': playlist_id}).get_json()['job_id']
+        status = wait(client, job_id)
+        elapsed = time.perf_counter() - start
+        assert status['added'] == n, status
+        print(f"{name:>26} {elapsed:>8.2f} {n / elapsed:>9.0f}   (job reports {status['files_per_s']} files/s)")
+
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES)
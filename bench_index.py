@@ -0,0 +1,58 @@
+"""Benchmark id-based Playlist operations against a linear scan from head.
+
+Usage: python bench_index.py [sizes...]
+"""
+import random
+import sys
+import time
+
+from adt import Playlist, Song, song_key
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+LOOKUPS = 1000
+
+
+def build_playlist(n):
+    playlist = Playlist()
+    for i in range(n):
+        playlist.add_song(Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3"))
+    return playlist
+
+
+def linear_find(playlist, song_id):
+    """The pre-index lookup: walk from head comparing ids"""
+    key = song_key(song_id)
+    current = playlist.head
+    while current:
+        if current.song.key == key:
+            return current
+        current = current.next
+    return None
+
+
+def per_op_us(func, ids):
+    start = time.perf_counter()
+    for song_id in ids:
+        func(song_id)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def main(sizes):
+    print(f"{'songs':>8} {'linear scan':>12} {'favorite':>10} {'played':>10} {'move':>10} {'remove':>10}  (us/op)")
+    for n in sizes:
+        playlist = build_playlist(n)
+        ids = [node.song.id for node in playlist._index.values()]
+        sample = random.sample(ids, min(LOOKUPS, n))
+        # Keep the linear baseline affordable on large playlists
+        linear_sample = sample[:max(10, LOOKUPS * 1000 // n)]
+
+        linear = per_op_us(lambda i: linear_find(playlist, i), linear_sample)
+        favorite = per_op_us(playlist.toggle_favorite, sample)
+        played = per_op_us(playlist.mark_as_played, sample)
+        move = per_op_us(lambda i: playlist.move_song(i, 0), sample)
+        remove = per_op_us(playlist.remove_song, sample)
+        print(f"{n:>8} {linear:>12.2f} {favorite:>10.2f} {played:>10.2f} {move:>10.2f} {remove:>10.2f}")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,51 @@
+"""Benchmark positional operations on the linked list vs. the order-statistic tree backend.
+
+Usage: python bench_indexed.py [sizes...]
+"""
+import random
+import sys
+import time
+
+from adt import Playlist, IndexedPlaylist, Song
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+OPS = 200
+
+
+def build(playlist_class, n):
+    playlist = playlist_class()
+    for i in range(n):
+        playlist.add_song(Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3"))
+    return playlist
+
+
+def per_op_us(func, args):
+    start = time.perf_counter()
+    for arg in args:
+        func(*arg)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def main(sizes):
+    print(f"{'songs':>8} {'backend':>16} {'build ms':>10} {'get_at':>10} {'index_of':>10} {'insert_at':>10} {'move tail':>10}  (us/op)")
+    for n in sizes:
+        for playlist_class in (Playlist, IndexedPlaylist):
+            start = time.perf_counter()
+            playlist = build(playlist_class, n)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            positions = [(random.randrange(n),) for _ in range(OPS)]
+            ids = [(playlist.get_at(p).id,) for (p,) in positions]
+            # Drag-and-drop near the tail of the playlist
+            moves = [(random.randrange(n), n - 1 - random.randrange(10)) for _ in range(OPS)]
+            inserts = [(random.randrange(n), Song("New", "Artist", f"new/{i}.mp3")) for i in range(OPS)]
+
+            get_at = per_op_us(playlist.get_at, positions)
+            index_of = per_op_us(playlist.index_of, ids)
+            insert_at = per_op_us(playlist.insert_at, inserts)
+            move = per_op_us(playlist.move, moves)
+            print(f"{n:>8} {playlist_class.__name__:>16} {build_ms:>10.1f} {get_at:>10.2f} {index_of:>10.2f} {insert_at:>10.2f} {move:>10.2f}")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
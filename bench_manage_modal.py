@@ -0,0 +1,71 @@
+"""Benchmark opening the playlist management modal.
+
+Before: switch to the playlist, GET /api/playlist, switch back (3 requests,
+each switch persisted). After: one GET /api/playlists/<id>/songs.
+Runs the Flask app in-process against a generated library in a temp dir.
+
+Usage: python bench_manage_modal.py [songs per playlist]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from adt import Song
+
+DEFAULT_SONGS = 10000
+ROUNDS = 20
+
+
+def write_library(path, n):
+    songs = [Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3").to_dict() for i in range(2 * n)]
+    ids = [s['id'] for s in songs]
+    data = {
+        'songs': songs,
+        'playlists': {
+            'library': {'name': 'Library', 'description': '', 'created_at': '2025-01-01T00:00:00', 'song_ids': ids[:n]},
+            'other': {'name': 'Other', 'description': '', 'created_at': '2025-01-01T00:00:00', 'song_ids': ids[n:]},
+        },
+        'current_playlist_id': 'library'
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def main(n):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    write_library('playlists_data.json', n)
+
+    import app
+    app.writer.sync = True  # Persist each switch, as every mutation was before the write-behind buffer
+    client = app.app.test_client()
+
+    def before():
+        client.post('/api/playlists/other/switch')
+        client.get('/api/playlist').get_data()
+        client.post('/api/playlists/library/switch')
+        return 3
+
+    def after():
+        client.get('/api/playlists/other/songs?fields=id,title,artist').get_data()
+        return 1
+
+    print(f"Opening the management modal for a {n}-song playlist ({ROUNDS} rounds)")
+    print(f"{'path':>22} {'requests':>9} {'ms/open':>9}")
+    for name, open_modal in (('switch/read/switch', before), ('direct read', after)):
+        start = time.perf_counter()
+        requests = sum(open_modal() for _ in range(ROUNDS))
+        elapsed = (time.perf_counter() - start) / ROUNDS * 1000
+        print(f"{name:>22} {requests // ROUNDS:>9} {elapsed:>9.1f}")
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SONGS)
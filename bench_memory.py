@@ -0,0 +1,82 @@
+"""Measure memory per song with tracemalloc: the old __dict__-based Song/Node
+against the current slotted representation.
+
+Usage: python bench_memory.py [sizes...]
+"""
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from adt import Node, Playlist, Song
+
+DEFAULT_SIZES = [100000, 1000000]
+ARTISTS = 500
+
+
+class LegacySong:
+    """Song as it was before __slots__: str id, datetime timestamps"""
+
+    def __init__(self, title, artist, file_path):
+        self.id = str(uuid.uuid4())
+        self.title = title
+        self.artist = artist
+        self.file_path = file_path
+        self.added_at = datetime.now()
+        self.is_favorite = False
+        self.last_played = None
+        self.play_count = 0
+
+
+class LegacyNode:
+    def __init__(self, song):
+        self.song = song
+        self.next = None
+        self.prev = None
+
+
+def song_args(i):
+    # Artist names are built per song, as they are when parsed from tags or JSON
+    return f"Title {i}", f"Artist {i % ARTISTS}", f"music/{i}.mp3"
+
+
+def linked(song_class, node_class, n):
+    head = prev = None
+    for i in range(n):
+        node = node_class(song_class(*song_args(i)))
+        if prev:
+            prev.next = node
+            node.prev = prev
+        else:
+            head = node
+        prev = node
+    return head
+
+
+def full_playlist(n):
+    playlist = Playlist()
+    for i in range(n):
+        playlist.add_song(Song(*song_args(i)))
+    return playlist
+
+
+def bytes_per_song(build, n):
+    tracemalloc.start()
+    result = build(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / n
+
+
+def main(sizes):
+    print(f"{'songs':>8} {'legacy song+node':>17} {'slotted song+node':>18} {'saved':>7} {'full Playlist':>14}  (bytes/song)")
+    for n in sizes:
+        legacy = bytes_per_song(lambda k: linked(LegacySong, LegacyNode, k), n)
+        slotted = bytes_per_song(lambda k: linked(Song, Node, k), n)
+        full = bytes_per_song(full_playlist, n)
+        print(f"{n:>8} {legacy:>17.0f} {slotted:>18.0f} {1 - slotted / legacy:>6.0%} {full:>14.0f}")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,85 @@
+"""Benchmark the persistent metadata cache.
+
+Imports a directory of MP3 files three times into fresh playlists: with
+an empty cache (every file parsed), again with the warm cache (nothing
+parsed), and after reopening the cache file, as a restarted server
+would. Then times the background worker filling durations for songs
+stored without one. Files are full copies of a bundled track, so a parse
+costs what it does for real uploads. The app runs in-process in a temp
+dir.
+
+Usage: python bench_metadata.py [files]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+DEFAULT_FILES = 500
+SAMPLE = os.path.join('static', 'music', 'Adi_Alaye.mp3')
+
+
+def wait(client, job_id):
+    while True:
+        status = client.get(f'/api/import/{job_id}').get_json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.01)
+
+
+def main(n):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    os.makedirs('static/music/collection')
+    for i in range(n):
+        shutil.copyfile(os.path.join(here, SAMPLE), f'static/music/collection/{i}.mp3')
+
+    import app
+    from metadata import MetadataCache
+    app.app.config['IMPORT_PROCESSES'] = False
+    client = app.app.test_client()
+    size = os.path.getsize(os.path.join(here, SAMPLE))
+    print(f"Importing {n} files of {size // 1024} KiB")
+    print(f"{'run':>22} {'s':>8} {'files/s':>9} {'cached':>7}")
+
+    def run(name):
+        playlist_id = client.post('/api/playlists', json={'name': name}).get_json()['playlist_id']
+        start = time.perf_counter()
+        job_id = client.post('/api/import/scan', json={'directory': 'collection', 'playlist_id': playlist_id}).get_json()['job_id']
+        status = wait(client, job_id)
+        elapsed = time.perf_counter() - start
+        assert status['added'] == n, status
+        print(f"{name:>22} {elapsed:>8.3f} {n / elapsed:>9.0f} {status['cached']:>7}")
+
+    app.metadata_cache.clear()
+    run('cold cache')
+    run('warm cache')
+    app.metadata_cache = MetadataCache(app.METADATA_CACHE_FILE)
+    app.metadata_worker.cache = app.metadata_cache
+    run('reopened cache file')
+
+    # Durations of songs stored before they were recorded, filled in the background
+    songs = list(app.song_catalog.values())
+    for label, cache in (('worker, cold', MetadataCache()), ('worker, warm', app.metadata_cache)):
+        for song in songs:
+            song.duration = None
+        app.metadata_worker.cache = cache
+        start = time.perf_counter()
+        for song in songs:
+            app.metadata_worker.enqueue(song.key, app.static_path(song.file_path))
+        app.metadata_worker.join()
+        elapsed = time.perf_counter() - start
+        assert all(song.duration for song in songs)
+        print(f"{label:>22} {elapsed:>8.3f} {len(songs) / elapsed:>9.0f}")
+
+    print(f"cache file: {os.path.getsize(app.METADATA_CACHE_FILE) // 1024} KiB for {len(app.metadata_cache)} entries")
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES)
@@ -0,0 +1,91 @@
+"""Benchmark the title/artist search index.
+
+Builds a library of synthetic songs whose titles and artists are drawn
+from a Zipf-distributed vocabulary of pseudo-words, then times
+type-ahead (one to four letters typed), whole-word, two-word and
+playlist-filtered queries, plus a single add/remove.
+
+Usage: python bench_search.py [songs]
+"""
+import itertools
+import random
+import sys
+import time
+import tracemalloc
+
+from adt import Playlist, Song
+from search import SearchIndex
+
+DEFAULT_SONGS = 1000000
+VOCABULARY = 50000
+ARTISTS = 20000
+QUERIES = 200
+SYLLABLES = ["ka", "lo", "ve", "ri", "ma", "to", "sen", "dor", "li", "na", "fe", "qu", "zo", "bel", "ar", "mi"]
+
+
+def make_words(rng, n):
+    words = set()
+    while len(words) < n:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def zipf_picker(rng, words):
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    return lambda k: rng.choices(words, cum_weights=cum_weights, k=k)
+
+
+def timed(queries, run):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2], times[int(len(times) * 0.99)]
+
+
+def main(n):
+    rng = random.Random(42)
+    words = make_words(rng, VOCABULARY)
+    pick = zipf_picker(rng, words)
+    artists = [' '.join(w.capitalize() for w in pick(2)) for _ in range(ARTISTS)]
+    songs = [Song(' '.join(w.capitalize() for w in pick(rng.randint(1, 5))), rng.choice(artists), f"music/{i}.mp3")
+             for i in range(n)]
+
+    tracemalloc.start()
+    index = SearchIndex()
+    start = time.perf_counter()
+    for song in songs:
+        index.add(song)
+    index.search("a")  # Sorts the vocabulary once
+    build = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{n} songs indexed in {build:.1f}s, index {memory / 2**20:.0f} MiB")
+
+    playlist = Playlist()
+    for song in rng.sample(songs, min(n, 10000)):
+        playlist.add_song(song)
+
+    sample_words = pick(QUERIES)
+    cases = [(f"prefix {k} letter{'s' if k > 1 else ''}", [w[:k] for w in sample_words], {}) for k in (1, 2, 3, 4)]
+    cases += [
+        ("whole word", [w + ' ' for w in sample_words], {}),
+        ("two words", [f"{a} {b[:3]}" for a, b in zip(sample_words, pick(QUERIES))], {}),
+        ("prefix 2, playlist", [w[:2] for w in sample_words], {'accept': playlist.__contains__}),
+    ]
+    print(f"{'query':>20} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, queries, kwargs in cases:
+        p50, p99 = timed(queries, lambda q: index.search(q, 20, **kwargs))
+        print(f"{name:>20} {p50:>8.3f} {p99:>8.3f}")
+
+    extra = [Song(f"Brand New {i}", "Someone", f"new/{i}.mp3") for i in range(QUERIES)]
+    p50, p99 = timed(extra, index.add)
+    print(f"{'add':>20} {p50:>8.3f} {p99:>8.3f}")
+    p50, p99 = timed(extra, index.remove)
+    print(f"{'remove':>20} {p50:>8.3f} {p99:>8.3f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SONGS)
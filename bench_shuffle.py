@@ -0,0 +1,96 @@
+"""Benchmark shuffle mode against the destructive Playlist.shuffle().
+
+shuffle() collects every node, shuffles them and relinks the list, and
+the app then writes out the whole new order. Shuffle mode leaves the
+list alone and draws a random order one song at a time; only its seed
+and position are saved.
+
+Times are for: shuffle() plus collecting the song ids a save writes;
+turning shuffle mode on, and off after STEPS draws (which it undoes);
+next/prev while shuffling (new draws, then back through the history);
+resuming a saved seed and position on a freshly built playlist; and
+turning shuffle on after a move, which first realigns the slot array.
+Memory is the peak shuffle() allocates, what the shuffle state holds
+after STEPS songs, and the slot array every playlist keeps.
+
+Usage: python bench_shuffle.py [sizes...]
+"""
+import sys
+import time
+import tracemalloc
+
+from adt import Playlist, Song
+
+DEFAULT_SIZES = [100000, 1000000]
+STEPS = 10000
+
+
+def build(n):
+    playlist = Playlist()
+    for i in range(n):
+        playlist.add_song(Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3"))
+    return playlist
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def steps(step, count):
+    for _ in range(count):
+        step()
+
+
+def destructive(playlist):
+    playlist.shuffle()
+    return [song.id for song in playlist.iter_songs()]
+
+
+def traced_peak(func, *args):
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def traced_kept(func, *args):
+    tracemalloc.start()
+    func(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def main(sizes):
+    print(f"{'songs':>8} {'shuffle() ms':>13} {'on us':>7} {'off us':>8} {'next us':>8} {'prev us':>8} "
+          f"{'resume ms':>10} {'realign ms':>11} {'shuffle() KB':>13} {'state KB':>9} {'slots KB':>9}")
+    for n in sizes:
+        playlist = build(n)
+        shuffle_ms = timed(destructive, playlist) * 1000
+        shuffle_kb = traced_peak(destructive, playlist) / 1024
+
+        playlist = build(n)
+        on_us = timed(playlist.set_shuffle, True) * 1e6
+        next_us = timed(steps, playlist.next_song, STEPS) / STEPS * 1e6
+        prev_us = timed(steps, playlist.prev_song, STEPS) / STEPS * 1e6
+        state = playlist.shuffle_state()
+        off_us = timed(playlist.set_shuffle, False) * 1e6
+
+        resumed = build(n)
+        resume_ms = timed(lambda: resumed.set_shuffle(True, **dict(state, position=STEPS - 1))) * 1000
+        resumed.set_shuffle(False)
+        state_kb = traced_kept(lambda: (resumed.set_shuffle(True), steps(resumed.next_song, STEPS))) / 1024
+        resumed.set_shuffle(False)
+
+        playlist.move(0, n // 2)
+        realign_ms = timed(playlist.set_shuffle, True) * 1000
+        slots_kb = sys.getsizeof(playlist._slots) / 1024
+        print(f"{n:>8} {shuffle_ms:>13.1f} {on_us:>7.1f} {off_us:>8.0f} {next_us:>8.2f} {prev_us:>8.2f} "
+              f"{resume_ms:>10.1f} {realign_ms:>11.1f} {shuffle_kb:>13.0f} {state_kb:>9.0f} {slots_kb:>9.0f}")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,90 @@
+"""Benchmark smart shuffle: weighted picks from an alias table.
+
+Builds a playlist where some songs are favorites and some were played in
+the last hours, then reports the O(n) table build, picks per second
+through next_song (with and without a repeat window), the cost of the
+updates that follow a play or a new favorite, and the memory of the
+table with its node list. For comparison, "scan" is one weighted pick
+by a linear pass over every song's weight, which is what each pick
+would cost without the table.
+
+Usage: python bench_smart_shuffle.py [sizes...]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from adt import Playlist, Song, SmartShuffle, smart_weight, to_timestamp
+
+DEFAULT_SIZES = [100000, 1000000]
+PICKS = 100000
+UPDATES = 10000
+FAVORITES = 0.05
+RECENTLY_PLAYED = 0.2
+WINDOW = 100
+
+
+def build(n):
+    rng = random.Random(0)
+    now = datetime.now()
+    playlist = Playlist()
+    for i in range(n):
+        song = Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3")
+        song.is_favorite = rng.random() < FAVORITES
+        if rng.random() < RECENTLY_PLAYED:
+            song.play_count = rng.randrange(1, 50)
+            song.last_played = now - timedelta(seconds=rng.randrange(24 * 3600))
+        playlist.add_song(song)
+    return playlist
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def picks_per_s(playlist, window):
+    playlist.set_shuffle(True, window=window)
+    seconds = timed(lambda: [playlist.next_song() for _ in range(PICKS)])
+    return PICKS / seconds
+
+
+def scan_pick(songs, rng):
+    now = to_timestamp(datetime.now())
+    weights = [smart_weight(song, now) for song in songs]
+    return rng.choices(songs, weights)[0]
+
+
+def main(sizes):
+    print(f"{'songs':>8} {'build ms':>9} {'picks/s':>9} {'window ' + str(WINDOW):>11} {'scan ms':>8} "
+          f"{'played us':>10} {'favorite us':>12} {'table MB':>9}")
+    for n in sizes:
+        playlist = build(n)
+        songs = list(playlist.iter_songs())
+        build_ms = timed(lambda: playlist.set_shuffle(True, window=0)) * 1000
+        plain = picks_per_s(playlist, 0)
+        windowed = picks_per_s(playlist, WINDOW)
+        scan_ms = timed(scan_pick, songs, random.Random(0)) * 1000
+
+        # Updates after a play or a new favorite touch no table entry, so no rebuild follows
+        rng = random.Random(1)
+        ids = [songs[rng.randrange(n)].id for _ in range(UPDATES)]
+        played_us = timed(lambda: [playlist.mark_as_played(song_id) for song_id in ids]) / UPDATES * 1e6
+        ids = [song.id for song in songs if not song.is_favorite][:100]
+        favorite_us = timed(lambda: [playlist.toggle_favorite(song_id) for song_id in ids]) / len(ids) * 1e6
+        playlist.set_shuffle(False)
+
+        tracemalloc.start()
+        smart = SmartShuffle(playlist._nodes(), WINDOW)
+        table_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        del smart
+        print(f"{n:>8} {build_ms:>9.0f} {plain:>9.0f} {windowed:>11.0f} {scan_ms:>8.0f} "
+              f"{played_us:>10.2f} {favorite_us:>12.2f} {table_mb:>9.1f}")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,92 @@
+"""Benchmark Playlist.sort_by_title and sort_by_date, and key caching in Playlist.sort.
+
+Usage: python bench_sorting.py [sizes...]
+"""
+import random
+import sys
+import time
+
+from adt import Node, Playlist, Song, ASC, DESC
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+KEY_CACHE_SIZE = 100000
+
+
+def build_playlist(n):
+    playlist = Playlist()
+    for i in range(n):
+        playlist.add_song(Song(f"Song {random.randrange(n):07d}", f"Artist {i % 100}", f"music/{i}.mp3"))
+    return playlist
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def uncached_sort(playlist):
+    """The pre-caching path: linked-list merge sort recomputing the key at every comparison"""
+    key_func = lambda song: song.title.lower()
+    length = playlist.size
+    dummy = Node(None)
+    dummy.next = playlist.head
+    width = 1
+    while width < length:
+        tail = dummy
+        curr = dummy.next
+        while curr:
+            first = curr
+            second = cut(first, width)
+            curr = cut(second, width)
+            while first and second:
+                if key_func(second.song) < key_func(first.song):
+                    tail.next = second
+                    second = second.next
+                else:
+                    tail.next = first
+                    first = first.next
+                tail = tail.next
+            tail.next = first or second
+            while tail.next:
+                tail = tail.next
+        width *= 2
+    playlist.head = dummy.next
+    playlist._rebuild_links()
+
+
+def cut(head, count):
+    for _ in range(count - 1):
+        if not head:
+            return None
+        head = head.next
+    if not head:
+        return None
+    rest = head.next
+    head.next = None
+    return rest
+
+
+def compare_key_caching(n):
+    playlist = build_playlist(n)
+    print(f"\nKey caching at {n} songs")
+    print(f"{'merge sort, per-comparison key s':>34} {timed(lambda: uncached_sort(playlist)):>8.3f}")
+    playlist = build_playlist(n)
+    print(f"{'cached title key s':>34} {timed(playlist.sort_by_title):>8.3f}")
+    playlist = build_playlist(n)
+    keys = [("artist", ASC), ("title", ASC), ("play_count", DESC)]
+    print(f"{'cached artist/title/plays s':>34} {timed(lambda: playlist.sort(keys)):>8.3f}")
+
+
+def main(sizes):
+    print(f"{'songs':>8} {'by title s':>12} {'by date s':>12}")
+    for n in sizes:
+        playlist = build_playlist(n)
+        by_title = timed(playlist.sort_by_title)
+        by_date = timed(playlist.sort_by_date)
+        print(f"{n:>8} {by_title:>12.3f} {by_date:>12.3f}")
+    compare_key_caching(KEY_CACHE_SIZE)
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,111 @@
+"""Benchmark startup and per-mutation latency of the storage backends.
+
+Compares the old full-rewrite JSON save, the JSON snapshot + operation log
+store and the SQLite store.
+
+Usage: python bench_storage.py [songs]
+"""
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from adt import Playlist, Song
+from storage import JsonStore, SqliteStore
+
+DEFAULT_SONGS = 100000
+MUTATIONS = 200
+
+
+def build_data(n):
+    songs = [Song(f"Title {i}", f"Artist {i % 500}", f"music/{i}.mp3").to_dict() for i in range(n)]
+    return {
+        'songs': songs,
+        'playlists': {
+            'library': {'name': 'Library', 'description': '', 'created_at': datetime.now().isoformat(),
+                        'song_ids': [song['id'] for song in songs]}
+        },
+        'current_playlist_id': 'library'
+    }
+
+
+def startup(load):
+    """Time loading the data and building the in-memory playlists, as load_playlists() does"""
+    start = time.perf_counter()
+    data, ops = load()
+    catalog = {song_data['id']: Song.from_dict(song_data) for song_data in data['songs']}
+    for playlist_data in data['playlists'].values():
+        playlist = Playlist()
+        for song_id in playlist_data['song_ids']:
+            playlist.add_song(catalog[song_id])
+    return time.perf_counter() - start
+
+
+def per_op_ms(func, ops):
+    start = time.perf_counter()
+    for op in ops:
+        func(op)
+    return (time.perf_counter() - start) / len(ops) * 1000
+
+
+def make_ops(data):
+    song_ids = data['playlists']['library']['song_ids']
+    ops = []
+    for i in range(MUTATIONS):
+        if i % 2:
+            ops.append({'op': 'played', 'playlist_id': 'library', 'song_id': random.choice(song_ids),
+                        'play_count': i, 'last_played': datetime.now().isoformat()})
+        else:
+            ops.append({'op': 'move', 'playlist_id': 'library', 'song_id': random.choice(song_ids),
+                        'position': random.randrange(len(song_ids))})
+    return ops
+
+
+def main(n):
+    workdir = tempfile.mkdtemp()
+    try:
+        data = build_data(n)
+        ops = make_ops(data)
+        print(f"{n} songs, {MUTATIONS} mutations (played/move)")
+        print(f"{'backend':>22} {'startup s':>10} {'snapshot s':>11} {'ms/mutation':>12}")
+
+        # Old behaviour: every mutation rewrites the whole file
+        legacy_path = os.path.join(workdir, 'legacy.json')
+        def legacy_save(_op=None):
+            with open(legacy_path, 'w') as f:
+                json.dump(data, f, indent=2)
+        start = time.perf_counter()
+        legacy_save()
+        snapshot = time.perf_counter() - start
+        def legacy_load():
+            with open(legacy_path) as f:
+                return json.load(f), []
+        mutation = per_op_ms(legacy_save, ops[:10])
+        print(f"{'json full rewrite':>22} {startup(legacy_load):>10.2f} {snapshot:>11.2f} {mutation:>12.3f}")
+
+        json_store = JsonStore(os.path.join(workdir, 'store.json'), compact_every=len(ops) + 1)
+        start = time.perf_counter()
+        json_store.snapshot(data)
+        snapshot = time.perf_counter() - start
+        mutation = per_op_ms(json_store.record, ops)
+        json_startup = startup(JsonStore(json_store.path).load)
+        print(f"{'json snapshot + log':>22} {json_startup:>10.2f} {snapshot:>11.2f} {mutation:>12.3f}")
+
+        sqlite_store = SqliteStore(os.path.join(workdir, 'store.db'))
+        start = time.perf_counter()
+        sqlite_store.snapshot(data)
+        snapshot = time.perf_counter() - start
+        mutation = per_op_ms(sqlite_store.record, ops)
+        sqlite_startup = startup(SqliteStore(sqlite_store.path).load)
+        print(f"{'sqlite':>22} {sqlite_startup:>10.2f} {snapshot:>11.2f} {mutation:>12.3f}")
+        sqlite_store.conn.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SONGS)
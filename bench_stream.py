@@ -0,0 +1,159 @@
+"""Concurrent download benchmark for /api/stream.
+
+Serves the app on a local port (werkzeug's threaded server) and runs
+client threads over keep-alive connections, comparing the old
+/static/music URLs with /api/stream for:
+
+1. Full downloads, as a browser does on first play.
+2. 64 KiB Range requests at random offsets, as seeking does.
+3. Replaying songs already downloaded. /static responses carry no
+   freshness, so every replay is a conditional request (a 304 at best);
+   versioned /api/stream URLs are immutable and need no request at all.
+
+The development server reads files through Python; under a WSGI server
+with a sendfile file_wrapper (e.g. gunicorn) or with USE_X_SENDFILE, full
+/api/stream bodies are sent without copying through the interpreter.
+
+Usage: python bench_stream.py [clients] [files] [MiB per file]
+"""
+import http.client
+import io
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_CLIENTS = 8
+DEFAULT_FILES = 20
+DEFAULT_MIB = 4
+SEEKS_PER_CLIENT = 200
+RANGE_BYTES = 64 * 1024
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def run_clients(port, clients, work):
+    """Run work(conn, rng, latencies) in one thread per client; return (seconds, bytes, latencies)"""
+    totals = []
+    latencies = []
+    lock = threading.Lock()
+
+    def client(i):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        own = []
+        received = work(conn, random.Random(i), own)
+        conn.close()
+        with lock:
+            totals.append(received)
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, sum(totals), latencies
+
+
+def fetch(conn, url, headers=None):
+    conn.request('GET', url, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    return response, body
+
+
+def main(clients, files, mib):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+
+    import app
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # Serve /static from the temp dir rather than the checkout
+    app.app.static_folder = os.path.abspath('static')
+    client = app.app.test_client()
+    rng = random.Random(0)
+    for i in range(files):
+        client.post('/api/add', data={'file': (io.BytesIO(rng.randbytes(mib * 1024 * 1024)), f'track_{i}.mp3'),
+                                      'title': f'Track {i}', 'artist': 'Bench'},
+                    content_type='multipart/form-data')
+    songs = list(app.get_current_playlist().iter_songs())
+    size = mib * 1024 * 1024
+
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    # Resolve each song's versioned URL once, as the <audio> element does by following the redirect
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    redirect_ms = []
+    urls = {'/static': [], '/api/stream': []}
+    for song in songs:
+        start = time.perf_counter()
+        response, _ = fetch(conn, f'/api/stream/{song.id}')
+        redirect_ms.append((time.perf_counter() - start) * 1000)
+        urls['/api/stream'].append(response.getheader('Location'))
+        urls['/static'].append(f'/static/{song.file_path}')
+    conn.close()
+
+    print(f"{clients} clients, {files} files of {mib} MiB")
+    print(f"  unversioned -> versioned redirect: p50 {percentile(redirect_ms, 0.5):.2f} ms")
+    print(f"{'':>12} {'full MiB/s':>11} {'seeks/s':>9} {'seek p50':>9} {'seek p99':>9} {'replay requests':>16}")
+
+    for name, paths in urls.items():
+        def download(conn, rng, latencies):
+            received = 0
+            for path in rng.sample(paths, len(paths)):
+                response, body = fetch(conn, path)
+                assert response.status == 200 and len(body) == size, (response.status, len(body))
+                received += len(body)
+            return received
+        elapsed, received, _ = run_clients(port, clients, download)
+        throughput = received / (1024 * 1024) / elapsed
+
+        def seek(conn, rng, latencies):
+            received = 0
+            for _ in range(SEEKS_PER_CLIENT):
+                offset = rng.randrange(size - RANGE_BYTES)
+                start = time.perf_counter()
+                response, body = fetch(conn, rng.choice(paths),
+                                       {'Range': f'bytes={offset}-{offset + RANGE_BYTES - 1}'})
+                latencies.append((time.perf_counter() - start) * 1000)
+                assert response.status == 206 and len(body) == RANGE_BYTES, response.status
+                received += len(body)
+            return received
+        elapsed, _, latencies = run_clients(port, clients, seek)
+        seeks = clients * SEEKS_PER_CLIENT / elapsed
+
+        # A replay needs a request only if the cached response must be revalidated
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        response, _ = fetch(conn, paths[0])
+        cache_control = response.getheader('Cache-Control') or ''
+        replay_requests = 0 if 'immutable' in cache_control else len(paths)
+        if replay_requests:
+            response, _ = fetch(conn, paths[0], {'If-None-Match': response.getheader('ETag')})
+            assert response.status == 304
+        conn.close()
+
+        print(f"{name:>12} {throughput:>11.0f} {seeks:>9.0f} {percentile(latencies, 0.5):>7.2f}ms "
+              f"{percentile(latencies, 0.99):>7.2f}ms {replay_requests:>16}")
+
+    server.shutdown()
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [DEFAULT_CLIENTS, DEFAULT_FILES, DEFAULT_MIB][len(args):]))
@@ -0,0 +1,83 @@
+"""Benchmark refreshing the playlist view after a single-song change.
+
+Compares refetching GET /api/playlist with fetching GET
+/api/playlists/<id>/changes, plus an unchanged refresh that revalidates
+with If-None-Match. Runs the Flask app in-process against a generated
+library in a temp dir.
+
+Usage: python bench_sync.py [songs]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from adt import Song
+
+DEFAULT_SONGS = 10000
+ROUNDS = 20
+
+
+def write_library(path, n):
+    songs = [Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3").to_dict() for i in range(n)]
+    data = {
+        'songs': songs,
+        'playlists': {
+            'library': {'name': 'Library', 'description': '', 'created_at': '2025-01-01T00:00:00',
+                        'song_ids': [s['id'] for s in songs]},
+        },
+        'current_playlist_id': 'library'
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def main(n):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    write_library('playlists_data.json', n)
+
+    import app
+    client = app.app.test_client()
+    song_id = app.get_current_playlist().get_at(n // 2).id
+
+    def full():
+        client.post(f'/api/favorite/{song_id}')
+        return client.get('/api/playlist').get_data()
+
+    version = client.get('/api/playlist').headers['X-Playlist-Version']
+
+    def delta():
+        nonlocal version
+        client.post(f'/api/favorite/{song_id}')
+        response = client.get(f'/api/playlists/library/changes?since={version}')
+        version = response.get_json()['version']
+        return response.get_data()
+
+    etag = None
+
+    def unchanged():
+        nonlocal etag
+        if etag is None:
+            etag = client.get('/api/playlist').headers['ETag']
+        return client.get('/api/playlist', headers={'If-None-Match': etag}).get_data()
+
+    print(f"Refreshing a {n}-song playlist ({ROUNDS} rounds)")
+    print(f"{'path':>22} {'bytes':>10} {'ms':>8}")
+    for name, refresh in (('full refetch', full), ('delta', delta), ('unchanged (304)', unchanged)):
+        start = time.perf_counter()
+        sizes = [len(refresh()) for _ in range(ROUNDS)]
+        elapsed = (time.perf_counter() - start) / ROUNDS * 1000
+        print(f"{name:>22} {sum(sizes) // ROUNDS:>10} {elapsed:>8.2f}")
+    print("response cache:", app.response_cache.stats())
+    app.writer.stop()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SONGS)
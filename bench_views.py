@@ -0,0 +1,77 @@
+"""Benchmark the favorites and recently played views.
+
+Compares the previous full-list scans (kept inline as baselines) with the
+secondary indexes Playlist now maintains, on playlists where 1% of the
+songs are favorites and 10% have been played.
+
+Usage: python bench_views.py [size ...]
+"""
+import random
+import sys
+import time
+
+from adt import Playlist, Song
+
+DEFAULT_SIZES = [10000, 100000]
+ROUNDS = 20
+
+
+def scan_favorites(playlist):
+    favorites = []
+    current = playlist.head
+    while current:
+        if current.song.is_favorite:
+            favorites.append(current.song.to_dict())
+        current = current.next
+    return favorites
+
+
+def scan_recently_played(playlist, limit=20):
+    recent = []
+    current = playlist.head
+    while current:
+        if current.song.last_played_ts is not None:
+            recent.append(current.song)
+        current = current.next
+    recent.sort(key=lambda s: s.last_played_ts, reverse=True)
+    return [song.to_dict() for song in recent[:limit]]
+
+
+def build(n):
+    playlist = Playlist()
+    for i in range(n):
+        song = Song(f"Title {i}", f"Artist {i % 100}", f"music/{i}.mp3")
+        song.is_favorite = i % 100 == 0
+        if i % 10 == 0:
+            song.last_played_ts = random.uniform(0, 1e9)
+        playlist.add_song(song)
+    return playlist
+
+
+def timed(func):
+    func()  # Warm up; the first read after loading re-sorts the recency index once
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = func()
+    return (time.perf_counter() - start) / ROUNDS * 1000, result
+
+
+def main(sizes):
+    print(f"{'size':>8} {'view':>10} {'scan ms':>9} {'index ms':>9} {'speedup':>8}")
+    for n in sizes:
+        playlist = build(n)
+        for name, scan, indexed in (
+            ('favorites', lambda: scan_favorites(playlist), playlist.get_favorites),
+            ('recent', lambda: scan_recently_played(playlist), playlist.get_recently_played),
+        ):
+            scan_ms, expected = timed(scan)
+            index_ms, result = timed(indexed)
+            if name == 'recent':
+                assert result == expected
+            else:
+                assert sorted(s['id'] for s in result) == sorted(s['id'] for s in expected)
+            print(f"{n:>8} {name:>10} {scan_ms:>9.3f} {index_ms:>9.3f} {scan_ms / index_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,213 @@
+"""Load test for multi-worker mode (MULTI_WORKER=1) with one shared store.
+
+Starts 1, 2, 4, ... worker processes, each serving the app on its own
+port (werkzeug's threaded server) over one SQLite database, and drives
+them from client processes with a mixed load: playlist reads alongside
+reorders, plays, favorites and songs removed from and added back to
+other playlists. Clients spread their connections over the workers, as
+a load balancer would. Each round reports requests/s, how often workers
+caught up with others' changes (syncs), the operations they replayed and
+the playlists they had to reload whole, then checks that every worker
+serves exactly what the store holds.
+
+On a single core, added workers only add contention; the numbers show
+what keeping workers coherent costs rather than how they scale.
+
+Before multi-worker mode each process kept its own playlists and
+overwrote playlists_data.json with them, so workers diverged.
+
+Usage: python bench_workers.py [max workers] [seconds per round] [songs]
+"""
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_SECONDS = 5
+DEFAULT_SONGS = 1000
+CLIENT_PROCESSES = 4
+THREADS_PER_CLIENT = 4
+PLAYLISTS = 4
+PLAYLIST_SONGS = 200
+# (weight, operation); reads dominate, as they do for the web UI
+MIX = [(35, 'songs'), (20, 'playlist'), (15, 'playlists'), (10, 'reorder'), (5, 'play'), (5, 'favorite'),
+       (10, 'readd')]
+
+
+def seed_store(path, count):
+    """Write the shared database: a library of every song plus smaller playlists"""
+    from adt import Song
+    from storage import SqliteStore
+    songs = [Song(f"Title {i}", f"Artist {i % 50}", f"music/{i}.mp3").to_dict() for i in range(count)]
+    song_ids = [s['id'] for s in songs]
+    rng = random.Random(0)
+    playlists = {'library': {'name': 'Library', 'description': '', 'created_at': '2025-01-01T00:00:00',
+                             'song_ids': song_ids}}
+    for i in range(PLAYLISTS):
+        playlists[f'p{i}'] = {'name': f'Playlist {i}', 'description': '', 'created_at': '2025-01-01T00:00:00',
+                              'song_ids': rng.sample(song_ids, min(PLAYLIST_SONGS, count))}
+    store = SqliteStore(path)
+    store.snapshot({'songs': songs, 'playlists': playlists, 'current_playlist_id': 'library'})
+    store.conn.close()
+    return song_ids
+
+
+def serve():
+    """Worker process: serve the app on a free port and print it"""
+    import app
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    # Exit normally on terminate so the writer is stopped by atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def client(ports, seconds, seed, song_ids):
+    """Client process: run mixed traffic against the workers; print request and error counts"""
+    counts = {'requests': 0, 'errors': []}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    weights, operations = zip(*MIX)
+
+    def run(i):
+        rng = random.Random(seed * 100 + i)
+        conn = http.client.HTTPConnection('127.0.0.1', ports[(seed + i) % len(ports)])
+        requests = 0
+        errors = []
+
+        def call(method, path, body=None):
+            nonlocal requests
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            requests += 1
+            if response.status >= 500:
+                errors.append(f"{method} {path}: {response.status}")
+
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            song_id = rng.choice(song_ids)
+            playlist_id = f'p{rng.randrange(PLAYLISTS)}'
+            if operation == 'songs':
+                call('GET', f'/api/playlists/{playlist_id}/songs')
+            elif operation == 'playlist':
+                call('GET', '/api/playlist?limit=50')
+            elif operation == 'playlists':
+                call('GET', '/api/playlists')
+            elif operation == 'reorder':
+                call('POST', '/api/reorder', {'song_id': song_id, 'new_position': rng.randrange(len(song_ids))})
+            elif operation == 'play':
+                call('POST', f'/api/play/{song_id}')
+            elif operation == 'favorite':
+                call('POST', f'/api/favorite/{song_id}')
+            else:
+                call('DELETE', f'/api/playlists/{playlist_id}/songs/{song_id}')
+                call('POST', f'/api/playlists/{playlist_id}/songs', {'song_id': song_id, 'source_playlist_id': 'library'})
+        conn.close()
+        with lock:
+            counts['requests'] += requests
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(THREADS_PER_CLIENT)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(json.dumps(counts), flush=True)
+
+
+def fetch_json(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', path)
+    body = json.loads(conn.getresponse().read())
+    conn.close()
+    return body
+
+
+def check_coherent(ports, db_path):
+    """Problems where a worker serves something other than the store holds, as strings"""
+    from storage import SqliteStore
+    store = SqliteStore(db_path)
+    data, _ = store.load()
+    store.conn.close()
+    songs = {s['id']: s for s in data['songs']}
+    expected = {playlist_id: [(song_id, songs[song_id]['is_favorite'], songs[song_id]['play_count'])
+                              for song_id in playlist_data['song_ids']]
+                for playlist_id, playlist_data in data['playlists'].items()}
+    problems = []
+    for port in ports:
+        for playlist_id, entries in expected.items():
+            served = [(s['id'], s['is_favorite'], s['play_count'])
+                      for s in fetch_json(port, f'/api/playlists/{playlist_id}/songs')]
+            if served != entries:
+                problems.append(f"worker on port {port} differs from the store in {playlist_id}")
+    return problems
+
+
+def main(max_workers, seconds, count):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.symlink(os.path.join(here, 'templates'), 'templates')
+    song_ids = seed_store('playlists.db', count)
+    with open('song_ids.json', 'w') as f:
+        json.dump(song_ids, f)
+    env = dict(os.environ, MULTI_WORKER='1', PYTHONPATH=here)
+
+    print(f"{count} songs, {PLAYLISTS + 1} playlists, {CLIENT_PROCESSES}x{THREADS_PER_CLIENT} client connections, "
+          f"{seconds}s per round")
+    print(f"{'workers':>8} {'req/s':>8} {'syncs':>8} {'replayed':>9} {'reloaded':>9} {'errors':>7} {'coherent':>9}")
+    failed = False
+    workers = 1
+    while workers <= max_workers:
+        processes = [subprocess.Popen([sys.executable, __file__, 'serve'], env=env, stdout=subprocess.PIPE, text=True)
+                     for _ in range(workers)]
+        ports = [int(p.stdout.readline()) for p in processes]
+        clients = [subprocess.Popen([sys.executable, __file__, 'client', ','.join(map(str, ports)), str(seconds),
+                                     str(seed)], env=env, stdout=subprocess.PIPE, text=True)
+                   for seed in range(CLIENT_PROCESSES)]
+        results = [json.loads(c.communicate()[0]) for c in clients]
+        requests = sum(r['requests'] for r in results)
+        errors = [e for r in results for e in r['errors']]
+
+        shared = [fetch_json(port, '/api/metrics')['shared_state'] for port in ports]
+        totals = {key: sum(s[key] for s in shared) for key in ('syncs', 'ops_replayed', 'playlists_reloaded')}
+        problems = errors + check_coherent(ports, 'playlists.db')
+        print(f"{workers:>8} {requests / seconds:>8.0f} {totals['syncs']:>8} {totals['ops_replayed']:>9} "
+              f"{totals['playlists_reloaded']:>9} {len(errors):>7} {'yes' if not problems else 'NO':>9}")
+        for problem in problems[:10]:
+            print(f"    {problem}")
+        failed = failed or bool(problems)
+
+        for p in processes:
+            p.terminate()
+            p.wait()
+        workers *= 2
+
+    shutil.rmtree(workdir)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['serve']:
+        serve()
+    elif sys.argv[1:2] == ['client']:
+        with open('song_ids.json') as f:
+            client([int(p) for p in sys.argv[2].split(',')], float(sys.argv[3]), int(sys.argv[4]), json.load(f))
+    else:
+        args = [int(a) for a in sys.argv[1:]]
+        main(*(args + [DEFAULT_MAX_WORKERS, DEFAULT_SECONDS, DEFAULT_SONGS][len(args):]))
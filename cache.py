@@ -0,0 +1,79 @@
+"""Server-side cache of serialized API responses.
+
+Each body is stored under a key (the request path and query string) with
+the version token it was built from; a lookup with any other version is a
+miss, so bumping a playlist's version invalidates everything derived from
+it without tracking dependencies.
+"""
+from collections import OrderedDict
+import threading
+
+
+class ResponseCache:
+    """Byte-bounded LRU of response bodies tagged with a version"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, body)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key, version):
+        """Return the body cached for key at version, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, body):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            if len(body) > self.max_bytes:
+                return
+            self._entries[key] = (version, body)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def capture(self, key, version, chunks):
+        """Pass chunks through unchanged and cache their concatenation once exhausted"""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+            yield chunk
+        self.put(key, version, b''.join(parts))
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            requests = lookups + self.not_modified
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                # Share of body lookups answered from the cache
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                # Share of conditional reads answered without serializing
+                'served_without_serializing': round((self.hits + self.not_modified) / requests, 4) if requests else 0.0
+            }
@@ -0,0 +1,278 @@
+"""Content-addressed storage of uploaded audio files.
+
+Uploads are hashed (SHA-256) while they are copied to disk in chunks, and
+an index maps each hash to the one file holding those bytes. Uploading
+audio that is already stored, under any name, reuses the existing file;
+a different file under a taken name gets the hash appended instead of
+overwriting it. Reference counts (songs using each file) are tracked so
+files the store wrote are deleted once no song uses them.
+
+The index is saved like playlists are: each change appends one line to a
+log next to the snapshot file, and the snapshot is rewritten only every
+compact_every lines. With shared=True several processes use one index:
+changes, and lookups that miss, first catch up with the files under a
+file lock.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from locks import file_lock
+from metadata import HASH_CHUNK, content_hash
+from storage import atomic_write_json
+
+# Log lines appended before the index snapshot is rewritten
+COMPACT_EVERY = 1000
+
+
+class ContentStore:
+    def __init__(self, root, directory, index_path=None, delete_unused=True, shared=False,
+                 compact_every=COMPACT_EVERY):
+        """Files are saved under root/directory; file_paths are relative to root, e.g. music/a.mp3.
+
+        With delete_unused=False files are kept when no song uses them,
+        which is needed when other processes count references of their own.
+        shared=True needs an index_path.
+        """
+        self.root = root
+        self.directory = directory
+        self.index_path = index_path
+        self.log_path = os.path.splitext(index_path)[0] + '.log' if index_path else None
+        self.delete_unused = delete_unused
+        self.shared = shared
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        # hash -> {'file_path', 'size', 'owned'}; owned files were written by the store
+        self._by_hash = {}
+        self._by_path = {}
+        self._loaded = None  # (inode, size, mtime_ns) of the snapshot last read
+        self._log_offset = 0  # Bytes of the log applied so far
+        self._log_lines = 0
+        self._changed = set()  # Hashes whose entry changed since the last _save
+        self._load()
+        self._refs = {}  # file_path -> songs using it
+        self.uploads = 0
+        self.duplicate_uploads = 0
+        self.duplicate_bytes = 0
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def path(self, file_path):
+        return os.path.join(self.root, *file_path.split('/'))
+
+    def _load(self):
+        """Catch up with the index files: the snapshot if it was rewritten, then log lines not applied yet"""
+        if not self.index_path:
+            return
+        try:
+            st = os.stat(self.index_path)
+            stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            stamp = None
+        if stamp != self._loaded:
+            self._by_hash = {}
+            if stamp:
+                with open(self.index_path) as f:
+                    self._by_hash = json.load(f)
+            self._by_path = {entry['file_path']: digest for digest, entry in self._by_hash.items()}
+            self._loaded = stamp
+            self._log_offset = self._log_lines = 0
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # A torn final line from a crash mid-append; the next append overwrites it
+                    break
+                change = json.loads(line)
+                self._apply(change['hash'], change['entry'])
+                self._log_offset += len(line)
+                self._log_lines += 1
+
+    def _apply(self, digest, entry):
+        old = self._by_hash.pop(digest, None)
+        if old:
+            self._by_path.pop(old['file_path'], None)
+        if entry:
+            self._by_hash[digest] = entry
+            self._by_path[entry['file_path']] = digest
+
+    @contextmanager
+    def _changing(self):
+        """Hold the index file lock while changing a shared index, starting from its latest contents"""
+        if not self.shared:
+            yield
+            return
+        with file_lock(f"{self.index_path}.lock"):
+            self._load()
+            yield
+
+    def digest(self, file_path):
+        """Hash of a file the store wrote, and so never rewrites in place; None for other files"""
+        with self._lock:
+            if self.shared and file_path not in self._by_path:
+                # Maybe uploaded through another process
+                with self._changing():
+                    pass
+            digest = self._by_path.get(file_path)
+            return digest if digest and self._by_hash[digest]['owned'] else None
+
+    def save(self, stream, filename):
+        """Store an upload read from a file-like stream; return (file_path, already stored).
+
+        The caller holds a reference to the file until it calls release(),
+        whether or not a song ends up using it.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp = tempfile.mkstemp(dir=os.path.join(self.root, self.directory), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(HASH_CHUNK), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = digest.hexdigest()
+            with self._lock, self._changing():
+                self.uploads += 1
+                file_path = self._existing(digest)
+                if file_path is None:
+                    file_path = f"{self.directory}/{filename}"
+                    if os.path.exists(self.path(file_path)) and self._index(file_path) == digest:
+                        # Same bytes already on disk under this name, just not indexed before
+                        file_path = self._existing(digest)
+                    elif os.path.exists(self.path(file_path)):
+                        stem, ext = os.path.splitext(filename)
+                        file_path = f"{self.directory}/{stem}-{digest[:8]}{ext}"
+                self._refs[file_path] = self._refs.get(file_path, 0) + 1
+                if file_path in self._by_path:
+                    self.duplicate_uploads += 1
+                    self.duplicate_bytes += size
+                    self._save()
+                    return file_path, True
+                os.replace(temp, self.path(file_path))
+                temp = None
+                self._add(digest, file_path, size, owned=True)
+                self._save()
+                return file_path, False
+        finally:
+            if temp is not None:
+                os.remove(temp)
+
+    def _existing(self, digest):
+        """file_path stored for a hash, if its file is still there"""
+        entry = self._by_hash.get(digest)
+        if entry and os.path.exists(self.path(entry['file_path'])):
+            return entry['file_path']
+        return None
+
+    def _index(self, file_path):
+        """Hash and index a file already on disk; return its hash"""
+        digest = content_hash(self.path(file_path))
+        if self._existing(digest) is None:
+            self._add(digest, file_path, os.path.getsize(self.path(file_path)), owned=False)
+        return digest
+
+    def _add(self, digest, file_path, size, owned):
+        self._apply(digest, {'file_path': file_path, 'size': size, 'owned': owned})
+        self._changed.add(digest)
+
+    def _remove(self, digest):
+        self._apply(digest, None)
+        self._changed.add(digest)
+
+    def _save(self):
+        """Log the entries changed since the last call, compacting the log now and then"""
+        changed, self._changed = self._changed, set()
+        if not self.index_path or not changed:
+            return
+        lines = b''.join(json.dumps({'hash': digest, 'entry': self._by_hash.get(digest)}).encode() + b'\n'
+                         for digest in changed)
+        with open(self.log_path, 'ab') as f:
+            # Drops a torn line left by a crash
+            f.truncate(self._log_offset)
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_offset += len(lines)
+        self._log_lines += len(changed)
+        if self._log_lines >= self.compact_every:
+            atomic_write_json(self.index_path, self._by_hash)
+            st = os.stat(self.index_path)
+            self._loaded = (st.st_ino, st.st_size, st.st_mtime_ns)
+            # A crash before this only leaves lines the snapshot already covers
+            open(self.log_path, 'w').close()
+            self._log_offset = self._log_lines = 0
+
+    def index_files(self, file_paths):
+        """Hash existing files that are not indexed yet, so later uploads of them are recognized"""
+        found = []
+        for file_path in file_paths:
+            with self._lock:
+                if file_path in self._by_path:
+                    continue
+            if os.path.exists(self.path(file_path)):
+                found.append((content_hash(self.path(file_path)), file_path, os.path.getsize(self.path(file_path))))
+        # Hashed without the locks, then added at once
+        with self._lock, self._changing():
+            for digest, file_path, size in found:
+                if file_path not in self._by_path and self._existing(digest) is None:
+                    self._add(digest, file_path, size, owned=False)
+            self._save()
+
+    def reset_refs(self, file_paths):
+        """Start counting references from the file_path of every song in use"""
+        with self._lock:
+            self._refs = {}
+            for file_path in file_paths:
+                self._refs[file_path] = self._refs.get(file_path, 0) + 1
+
+    def retain(self, file_path):
+        with self._lock:
+            self._refs[file_path] = self._refs.get(file_path, 0) + 1
+
+    def release(self, file_path):
+        """Drop a reference; delete the file if the store wrote it and nothing else uses it"""
+        with self._lock:
+            refs = self._refs.get(file_path)
+            if refs is None:
+                return
+            if refs > 1:
+                self._refs[file_path] = refs - 1
+                return
+            del self._refs[file_path]
+            if not self.delete_unused:
+                return
+            with self._changing():
+                digest = self._by_path.get(file_path)
+                if digest is None or not self._by_hash[digest]['owned']:
+                    return
+                self._remove(digest)
+                self._save()
+        try:
+            os.remove(self.path(file_path))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            stored = saved = unreferenced = 0
+            for digest, entry in self._by_hash.items():
+                refs = self._refs.get(entry['file_path'], 0)
+                stored += entry['size']
+                # Each extra song using a file would otherwise have had its own copy
+                saved += entry['size'] * max(refs - 1, 0)
+                if refs == 0:
+                    unreferenced += entry['size']
+            return {
+                'files': len(self._by_hash),
+                'stored_bytes': stored,
+                'bytes_saved': saved,
+                'unreferenced_bytes': unreferenced,
+                'uploads': self.uploads,
+                'duplicate_uploads': self.duplicate_uploads,
+                'duplicate_upload_bytes': self.duplicate_bytes
+            }
@@ -0,0 +1,92 @@
+"""Server-Sent Events fan-out.
+
+Every subscriber (one per open /api/events stream) gets its own bounded
+queue. Events are serialized once per publish. A subscriber that falls
+max_pending events behind has its backlog replaced by a single 'resync'
+event, which tells the client to refetch its state. Memory per client is
+therefore bounded no matter how slowly it reads.
+"""
+from collections import deque
+import json
+import threading
+
+
+def format_event(event_type, data):
+    """Encode one event in the text/event-stream wire format"""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+RESYNC = format_event('resync', {})
+
+
+class Subscription:
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self._events = deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def offer(self, payload):
+        """Queue an event; return False if the backlog had to be dropped"""
+        with self._cond:
+            overflowed = len(self._events) >= self.max_pending
+            if overflowed:
+                self.dropped += len(self._events)
+                self._events.clear()
+                self._events.append(RESYNC)
+            else:
+                self._events.append(payload)
+            self._cond.notify()
+            return not overflowed
+
+    def next(self, timeout=None):
+        """Wait up to timeout seconds for the next event, or return None"""
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    def pending(self):
+        with self._cond:
+            return len(self._events)
+
+
+class EventBroker:
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.published_count = 0
+        self.delivered_count = 0
+        self.resync_count = 0
+
+    def subscribe(self):
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, data):
+        payload = format_event(event_type, data)
+        with self._lock:
+            self.published_count += 1
+            for subscription in self._subscribers:
+                if subscription.offer(payload):
+                    self.delivered_count += 1
+                else:
+                    self.resync_count += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published_count': self.published_count,
+                'delivered_count': self.delivered_count,
+                'resync_count': self.resync_count,
+                'pending': sum(s.pending() for s in self._subscribers),
+                'max_pending_per_subscriber': self.max_pending
+            }
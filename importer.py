@@ -0,0 +1,147 @@
+"""Bulk import of audio files.
+
+Metadata extraction runs in a worker pool while the job records progress;
+files already in the metadata cache are not read again. Adding the songs
+to a playlist and persisting is left to the caller's commit callback so
+it happens once per job.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import threading
+import time
+import uuid
+
+from metadata import read_metadata
+
+AUDIO_EXTENSIONS = ('.mp3',)
+# Files handed to a worker at a time
+CHUNK_SIZE = 32
+
+
+def song_tags(file_path, meta):
+    """Return (title, artist) from a file's metadata, falling back to its name"""
+    return (meta['title'] or os.path.splitext(os.path.basename(file_path))[0],
+            meta['artist'] or "Unknown Artist")
+
+
+def scan_directory(root, relative_to):
+    """Yield (absolute path, path relative to relative_to) for audio files under root"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(AUDIO_EXTENSIONS):
+                path = os.path.join(dirpath, filename)
+                yield path, os.path.relpath(path, relative_to).replace(os.sep, '/')
+
+
+class ImportJob:
+    """Progress of one bulk import; counters are updated from the worker thread"""
+
+    def __init__(self, playlist_id, source):
+        self.id = str(uuid.uuid4())
+        self.playlist_id = playlist_id
+        self.source = source
+        self.status = 'queued'
+        self.message = None
+        self.total = 0
+        self.processed = 0
+        self.added = 0
+        self.skipped = 0
+        self.cached = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                'id': self.id,
+                'playlist_id': self.playlist_id,
+                'source': self.source,
+                'status': self.status,
+                'message': self.message,
+                'total': self.total,
+                'processed': self.processed,
+                'added': self.added,
+                'skipped': self.skipped,
+                'cached': self.cached,
+                'elapsed_s': round(elapsed, 3),
+                'files_per_s': round(self.processed / elapsed, 1) if elapsed else 0.0
+            }
+
+    def run(self, files, is_known, commit, workers=None, processes=True, cache=None, finish=None):
+        """Import files, an iterable of (absolute path, file_path) pairs.
+
+        is_known(file_paths) returns those already in the playlist; they
+        and duplicates within files are skipped. commit(entries) receives
+        every new (file_path, title, artist, duration) at once and returns
+        how many it added; it checks again, since another import may have
+        added some meanwhile, and the rest count as skipped. With a
+        MetadataCache, only files it misses are read, and it is saved
+        afterwards. finish(), when given, runs once the job has ended,
+        whether it succeeded or not.
+        """
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+        try:
+            files = list(files)
+            known = is_known({file_path for _, file_path in files})
+            new = {}
+            for path, file_path in files:
+                if file_path not in known and file_path not in new:
+                    new[file_path] = path
+            with self._lock:
+                self.total = len(files)
+                self.skipped = len(files) - len(new)
+                self.processed = self.skipped
+
+            found = {}
+            if cache is not None:
+                for file_path, path in new.items():
+                    meta = cache.get(path)
+                    if meta is not None:
+                        found[file_path] = meta
+                with self._lock:
+                    self.cached = len(found)
+                    self.processed += len(found)
+            missing = {file_path: path for file_path, path in new.items() if file_path not in found}
+            if missing:
+                # Starting processes only pays off once there is more than a chunk to share
+                pool = ProcessPoolExecutor if processes and len(missing) > CHUNK_SIZE else ThreadPoolExecutor
+                with pool(max_workers=workers) as executor:
+                    for file_path, meta in zip(missing, executor.map(read_metadata, missing.values(), chunksize=CHUNK_SIZE)):
+                        found[file_path] = meta
+                        if cache is not None:
+                            cache.put(missing[file_path], meta)
+                        with self._lock:
+                            self.processed += 1
+                if cache is not None:
+                    cache.save()
+
+            entries = [(file_path,) + song_tags(file_path, found[file_path]) + (found[file_path]['duration'],)
+                       for file_path in new]
+            added = commit(entries)
+            with self._lock:
+                self.added = added
+                self.skipped += len(entries) - added
+                self.status = 'done'
+        except Exception as e:
+            with self._lock:
+                self.status = 'failed'
+                self.message = str(e)
+        finally:
+            with self._lock:
+                self.finished_at = time.time()
+            if finish is not None:
+                finish()
+
+    def start(self, *args, **kwargs):
+        """Run the import in a daemon thread"""
+        thread = threading.Thread(target=self.run, args=args, kwargs=kwargs,
+                                  name=f"import-{self.id[:8]}", daemon=True)
+        thread.start()
+        return thread
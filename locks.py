@@ -0,0 +1,129 @@
+"""Reader-writer locks for the in-memory playlists.
+
+Many threads may read a playlist at once while a writer has it to itself.
+Waiting writers block new readers, so a steady stream of reads cannot
+starve a mutation. The locks are reentrant per thread: a thread holding
+one, to read or write, may take it again to read, and a writer may take
+it again to write. Upgrading a read to a write is refused, since two
+threads doing so would deadlock.
+
+file_lock() serializes work across processes, e.g. worker startup.
+"""
+from contextlib import contextmanager
+import threading
+
+
+class RWLock:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {}  # thread id -> read holds
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self.contended = 0  # Acquisitions that had to wait
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me and me not in self._readers:
+                if self._writer is not None or self._waiting_writers:
+                    self.contended += 1
+                    while self._writer is not None or self._waiting_writers:
+                        self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            holds = self._readers[me] - 1
+            if holds:
+                self._readers[me] = holds
+            else:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writes += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            if self._writer is not None or self._readers:
+                self.contended += 1
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+
+    def release_write(self):
+        with self._cond:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class LockSet:
+    """Locks taken one at a time and released together, at most once, in reverse order"""
+
+    def __init__(self):
+        self._held = []
+
+    def read(self, lock):
+        lock.acquire_read()
+        self._held.append((lock, False))
+        return self
+
+    def write(self, lock):
+        lock.acquire_write()
+        self._held.append((lock, True))
+        return self
+
+    def release(self):
+        while self._held:
+            lock, write = self._held.pop()
+            if write:
+                lock.release_write()
+            else:
+                lock.release_read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path (created if missing) across processes; POSIX only"""
+    import fcntl
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
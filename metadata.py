@@ -0,0 +1,264 @@
+"""Audio metadata extraction and a persistent cache of its results.
+
+Entries are keyed by file path and stay valid while the file's size and
+mtime are unchanged. With hash_content, a file that misses by path (e.g.
+copied or re-uploaded under another name) is matched by a SHA-256 of its
+bytes before falling back to parsing it again. With shared=True several
+processes use one cache file: a miss rereads it if another process has
+rewritten it since, and saving merges this process's new entries into
+it under a file lock.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from mutagen.mp3 import MP3
+
+from locks import file_lock
+from storage import atomic_write_json
+
+# Bytes read at a time when hashing a file
+HASH_CHUNK = 1024 * 1024
+# Paths the background worker reads before reporting and saving the cache
+WORKER_BATCH = 256
+# Seconds the idle worker waits before saving entries added by lookups of its own callers
+SAVE_INTERVAL = 5.0
+
+
+def read_metadata(path):
+    """Title, artist, album, duration, bitrate, sample rate and cover presence; None where unknown"""
+    meta = {'title': None, 'artist': None, 'album': None, 'duration': None,
+            'bitrate': None, 'sample_rate': None, 'has_cover': False}
+    try:
+        audio = MP3(path)
+    except Exception:
+        # Not an MP3 mutagen can parse; nothing more to learn
+        return meta
+    meta['duration'] = round(audio.info.length, 3)
+    meta['bitrate'] = audio.info.bitrate
+    meta['sample_rate'] = audio.info.sample_rate
+    tags = audio.tags
+    if tags is not None:
+        for field, frame in (('title', 'TIT2'), ('artist', 'TPE1'), ('album', 'TALB')):
+            if frame in tags and tags[frame].text:
+                meta[field] = str(tags[frame].text[0])
+        meta['has_cover'] = bool(tags.getall('APIC'))
+    return meta
+
+
+def content_hash(path):
+    """Hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fresh(entry, st):
+    return entry is not None and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+
+
+class MetadataCache:
+    def __init__(self, path=None, hash_content=False, shared=False):
+        """shared=True needs a path"""
+        self.path = path
+        self.hash_content = hash_content
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries = {}  # file path -> {'size', 'mtime_ns', 'hash', 'meta'}
+        self._by_hash = {}  # content hash -> meta
+        self._changed = {}  # entries stored since the last save
+        self._cleared = False
+        self._dirty = False
+        self._loaded = None  # (inode, size, mtime_ns) of the cache file last read
+        self.hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        """Read the cache file if it changed since it was last read, keeping entries not saved yet"""
+        if not self.path or self._cleared:
+            return
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        if (st.st_ino, st.st_size, st.st_mtime_ns) == self._loaded:
+            return
+        with open(self.path) as f:
+            self._entries = json.load(f)
+        self._entries.update(self._changed)
+        self._by_hash = {e['hash']: e['meta'] for e in self._entries.values() if e.get('hash')}
+        self._loaded = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, file_path):
+        """Cached metadata for a file if it has not changed since, else None"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            if self.shared and not _fresh(self._entries.get(file_path), st):
+                # Maybe read by another process since
+                self._load()
+            entry = self._entries.get(file_path)
+            if _fresh(entry, st):
+                self.hits += 1
+                return entry['meta']
+        if self.hash_content:
+            digest = content_hash(file_path)
+            with self._lock:
+                meta = self._by_hash.get(digest)
+            if meta is not None:
+                self._store(file_path, st, digest, meta)
+                with self._lock:
+                    self.hash_hits += 1
+                return meta
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, file_path, meta):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+        self._store(file_path, st, content_hash(file_path) if self.hash_content else None, meta)
+
+    def _store(self, file_path, st, digest, meta):
+        with self._lock:
+            entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': digest, 'meta': meta}
+            self._entries[file_path] = self._changed[file_path] = entry
+            if digest:
+                self._by_hash[digest] = meta
+            self._dirty = True
+
+    def lookup(self, file_path):
+        """Metadata for a file, parsing and caching it on a miss"""
+        meta = self.get(file_path)
+        if meta is None:
+            meta = read_metadata(file_path)
+            self.put(file_path, meta)
+        return meta
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_hash.clear()
+            self._changed.clear()
+            self._cleared = True
+            self._dirty = True
+
+    @contextmanager
+    def _file_locked(self):
+        if not self.shared:
+            yield
+            return
+        with file_lock(f"{self.path}.lock"):
+            yield
+
+    def save(self):
+        """Write the cache file if anything changed, merged with what other processes saved when shared"""
+        if not self.path:
+            return
+        with self._file_locked():
+            with self._lock:
+                if not self._dirty:
+                    return
+                if self.shared:
+                    self._load()
+                entries = dict(self._entries)
+                changed, cleared = self._changed, self._cleared
+                self._changed = {}
+                self._cleared = False
+                self._dirty = False
+            try:
+                atomic_write_json(self.path, entries)
+            except BaseException:
+                with self._lock:
+                    # Keep them for the next save
+                    changed.update(self._changed)
+                    self._changed = changed
+                    self._cleared = self._cleared or cleared
+                    self._dirty = True
+                raise
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.hash_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'hash_hits': self.hash_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.hash_hits) / lookups, 4) if lookups else 0.0
+            }
+
+
+class MetadataWorker:
+    """Daemon thread filling the cache for queued files.
+
+    on_batch receives [(token, meta), ...] for each batch read, after
+    which the cache is saved. While idle it also saves every save_interval
+    seconds, so callers that look files up themselves need not save.
+    """
+
+    def __init__(self, cache, on_batch, save_interval=SAVE_INTERVAL):
+        self.cache = cache
+        self.on_batch = on_batch
+        self.save_interval = save_interval
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def enqueue(self, token, file_path):
+        self._queue.put((token, file_path))
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="metadata-worker", daemon=True)
+        self._thread.start()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.save_interval)]
+            except queue.Empty:
+                self._save()
+                continue
+            while len(batch) < WORKER_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.on_batch([(token, self.cache.lookup(file_path)) for token, file_path in batch])
+            except Exception as e:
+                # Keep the thread alive for later batches
+                print(f"Error reading metadata: {e}")
+            finally:
+                self._save()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _save(self):
+        try:
+            self.cache.save()
+        except Exception as e:
+            # Entries stay dirty, so the next save tries again
+            print(f"Error saving metadata cache: {e}")
+
+    def join(self):
+        """Wait until every queued file has been processed"""
+        self._queue.join()
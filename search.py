@@ -0,0 +1,187 @@
+"""In-memory full-text index over song titles and artists.
+
+Text is NFKD-normalized and casefolded, and generic combining diacritics
+are dropped, so "Beyoncé" matches "beyonce". Script-specific marks such
+as Tamil vowel signs are kept as part of their words. The last query
+word is matched as a prefix for type-ahead, against a sorted vocabulary.
+"""
+from bisect import bisect_left, insort
+import re
+import sys
+import threading
+import unicodedata
+
+# Combining Diacritical Marks and its supplements/extensions
+DIACRITICS = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+# New vocabulary words up to this many are insorted; more trigger one re-sort
+INSORT_LIMIT = 1000
+
+
+def _mark_ranges():
+    """Regex class body covering every combining mark code point"""
+    ranges = []
+    start = None
+    for cp in range(0x300, sys.maxunicode + 1):
+        is_mark = unicodedata.category(chr(cp))[0] == 'M'
+        if is_mark and start is None:
+            start = cp
+        elif not is_mark and start is not None:
+            ranges.append(f"{re.escape(chr(start))}-{re.escape(chr(cp - 1))}")
+            start = None
+    return ''.join(ranges)
+
+
+# A word is letters/digits plus any marks attached to them
+WORD = re.compile(f"[^\\W_][\\w{_mark_ranges()}]*")
+
+
+def normalize(text):
+    return DIACRITICS.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def tokenize(text):
+    return WORD.findall(normalize(text))
+
+
+class SearchIndex:
+    """Inverted index from words to song keys, one posting map per field"""
+
+    def __init__(self):
+        self._songs = {}   # song.key -> Song
+        self._words = {}   # song.key -> (title words, artist words)
+        self._title = {}   # word -> set of song keys
+        self._artist = {}
+        self._known = set()  # Every word ever indexed, including ones no longer in use
+        self._vocab = []     # Sorted known words, except those in _new_words; replaced, never changed
+        self._new_words = set()
+        # Searches share a read lock, and the first after new words sorts them in
+        self._vocab_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._songs)
+
+    def add(self, song):
+        if song.key in self._songs:
+            return
+        title_words, artist_words = tuple(set(tokenize(song.title))), tuple(set(tokenize(song.artist)))
+        self._songs[song.key] = song
+        self._words[song.key] = (title_words, artist_words)
+        for postings, words in ((self._title, title_words), (self._artist, artist_words)):
+            for word in words:
+                keys = postings.get(word)
+                if keys is None:
+                    postings[word] = keys = set()
+                    if word not in self._known:
+                        self._known.add(word)
+                        self._new_words.add(word)
+                keys.add(song.key)
+
+    def remove(self, song):
+        if self._songs.pop(song.key, None) is None:
+            return
+        title_words, artist_words = self._words.pop(song.key)
+        for postings, words in ((self._title, title_words), (self._artist, artist_words)):
+            for word in words:
+                keys = postings[word]
+                keys.discard(song.key)
+                if not keys:
+                    # The word stays in the vocabulary; lookups skip it
+                    del postings[word]
+
+    def _sorted_vocab(self):
+        with self._vocab_lock:
+            if not self._new_words:
+                return self._vocab
+            if len(self._new_words) > INSORT_LIMIT:
+                vocab = sorted(self._known)
+            else:
+                # A copy, since other searches may still be reading the old list
+                vocab = list(self._vocab)
+                for word in self._new_words:
+                    insort(vocab, word)
+            self._vocab = vocab
+            self._new_words = set()
+            return vocab
+
+    def _completions(self, prefix):
+        """Vocabulary words starting with prefix, in alphabetical order"""
+        vocab = self._sorted_vocab() if self._new_words else self._vocab
+        for i in range(bisect_left(vocab, prefix), len(vocab)):
+            if not vocab[i].startswith(prefix):
+                break
+            yield vocab[i]
+
+    def search(self, query, limit=20, accept=None):
+        """Songs matching every word of query, best first.
+
+        The last word matches as a prefix unless the query ends with
+        whitespace. accept(song), when given, filters candidates (e.g. to
+        one playlist). Results come in tiers: songs with every word in the
+        title, then those needing the artist for the last word, then the
+        rest; exact words come before completions for single words. Each
+        tier is scanned only until limit songs are found.
+        """
+        words = tokenize(query)
+        if not words or limit <= 0:
+            return []
+        prefix = None if query[-1:].isspace() else words.pop()
+
+        if not words:
+            return self._search_word(lambda: self._completions(prefix), limit, accept)
+        if prefix is None and len(words) == 1:
+            return self._search_word(lambda: words, limit, accept)
+
+        empty = frozenset()
+        title_sets = sorted((self._title.get(w, empty) for w in words), key=len)
+        in_title = title_sets[0].intersection(*title_sets[1:])
+        completions = set(self._completions(prefix)) if prefix is not None else None
+
+        # Tiers: 0 = everything in the title, 1 = the last word only in the artist
+        tiers = ([], [])
+        for key in in_title:
+            title_words, artist_words = self._words[key]
+            if completions is None or not completions.isdisjoint(title_words):
+                tier = 0
+            elif not completions.isdisjoint(artist_words):
+                tier = 1
+            else:
+                continue
+            song = self._songs[key]
+            if accept is None or accept(song):
+                tiers[tier].append(song)
+                if len(tiers[0]) >= limit:
+                    return tiers[0]
+        results = (tiers[0] + tiers[1])[:limit]
+        if len(results) >= limit:
+            return results
+
+        # Then songs with some of the full words only in the artist
+        matching = sorted((self._title.get(w, empty) | self._artist.get(w, empty) for w in words), key=len)
+        for key in matching[0].intersection(*matching[1:]) - in_title:
+            title_words, artist_words = self._words[key]
+            if completions is not None and completions.isdisjoint(title_words) and completions.isdisjoint(artist_words):
+                continue
+            song = self._songs[key]
+            if accept is None or accept(song):
+                results.append(song)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _search_word(self, variants, limit, accept):
+        """Title matches, then artist matches, for each word variants() yields, in order"""
+        results = []
+        seen = set()
+        for postings in (self._title, self._artist):
+            for variant in variants():
+                for key in postings.get(variant, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    song = self._songs[key]
+                    if accept is None or accept(song):
+                        results.append(song)
+                        if len(results) >= limit:
+                            return results
+        return results
@@ -39,10 +39,15 @@ document.addEventListener('DOMContentLoaded', () => {
     let isRepeatOn = false;
     let isShuffleOn = false;
 
+    // File of the loaded track; songs in other playlists may share it
+    let currentFilePath = null;
+
+    // Local copy of the current playlist, kept up to date with /changes
+    let syncedPlaylist = null; // { id, version, songs }
+
     // Fetch and render playlist
     async function loadPlaylist() {
-        const response = await fetch('/api/playlist');
-        const songs = await response.json();
+        const songs = await syncPlaylist();
         renderPlaylist(songs);
         // Only load current song if not already playing or set
         if (!audioPlayer.src) {
@@ -50,6 +55,46 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Fetch only what changed since the last load, falling back to the full list
+    async function syncPlaylist() {
+        if (syncedPlaylist) {
+            const response = await fetch(`/api/playlists/${syncedPlaylist.id}/changes?since=${encodeURIComponent(syncedPlaylist.version)}`);
+            if (response.ok) {
+                const delta = await response.json();
+                if (delta.current) {
+                    syncedPlaylist.songs = delta.snapshot || applyChanges(syncedPlaylist.songs, delta.ops);
+                    syncedPlaylist.version = delta.version;
+                    return syncedPlaylist.songs;
+                }
+            }
+        }
+        const response = await fetch('/api/playlist');
+        const songs = await response.json();
+        const id = response.headers.get('X-Playlist-Id');
+        syncedPlaylist = id ? { id, version: response.headers.get('X-Playlist-Version'), songs } : null;
+        return songs;
+    }
+
+    function applyChanges(songs, ops) {
+        songs = songs.slice();
+        ops.forEach(op => {
+            if (op.op === 'add') {
+                songs.splice(op.position, 0, op.song);
+            } else if (op.op === 'remove') {
+                songs = songs.filter(song => song.id !== op.id);
+            } else if (op.op === 'move') {
+                const index = songs.findIndex(song => song.id === op.id);
+                if (index !== -1) songs.splice(op.position, 0, songs.splice(index, 1)[0]);
+            } else if (op.op === 'update') {
+                songs = songs.map(song => song.id === op.song.id ? op.song : song);
+            } else if (op.op === 'order') {
+                const byId = new Map(songs.map(song => [song.id, song]));
+                songs = op.ids.map(id => byId.get(id));
+            }
+        });
+        return songs;
+    }
+
     // Load and display playlists in sidebar
     let currentPlaylists = []; // Store current playlists for reference
     
@@ -166,24 +211,15 @@ document.addEventListener('DOMContentLoaded', () => {
         playlistManagementModal.classList.remove('hidden');
     }
 
+    // Read another playlist's songs without switching the active playlist
+    async function fetchPlaylistSongs(playlistId) {
+        const response = await fetch(`/api/playlists/${playlistId}/songs?fields=id,title,artist`);
+        return response.json();
+    }
+
     async function loadPlaylistSongs(playlistId) {
         try {
-            // Switch to the playlist temporarily to get its songs
-            const currentPlaylist = currentPlaylists.find(p => p.is_current);
-            const currentId = currentPlaylist ? currentPlaylist.id : null;
-            
-            // Switch to target playlist
-            await fetch(`/api/playlists/${playlistId}/switch`, { method: 'POST' });
-            
-            // Get songs
-            const response = await fetch('/api/playlist');
-            const songs = await response.json();
-            
-            // Switch back to original playlist
-            if (currentId && currentId !== playlistId) {
-                await fetch(`/api/playlists/${currentId}/switch`, { method: 'POST' });
-            }
-            
+            const songs = await fetchPlaylistSongs(playlistId);
             renderManagePlaylistSongs(songs);
         } catch (error) {
             console.error('Error loading playlist songs:', error);
@@ -272,21 +308,7 @@ document.addEventListener('DOMContentLoaded', () => {
     async function loadAvailableSongs(sourcePlaylistId) {
         try {
             // Get songs from source playlist
-            const currentPlaylist = currentPlaylists.find(p => p.is_current);
-            const currentId = currentPlaylist ? currentPlaylist.id : null;
-            
-            // Switch to source playlist
-            await fetch(`/api/playlists/${sourcePlaylistId}/switch`, { method: 'POST' });
-            
-            // Get songs
-            const response = await fetch('/api/playlist');
-            const songs = await response.json();
-            
-            // Switch back
-            if (currentId) {
-                await fetch(`/api/playlists/${currentId}/switch`, { method: 'POST' });
-            }
-            
+            const songs = await fetchPlaylistSongs(sourcePlaylistId);
             renderAvailableSongs(songs, sourcePlaylistId);
         } catch (error) {
             console.error('Error loading available songs:', error);
@@ -442,6 +464,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (response.ok) {
                 loadPlaylists(); // Refresh playlist list
                 loadPlaylist();  // Refresh current playlist view
+                loadShuffleMode();
                 
                 // Update navigation state
                 libraryNav.classList.remove('active');
@@ -462,10 +485,11 @@ document.addEventListener('DOMContentLoaded', () => {
             li.className = 'playlist-item';
             li.draggable = true;
             li.dataset.songId = song.id;
+            li.dataset.filePath = song.file_path;
             li.dataset.index = index;
             
             // Highlight current song
-            if (audioPlayer.src && audioPlayer.src.includes(song.file_path)) {
+            if (song.file_path === currentFilePath) {
                 li.classList.add('active');
             }
 
@@ -506,6 +530,13 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // Update the active row in place instead of refetching the playlist
+    function highlightActiveSong() {
+        playlistList.querySelectorAll('.playlist-item').forEach(li => {
+            li.classList.toggle('active', li.dataset.filePath === currentFilePath);
+        });
+    }
+
     async function loadCurrentSong(autoPlay = false) {
         const response = await fetch('/api/current');
         const song = await response.json();
@@ -519,9 +550,8 @@ document.addEventListener('DOMContentLoaded', () => {
             currentSongId = song.id;
             hasMarkedAsPlayed = false;
 
-            const songUrl = `/static/${song.file_path}`;
-            if (!audioPlayer.src.includes(songUrl)) {
-                audioPlayer.src = songUrl;
+            if (song.file_path !== currentFilePath) {
+                loadAudio(song);
                 if (autoPlay) {
                     audioPlayer.play();
                     isPlaying = true;
@@ -531,15 +561,14 @@ document.addEventListener('DOMContentLoaded', () => {
             currentTitle.textContent = "Select a song";
             currentArtist.textContent = "--";
             audioPlayer.src = "";
+            currentFilePath = null;
             isPlaying = false;
             currentSongId = null;
         }
         updatePlayButton();
 
-        // Re-render list to update active state
-        // Optimize: don't fetch again, just update classes? 
-        // For prototype, fetching is fine.
-        fetch('/api/playlist').then(r => r.json()).then(renderPlaylist);
+        // Update active state of the rendered list
+        highlightActiveSong();
     }
 
     function playSong(song) {
@@ -548,14 +577,13 @@ document.addEventListener('DOMContentLoaded', () => {
         currentSongId = song.id;
         hasMarkedAsPlayed = false;
 
-        const songUrl = `/static/${song.file_path}`;
-        audioPlayer.src = songUrl;
+        loadAudio(song);
         audioPlayer.play();
         isPlaying = true;
         updatePlayButton();
 
-        // Re-render list to update active state
-        fetch('/api/playlist').then(r => r.json()).then(renderPlaylist);
+        // Update active state of the rendered list
+        highlightActiveSong();
     }
 
     // Controls
@@ -629,6 +657,20 @@ document.addEventListener('DOMContentLoaded', () => {
         totalTimeEl.textContent = formatTime(duration);
     });
 
+    // /api/stream redirects to a content-versioned URL the browser may cache
+    // forever, and serves byte ranges so seeking does not refetch the file
+    function loadAudio(song) {
+        audioPlayer.src = `/api/stream/${song.id}`;
+        currentFilePath = song.file_path;
+        showDuration(song);
+    }
+
+    // Length known from the server, shown until the audio's own metadata loads
+    function showDuration(song) {
+        currentTimeEl.textContent = formatTime(0);
+        totalTimeEl.textContent = song.duration ? formatTime(song.duration) : formatTime(0);
+    }
+
     function formatTime(seconds) {
         const min = Math.floor(seconds / 60);
         const sec = Math.floor(seconds % 60);
@@ -662,15 +704,24 @@ document.addEventListener('DOMContentLoaded', () => {
         updatePlayerUI(song, true);
     });
 
+    // Shuffle mode plays in random order without reordering the playlist
+    function showShuffleMode(enabled) {
+        isShuffleOn = enabled;
+        shuffleBtn.classList.toggle('active', enabled);
+    }
+
+    async function loadShuffleMode() {
+        const response = await fetch('/api/shuffle/mode');
+        if (response.ok) showShuffleMode((await response.json()).enabled);
+    }
+
     shuffleBtn.addEventListener('click', async () => {
-        isShuffleOn = !isShuffleOn;
-        shuffleBtn.classList.toggle('active');
-        
-        if (isShuffleOn) {
-            // Shuffle the playlist
-            await fetch('/api/shuffle', { method: 'POST' });
-            loadPlaylist();
-        }
+        const response = await fetch('/api/shuffle/mode', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ enabled: !isShuffleOn })
+        });
+        if (response.ok) showShuffleMode((await response.json()).enabled);
     });
 
     repeatBtn.addEventListener('click', () => {
@@ -687,15 +738,18 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     // Sorting
-    sortTitleBtn.addEventListener('click', async () => {
-        await fetch('/api/sort/title', { method: 'POST' });
+    async function sortPlaylist(keys) {
+        await fetch('/api/sort', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ keys })
+        });
         loadPlaylist();
-    });
+    }
 
-    sortDateBtn.addEventListener('click', async () => {
-        await fetch('/api/sort/date', { method: 'POST' });
-        loadPlaylist();
-    });
+    sortTitleBtn.addEventListener('click', () => sortPlaylist([['title', 'asc']]));
+
+    sortDateBtn.addEventListener('click', () => sortPlaylist([['added_at', 'desc']]));
 
     // Add Song Modal
     addSongBtn.addEventListener('click', () => {
@@ -724,6 +778,48 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Error pages from the server or a proxy (e.g. a 413) may not be JSON
+    async function readResult(response) {
+        try {
+            return await response.json();
+        } catch (error) {
+            return { success: false, message: `Upload failed (${response.status} ${response.statusText})` };
+        }
+    }
+
+    // Upload several files as one background import and wait for it to finish
+    async function importFiles(files) {
+        const formData = new FormData();
+        Array.from(files).forEach(file => formData.append('files', file));
+
+        try {
+            const response = await fetch('/api/import', { method: 'POST', body: formData });
+            const result = await readResult(response);
+            if (!response.ok || !result.success) {
+                alert(result.message || 'Failed to upload songs');
+                return;
+            }
+            addModal.classList.add('hidden');
+            addSongForm.reset();
+
+            let status;
+            do {
+                await new Promise(resolve => setTimeout(resolve, 500));
+                status = await (await fetch(`/api/import/${result.job_id}`)).json();
+            } while (status.status === 'queued' || status.status === 'running');
+
+            loadPlaylist();
+            if (status.status === 'done') {
+                alert(`Imported ${status.added} songs (${status.skipped} already in the playlist)`);
+            } else {
+                alert(status.message || 'Import failed');
+            }
+        } catch (error) {
+            console.error('Error importing songs:', error);
+            alert('Error importing songs. Please try again.');
+        }
+    }
+
     addSongForm.addEventListener('submit', async (e) => {
         e.preventDefault();
 
@@ -733,6 +829,11 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
+        if (fileInput.files.length > 1) {
+            importFiles(fileInput.files);
+            return;
+        }
+
         const formData = new FormData();
         formData.append('title', document.getElementById('title').value);
         formData.append('artist', document.getElementById('artist').value);
@@ -744,7 +845,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: formData
             });
 
-            const result = await response.json();
+            const result = await readResult(response);
 
             if (response.ok && result.success) {
                 addModal.classList.add('hidden');
@@ -873,6 +974,39 @@ document.addEventListener('DOMContentLoaded', () => {
     // Initial Load
     loadPlaylists();
     loadPlaylist();
+    loadShuffleMode();
+
+    // Live updates from other tabs and devices
+    const serverEvents = new EventSource('/api/events');
+    const showingPlaylist = () => currentView === 'library' || currentView === 'playlist';
+
+    serverEvents.addEventListener('playlist', (e) => {
+        const change = JSON.parse(e.data);
+        if (showingPlaylist() && syncedPlaylist && change.playlist_id === syncedPlaylist.id
+                && change.version !== syncedPlaylist.version) {
+            loadPlaylist();
+        }
+    });
+
+    // Sent after structural changes, switches, and when this client fell too far behind
+    ['playlists', 'resync'].forEach(type => serverEvents.addEventListener(type, () => {
+        loadPlaylists();
+        if (showingPlaylist()) loadPlaylist();
+        loadShuffleMode();
+    }));
+
+    serverEvents.addEventListener('now_playing', (e) => {
+        const { song } = JSON.parse(e.data);
+        // Don't interrupt what this tab is playing
+        if (song && audioPlayer.paused) {
+            updatePlayerUI(song, false);
+            highlightActiveSong();
+        }
+    });
+
+    serverEvents.addEventListener('played', () => {
+        if (currentView === 'recent') recentNav.click();
+    });
 
     // Drag and Drop functionality
     let draggedElement = null;
@@ -0,0 +1,719 @@
+"""Playlist persistence backends.
+
+Both stores share one interface used by app.py: load() returns the
+snapshot dict (the playlists_data.json layout: a 'songs' list holding each
+song once and per-playlist 'song_ids') plus operations to replay,
+record(op) persists a single-song mutation, and snapshot(data) replaces
+the whole state after structural changes such as shuffle or sort.
+
+The SQLite store can also be shared by several worker processes: it
+keeps version stamps per playlist so each process can tell which
+playlists others changed (see SqliteStore.stale_scopes).
+"""
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Write JSON to a temp file and rename it over path so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JsonStore:
+    """Snapshot file plus write-ahead log of single-song operations.
+
+    Every mutation is appended to the log as one JSON line tagged with a
+    sequence number. snapshot() writes the full state atomically, records
+    the last sequence number it covers and truncates the log, so a crash
+    between the two steps only leaves records that load() skips.
+    """
+
+    def __init__(self, path, compact_every=1000, fsync=False):
+        self.path = path
+        self.log_path = os.path.splitext(path)[0] + '.log'
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.seq = 0
+        self.pending = 0  # Operations logged since the last snapshot
+        self._log = None
+
+    def load(self):
+        """Return (snapshot data or None, operations to replay on top of it)"""
+        data = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+
+        snapshot_seq = data.get('log_seq', 0) if data else 0
+        ops = [op for op in self._read_log() if op['seq'] > snapshot_seq]
+        self.seq = ops[-1]['seq'] if ops else snapshot_seq
+        self.pending = len(ops)
+        return data, ops
+
+    def _read_log(self):
+        if not os.path.exists(self.log_path):
+            return []
+        ops = []
+        with open(self.log_path, 'r') as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final record from a crash mid-append
+                    break
+        return ops
+
+    def record(self, op):
+        """Append one operation to the log"""
+        if self._log is None:
+            self._log = open(self.log_path, 'a')
+        self.seq += 1
+        self._log.write(json.dumps(dict(op, seq=self.seq)) + '\n')
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self.pending += 1
+
+    def needs_compaction(self):
+        return self.pending >= self.compact_every
+
+    def snapshot(self, data):
+        """Atomically write the full state and start a fresh log"""
+        atomic_write_json(self.path, dict(data, log_seq=self.seq), indent=2)
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self.log_path, 'w')
+        self.pending = 0
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    added_at TEXT NOT NULL,
+    is_favorite INTEGER NOT NULL DEFAULT 0,
+    last_played TEXT,
+    play_count INTEGER NOT NULL DEFAULT 0,
+    duration REAL,
+    changed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    sort_order INTEGER NOT NULL,
+    shuffle_seed INTEGER,
+    shuffle_position INTEGER,
+    shuffle_window INTEGER
+);
+CREATE TABLE IF NOT EXISTS playlist_entries (
+    playlist_id TEXT NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+    song_id TEXT NOT NULL REFERENCES songs(id),
+    position REAL NOT NULL,
+    PRIMARY KEY (playlist_id, song_id)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    scope TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    op TEXT NOT NULL,
+    PRIMARY KEY (scope, version)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_order ON playlist_entries(playlist_id, position);
+CREATE INDEX IF NOT EXISTS idx_entries_song ON playlist_entries(song_id);
+CREATE INDEX IF NOT EXISTS idx_songs_file_path ON songs(file_path);
+CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs(artist);
+CREATE INDEX IF NOT EXISTS idx_songs_last_played ON songs(last_played);
+"""
+
+SONG_COLUMNS = ("id", "title", "artist", "file_path", "added_at", "is_favorite", "last_played", "play_count",
+                "duration")
+# Upsert clause for songs that may already be stored: they only gain a missing duration
+KEEP_SONG_FIELDS = "duration = COALESCE(songs.duration, excluded.duration)"
+# Version stamp scopes of the playlist list, names and current playlist, and
+# of song fields (favorite, plays, duration); every other scope is a playlist id
+REGISTRY = ''
+SONGS = '*songs'
+# Single-song playlist operations kept per playlist, so other processes
+# can replay what they missed instead of reloading the whole playlist
+CHANGE_FEED_SIZE = 1000
+
+
+class SqliteStore:
+    """SQLite store applying every operation in place.
+
+    Songs are stored once by id, matching the shared song catalog, and
+    ordered per playlist through
+    playlist_entries.position, a REAL key: moving a song only rewrites its
+    own key to the midpoint of its new neighbours. The playlist is
+    renumbered in the rare case the float gap is exhausted.
+
+    Every write bumps the version stamp of each playlist it changes (and
+    of REGISTRY for the playlist list) in the same transaction. The store
+    remembers the stamp this process's in-memory state matches, advancing
+    it on its own writes only when nobody else wrote in between, so other
+    processes' changes always show up as stale scopes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # Separate connection for reading what other processes wrote, so
+        # reads never see this process's uncommitted writes
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._seen = {}  # scope -> version the in-memory state matches
+        self._seen_lock = threading.Lock()
+        self._data_version = None
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(songs)")}
+        if 'duration' not in columns:
+            # Databases created before durations were stored
+            self.conn.execute("ALTER TABLE songs ADD COLUMN duration REAL")
+        if 'changed' not in columns:
+            # SONGS stamp of each song's last field change, for reading only the changed songs
+            self.conn.execute("ALTER TABLE songs ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_changed ON songs(changed)")
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(playlists)")}
+        if 'shuffle_seed' not in columns:
+            # Databases created before shuffle mode
+            self.conn.execute("ALTER TABLE playlists ADD COLUMN shuffle_seed INTEGER")
+            self.conn.execute("ALTER TABLE playlists ADD COLUMN shuffle_position INTEGER")
+        if 'shuffle_window' not in columns:
+            # Databases created before smart shuffle
+            self.conn.execute("ALTER TABLE playlists ADD COLUMN shuffle_window INTEGER")
+        self.conn.commit()
+
+    def load(self):
+        """Return (snapshot data or None if the database is empty, no operations)"""
+        cur = self.conn.cursor()
+        # One read transaction, so the data matches the version stamps read with it
+        cur.execute("BEGIN")
+        try:
+            versions = dict(cur.execute("SELECT scope, version FROM versions"))
+            playlist_rows = cur.execute(
+                "SELECT id, name, description, created_at, shuffle_seed, shuffle_position, shuffle_window "
+                "FROM playlists ORDER BY sort_order").fetchall()
+            if not playlist_rows:
+                return None, []
+
+            songs = [song_row(row) for row in cur.execute(f"SELECT {', '.join(SONG_COLUMNS)} FROM songs")]
+
+            playlists_data = {}
+            for playlist_id, name, description, created_at, *shuffle in playlist_rows:
+                song_ids = [r[0] for r in cur.execute(
+                    "SELECT song_id FROM playlist_entries WHERE playlist_id = ? ORDER BY position", (playlist_id,))]
+                playlists_data[playlist_id] = {
+                    'name': name,
+                    'description': description,
+                    'created_at': created_at,
+                    'song_ids': song_ids,
+                    'shuffle': shuffle_state(*shuffle)
+                }
+
+            row = cur.execute("SELECT value FROM meta WHERE key = 'current_playlist_id'").fetchone()
+        finally:
+            self.conn.commit()
+        with self._seen_lock:
+            self._seen = versions
+        return {
+            'songs': songs,
+            'playlists': playlists_data,
+            'current_playlist_id': row[0] if row else None
+        }, []
+
+    def _upsert_songs(self, songs, updates=None):
+        if updates is None:
+            updates = ', '.join(f"{c} = excluded.{c}" for c in SONG_COLUMNS[1:])
+        self.conn.executemany(
+            f"INSERT INTO songs ({', '.join(SONG_COLUMNS)}) VALUES ({', '.join('?' * len(SONG_COLUMNS))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}",
+            [tuple(song.get(c) for c in SONG_COLUMNS) for song in songs])
+
+    def _move_key(self, playlist_id, song_id, position):
+        """Ordering key placing song_id at the 0-indexed position among the other entries"""
+        rows = self.conn.execute(
+            "SELECT position FROM playlist_entries WHERE playlist_id = ? AND song_id <> ? "
+            "ORDER BY position LIMIT 2 OFFSET ?",
+            (playlist_id, song_id, max(position - 1, 0))).fetchall()
+        keys = [r[0] for r in rows]
+        if not keys:
+            return self._append_key(playlist_id)
+        if position <= 0:
+            return keys[0] - 1.0
+        if len(keys) == 1:
+            return keys[0] + 1.0
+        key = (keys[0] + keys[1]) / 2
+        if keys[0] < key < keys[1]:
+            return key
+        self._renumber(playlist_id)
+        return self._move_key(playlist_id, song_id, position)
+
+    def _append_key(self, playlist_id):
+        row = self.conn.execute(
+            "SELECT MAX(position) FROM playlist_entries WHERE playlist_id = ?", (playlist_id,)).fetchone()
+        return (row[0] or 0.0) + 1.0
+
+    def _renumber(self, playlist_id):
+        song_ids = [r[0] for r in self.conn.execute(
+            "SELECT song_id FROM playlist_entries WHERE playlist_id = ? ORDER BY position", (playlist_id,))]
+        self.conn.executemany(
+            "UPDATE playlist_entries SET position = ? WHERE playlist_id = ? AND song_id = ?",
+            [(float(i), playlist_id, song_id) for i, song_id in enumerate(song_ids, 1)])
+
+    def _bump(self, scopes):
+        """Bump the version stamps of scopes; returns [(scope, new version)]"""
+        return [(scope, self.conn.execute(
+            "INSERT INTO versions (scope, version) VALUES (?, 1) "
+            "ON CONFLICT(scope) DO UPDATE SET version = version + 1 RETURNING version", (scope,)).fetchone()[0])
+            for scope in scopes]
+
+    def _log_change(self, op, version):
+        self.conn.execute("INSERT OR REPLACE INTO changes (scope, version, op) VALUES (?, ?, ?)",
+                          (op['playlist_id'], version, json.dumps(op)))
+        self.conn.execute("DELETE FROM changes WHERE scope = ? AND version <= ?",
+                          (op['playlist_id'], version - CHANGE_FEED_SIZE))
+
+    def _advance(self, bumped):
+        """After committing this process's write, move its seen stamps past it if nothing else intervened"""
+        with self._seen_lock:
+            for scope, version in bumped:
+                if self._seen.get(scope, 0) == version - 1:
+                    self._seen[scope] = version
+                elif scope not in (REGISTRY, SONGS):
+                    # The in-memory playlist already holds this operation but not
+                    # the ones before it, so replaying the feed would apply it
+                    # twice: only a full reload brings it back in line
+                    self._seen[scope] = -1
+
+    def record(self, op):
+        """Apply one operation to the database in its own transaction"""
+        with self.conn:
+            # Take the write lock up front: the operation reads positions and stamps before writing
+            self.conn.execute("BEGIN IMMEDIATE")
+            kind = op['op']
+            if kind == 'switch':
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('current_playlist_id', ?)",
+                    (op['playlist_id'],))
+                bumped = self._bump([REGISTRY])
+            elif kind == 'shuffle':
+                # Like the current song, the shuffle cursor belongs to each process: nothing to bump
+                self.conn.execute(
+                    "UPDATE playlists SET shuffle_seed = ?, shuffle_position = ?, shuffle_window = ? WHERE id = ?",
+                    (op.get('seed'), op.get('position'), op.get('window'), op['playlist_id']))
+                bumped = []
+            elif kind == 'replace':
+                bumped = self._replace(op)
+            elif kind in ('favorite', 'played', 'duration'):
+                # Song fields are not part of any playlist's stamp: other processes reread only changed songs
+                bumped = self._bump([SONGS])
+                self.conn.execute("UPDATE songs SET changed = ? WHERE id = ?", (bumped[0][1], op['song_id']))
+            else:
+                bumped = self._bump([op['playlist_id']])
+                self._log_change(op, bumped[0][1])
+            if kind == 'add':
+                # A song shared from another playlist keeps its stored favorite and play fields
+                self._upsert_songs([op['song']], KEEP_SONG_FIELDS)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO playlist_entries (playlist_id, song_id, position) VALUES (?, ?, ?)",
+                    (op['playlist_id'], op['song']['id'], self._append_key(op['playlist_id'])))
+            elif kind == 'remove':
+                self.conn.execute(
+                    "DELETE FROM playlist_entries WHERE playlist_id = ? AND song_id = ?",
+                    (op['playlist_id'], op['song_id']))
+                self.conn.execute(
+                    "DELETE FROM songs WHERE id = ? AND NOT EXISTS "
+                    "(SELECT 1 FROM playlist_entries WHERE song_id = ?)",
+                    (op['song_id'], op['song_id']))
+            elif kind == 'move':
+                key = self._move_key(op['playlist_id'], op['song_id'], op['position'])
+                self.conn.execute(
+                    "UPDATE playlist_entries SET position = ? WHERE playlist_id = ? AND song_id = ?",
+                    (key, op['playlist_id'], op['song_id']))
+            elif kind == 'favorite':
+                self.conn.execute(
+                    "UPDATE songs SET is_favorite = ? WHERE id = ?", (op['is_favorite'], op['song_id']))
+            elif kind == 'played':
+                self.conn.execute(
+                    "UPDATE songs SET play_count = ?, last_played = ? WHERE id = ?",
+                    (op['play_count'], op['last_played'], op['song_id']))
+            elif kind == 'duration':
+                self.conn.execute("UPDATE songs SET duration = ? WHERE id = ?", (op['duration'], op['song_id']))
+        self._advance(bumped)
+
+    def _replace(self, op):
+        """Rewrite some playlists, leaving the rest as other processes left them.
+
+        op['playlists'] maps ids to snapshot-style entries (created or
+        changed playlists), op['deleted'] lists removed ones. Songs already
+        stored keep their favorite and play fields, which change only
+        through their own operations; they just gain a missing duration.
+        """
+        playlist_ids = list(op['playlists']) + op['deleted']
+        marks = ', '.join('?' * len(playlist_ids))
+        old_song_ids = [r[0] for r in self.conn.execute(
+            f"SELECT DISTINCT song_id FROM playlist_entries WHERE playlist_id IN ({marks})", playlist_ids)]
+        self._upsert_songs(op['songs'], KEEP_SONG_FIELDS)
+        self.conn.executemany("DELETE FROM playlists WHERE id = ?", [(pid,) for pid in op['deleted']])
+        self.conn.executemany("DELETE FROM versions WHERE scope = ?", [(pid,) for pid in op['deleted']])
+        # Rewritten playlists are reloaded whole; their older operations no longer apply
+        self.conn.executemany("DELETE FROM changes WHERE scope = ?", [(pid,) for pid in playlist_ids])
+        for playlist_id, playlist_data in op['playlists'].items():
+            shuffle = playlist_data.get('shuffle') or {}
+            self.conn.execute(
+                "INSERT INTO playlists (id, name, description, created_at, sort_order, shuffle_seed, shuffle_position, "
+                "shuffle_window) VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(sort_order), -1) + 1 FROM playlists), ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+                "shuffle_seed = excluded.shuffle_seed, shuffle_position = excluded.shuffle_position, "
+                "shuffle_window = excluded.shuffle_window",
+                (playlist_id, playlist_data['name'], playlist_data['description'], playlist_data['created_at'],
+                 shuffle.get('seed'), shuffle.get('position'), shuffle.get('window')))
+            self.conn.execute("DELETE FROM playlist_entries WHERE playlist_id = ?", (playlist_id,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO playlist_entries (playlist_id, song_id, position) VALUES (?, ?, ?)",
+                [(playlist_id, song_id, float(i)) for i, song_id in enumerate(playlist_data['song_ids'], 1)])
+        self.conn.executemany(
+            "DELETE FROM songs WHERE id = ? AND NOT EXISTS (SELECT 1 FROM playlist_entries WHERE song_id = ?)",
+            [(song_id, song_id) for song_id in old_song_ids])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('current_playlist_id', ?)",
+            (op['current_playlist_id'],))
+        return self._bump([REGISTRY] + list(op['playlists']))
+
+    def needs_compaction(self):
+        # Operations are applied in place; there is no log to fold
+        return False
+
+    def snapshot(self, data):
+        """Replace the whole database contents with data in one transaction"""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM changes")
+            self.conn.execute("DELETE FROM playlist_entries")
+            self.conn.execute("DELETE FROM playlists")
+            self.conn.execute("DELETE FROM songs")
+            self._upsert_songs(data['songs'])
+            for sort_order, (playlist_id, playlist_data) in enumerate(data['playlists'].items()):
+                shuffle = playlist_data.get('shuffle') or {}
+                self.conn.execute(
+                    "INSERT INTO playlists (id, name, description, created_at, sort_order, shuffle_seed, "
+                    "shuffle_position, shuffle_window) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (playlist_id, playlist_data['name'], playlist_data['description'], playlist_data['created_at'],
+                     sort_order, shuffle.get('seed'), shuffle.get('position'), shuffle.get('window')))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO playlist_entries (playlist_id, song_id, position) VALUES (?, ?, ?)",
+                    [(playlist_id, song_id, float(i)) for i, song_id in enumerate(playlist_data['song_ids'], 1)])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('current_playlist_id', ?)",
+                (data['current_playlist_id'],))
+            self.conn.execute(
+                f"DELETE FROM versions WHERE scope NOT IN ({', '.join('?' * (len(data['playlists']) + 2))})",
+                [REGISTRY, SONGS] + list(data['playlists']))
+            bumped = self._bump([REGISTRY, SONGS] + list(data['playlists']))
+        self._advance(bumped)
+
+    def stale_scopes(self):
+        """Scopes whose stamps moved since the in-memory state last matched them, sorted.
+
+        Cheap when nothing changed: PRAGMA data_version only changes once
+        another connection commits, and the stamps are read only then.
+        """
+        with self._read_lock:
+            data_version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            versions = self._reader.execute("SELECT scope, version FROM versions").fetchall()
+        with self._seen_lock:
+            stale = sorted(scope for scope, version in versions if self._seen.get(scope, 0) != version)
+        if not stale:
+            # Only skip later checks once caught up, so an unfinished reload is retried
+            self._data_version = data_version
+        return stale
+
+    def mark_seen(self, scope, version):
+        """Record that the in-memory state now matches scope at version (None: scope is gone)"""
+        with self._seen_lock:
+            if version is None:
+                self._seen.pop(scope, None)
+            else:
+                self._seen[scope] = version
+
+    def load_registry(self):
+        """Return (version, [(id, name, description, created_at)] in order, current playlist id)"""
+        with self._read_lock:
+            self._reader.execute("BEGIN")
+            try:
+                version = self._stamp(REGISTRY)
+                rows = self._reader.execute(
+                    "SELECT id, name, description, created_at FROM playlists ORDER BY sort_order").fetchall()
+                row = self._reader.execute("SELECT value FROM meta WHERE key = 'current_playlist_id'").fetchone()
+            finally:
+                self._reader.commit()
+        return version, rows, row[0] if row else None
+
+    def load_playlist_songs(self, playlist_ids):
+        """Return {id: (version, song dicts in order)} for those of playlist_ids still stored"""
+        columns = ', '.join(f"songs.{c}" for c in SONG_COLUMNS)
+        result = {}
+        with self._read_lock:
+            self._reader.execute("BEGIN")
+            try:
+                for playlist_id in playlist_ids:
+                    if not self._reader.execute("SELECT 1 FROM playlists WHERE id = ?", (playlist_id,)).fetchone():
+                        continue
+                    songs = [song_row(row) for row in self._reader.execute(
+                        f"SELECT {columns} FROM playlist_entries JOIN songs ON songs.id = playlist_entries.song_id "
+                        "WHERE playlist_id = ? ORDER BY position", (playlist_id,))]
+                    result[playlist_id] = (self._stamp(playlist_id), songs)
+            finally:
+                self._reader.commit()
+        return result
+
+    def load_playlist_changes(self, playlist_ids):
+        """Return {id: (version, ops, entry count)} for playlists whose missed operations are all kept.
+
+        Playlists left out (rewritten, deleted, or too far behind) must be
+        reloaded with load_playlist_songs. The entry count lets the caller
+        check the result of replaying the ops.
+        """
+        with self._seen_lock:
+            since = {playlist_id: self._seen.get(playlist_id, 0) for playlist_id in playlist_ids}
+        result = {}
+        with self._read_lock:
+            self._reader.execute("BEGIN")
+            try:
+                for playlist_id in playlist_ids:
+                    version = self._stamp(playlist_id)
+                    rows = self._reader.execute(
+                        "SELECT version, op FROM changes WHERE scope = ? AND version > ? ORDER BY version",
+                        (playlist_id, since[playlist_id])).fetchall()
+                    if len(rows) != version - since[playlist_id] or not rows or rows[0][0] != since[playlist_id] + 1:
+                        continue
+                    size = self._reader.execute(
+                        "SELECT COUNT(*) FROM playlist_entries WHERE playlist_id = ?", (playlist_id,)).fetchone()[0]
+                    result[playlist_id] = (version, [json.loads(op) for _, op in rows], size)
+            finally:
+                self._reader.commit()
+        return result
+
+    def load_changed_songs(self):
+        """Return (version, song dicts changed since the SONGS stamp the in-memory state matches)"""
+        with self._seen_lock:
+            since = self._seen.get(SONGS, 0)
+        with self._read_lock:
+            self._reader.execute("BEGIN")
+            try:
+                version = self._stamp(SONGS)
+                songs = [song_row(row) for row in self._reader.execute(
+                    f"SELECT {', '.join(SONG_COLUMNS)} FROM songs WHERE changed > ?", (since,))]
+            finally:
+                self._reader.commit()
+        return version, songs
+
+    def _stamp(self, scope):
+        row = self._reader.execute("SELECT version FROM versions WHERE scope = ?", (scope,)).fetchone()
+        return row[0] if row else 0
+
+
+def shuffle_state(seed, position, window):
+    """Playlist.shuffle_state dict from the shuffle columns of a playlists row"""
+    if window is not None:
+        return {'window': window}
+    if seed is not None:
+        return {'seed': seed, 'position': position}
+    return None
+
+
+def song_row(row):
+    """Song dict from a row of SONG_COLUMNS"""
+    song = dict(zip(SONG_COLUMNS, row))
+    song['is_favorite'] = bool(song['is_favorite'])
+    return song
+
+
+# Operations that set absolute values, so only the latest one per key matters
+COALESCED_OPS = {'favorite', 'played', 'switch', 'shuffle'}
+
+
+class BackgroundWriter:
+    """Write-behind buffer in front of a store.
+
+    In sync mode every record/snapshot is written before returning. In
+    debounced mode they are queued and a daemon thread flushes at most once
+    per interval. Queued favorite/played/switch/shuffle operations for the
+    same song or playlist are coalesced, consecutive moves of one song collapse into the
+    last, and a snapshot supersedes everything queued before it.
+    Callers hand over fully built dicts, so flushing never reads live
+    playlist state. Whatever a failed flush did not write is queued again
+    ahead of newer writes; in sync mode the error also reaches the caller.
+    """
+
+    def __init__(self, store, interval=1.0, sync=False):
+        self.store = store
+        self.interval = interval
+        self.sync = sync
+        self._lock = threading.Lock()        # Guards the queue and stats
+        self._flush_lock = threading.Lock()  # Serializes writes to the store
+        self._ops = {}
+        self._snapshot = None
+        self._writing_snapshot = False
+        self._unique = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flush_count = 0
+        self.mutation_count = 0
+        self.written_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.error_count = 0
+
+    def start(self):
+        if self.sync or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="playlist-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        """Stop the flush thread and write anything still queued"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def record(self, op):
+        with self._lock:
+            self.mutation_count += 1
+            if op['op'] in COALESCED_OPS:
+                key = (op['op'], op['playlist_id'], op.get('song_id'))
+                # Re-append so the latest value is applied after anything queued since
+                self._ops.pop(key, None)
+            elif op['op'] == 'move':
+                key = ('move', op['playlist_id'], op['song_id'])
+                last_key = next(reversed(self._ops), None)
+                if last_key and last_key[:3] == key:
+                    del self._ops[last_key]
+                key += (next(self._unique),)
+            else:
+                key = (op['op'], next(self._unique))
+            self._ops[key] = op
+        if self.sync:
+            self.flush()
+
+    def snapshot(self, data):
+        with self._lock:
+            self.mutation_count += 1
+            self._snapshot = data
+            self._ops = {}
+        if self.sync:
+            self.flush()
+
+    def needs_compaction(self):
+        """Whether the store wants a snapshot that is not already queued or being written"""
+        with self._lock:
+            if self._snapshot is not None or self._writing_snapshot:
+                return False
+        return self.store.needs_compaction()
+
+    def pending(self):
+        with self._lock:
+            return len(self._ops) + (1 if self._snapshot is not None else 0)
+
+    def flush(self):
+        """Write everything queued to the store; returns the number of writes"""
+        with self._flush_lock:
+            with self._lock:
+                snapshot, self._snapshot = self._snapshot, None
+                ops, self._ops = list(self._ops.items()), {}
+                self._writing_snapshot = snapshot is not None
+            if snapshot is None and not ops:
+                return 0
+
+            start = time.perf_counter()
+            written = 0
+            try:
+                if snapshot is not None:
+                    try:
+                        self.store.snapshot(snapshot)
+                    finally:
+                        with self._lock:
+                            self._writing_snapshot = False
+                    snapshot = None
+                for _, op in ops:
+                    self.store.record(op)
+                    written += 1
+            except Exception as e:
+                self._requeue(snapshot, ops[written:])
+                if self.sync:
+                    raise
+                print(f"Error writing playlists: {e}")
+                return 0
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            writes = len(ops) + (1 if snapshot is not None else 0)
+            with self._lock:
+                self.flush_count += 1
+                self.written_count += writes
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self.total_flush_ms += elapsed_ms
+            return writes
+
+    def _requeue(self, snapshot, ops):
+        """Queue what a failed flush did not write ahead of anything queued since"""
+        with self._lock:
+            self.error_count += 1
+            if self._snapshot is not None:
+                # A newer snapshot supersedes all of it
+                return
+            if snapshot is not None:
+                self._snapshot = snapshot
+            # A coalesced op queued since carries the latest value
+            ops = {key: op for key, op in ops if key not in self._ops}
+            ops.update(self._ops)
+            self._ops = ops
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._ops) + (1 if self._snapshot is not None else 0)
+            return {
+                'mode': 'sync' if self.sync else 'debounced',
+                'interval_s': self.interval,
+                'flush_count': self.flush_count,
+                'error_count': self.error_count,
+                'mutation_count': self.mutation_count,
+                'written_count': self.written_count,
+                'coalesced_count': self.mutation_count - self.written_count - pending,
+                'pending': pending,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.flush_count, 3) if self.flush_count else 0.0
+            }
@@ -1,9 +1,14 @@
 import unittest
-from adt import Playlist, Song
+from collections import Counter
+from datetime import datetime, timedelta
+from adt import (Playlist, IndexedPlaylist, RecencyIndex, Song, CHANGE_LOG_SIZE, RECENCY_HALF_LIFE, SMART_EXTRA_LIMIT,
+                 smart_weight, song_key, to_timestamp)
 
 class TestPlaylistADT(unittest.TestCase):
+    playlist_class = Playlist
+
     def setUp(self):
-        self.playlist = Playlist()
+        self.playlist = self.playlist_class()
         self.s1 = Song("Title1", "Artist1", "path1")
         self.s2 = Song("Title2", "Artist2", "path2")
         self.s3 = Song("Title3", "Artist3", "path3")
@@ -88,6 +93,443 @@ class TestPlaylistADT(unittest.TestCase):
         self.playlist.add_song(self.s2)
         self.assertTrue(self.playlist.contains_song("path1"))
         self.assertTrue(self.playlist.contains_song("path2"))
+        
+        # Removing a song drops its path
+        self.playlist.remove_song(self.s1.id)
+        self.assertFalse(self.playlist.contains_song("path1"))
+    
+    def test_contains_many(self):
+        self.playlist.add_song(self.s1)
+        self.playlist.add_song(self.s3)
+        
+        found = self.playlist.contains_many(["path1", "path2", "path3"])
+        self.assertEqual(found, {"path1", "path3"})
+        self.assertEqual(self.playlist.contains_many([]), set())
+
+    def test_song_index(self):
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+
+        self.assertIs(self.playlist.get_song(self.s2.id), self.s2)
+        self.assertIsNone(self.playlist.get_song("missing"))
+
+        # Index must survive operations that relink or rebuild the list
+        self.playlist.shuffle()
+        self.playlist.move_song(self.s1.id, 2)
+        self.playlist.sort_by_title()
+        for song in (self.s1, self.s2, self.s3):
+            self.assertIs(self.playlist._find_node(song.id).song, song)
+
+        self.assertTrue(self.playlist.toggle_favorite(self.s3.id))
+        self.assertTrue(self.s3.is_favorite)
+        self.assertTrue(self.playlist.mark_as_played(self.s3.id))
+        self.assertEqual(self.s3.play_count, 1)
+
+        self.assertTrue(self.playlist.remove_song(self.s3.id))
+        self.assertIsNone(self.playlist.get_song(self.s3.id))
+        self.assertFalse(self.playlist.remove_song(self.s3.id))
+        self.assertFalse(self.playlist.toggle_favorite(self.s3.id))
+
+    def test_positional_access(self):
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+
+        self.assertEqual(self.playlist.get_at(1), self.s2)
+        self.assertIsNone(self.playlist.get_at(3))
+        self.assertEqual(self.playlist.index_of(self.s3.id), 2)
+        self.assertEqual(self.playlist.index_of("missing"), -1)
+
+        s4 = Song("Title4", "Artist4", "path4")
+        self.playlist.insert_at(1, s4)
+        titles = [s['title'] for s in self.playlist.get_all_songs()]
+        self.assertEqual(titles, ["Title1", "Title4", "Title2", "Title3"])
+
+        # Move head to the end, then back to the middle
+        self.assertTrue(self.playlist.move(0, 3))
+        self.assertEqual(self.playlist.tail.song, self.s1)
+        self.assertTrue(self.playlist.move_song(self.s1.id, 1))
+        titles = [s['title'] for s in self.playlist.get_all_songs()]
+        self.assertEqual(titles, ["Title4", "Title1", "Title2", "Title3"])
+        self.assertEqual(self.playlist.index_of(self.s1.id), 1)
+        self.assertFalse(self.playlist.move(4, 0))
+
+        # Cursor stays on the same song through moves
+        self.assertEqual(self.playlist.get_current_song(), self.s1)
+        self.assertEqual(self.playlist.next_song(), self.s2)
+
+    def test_iter_songs_window(self):
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+
+        self.assertEqual(list(self.playlist.iter_songs()), [self.s1, self.s2, self.s3])
+        self.assertEqual(list(self.playlist.iter_songs(start=1, limit=1)), [self.s2])
+        self.assertEqual(list(self.playlist.iter_songs(start=5)), [])
+        self.assertEqual(list(self.playlist.iter_songs(after_id=self.s1.id)), [self.s2, self.s3])
+        self.assertEqual(list(self.playlist.iter_songs(after_id="missing")), [])
+
+        # A cursor anchored on a song survives inserts before it
+        self.playlist.insert_at(0, Song("Title4", "Artist4", "path4"))
+        self.assertEqual(list(self.playlist.iter_songs(after_id=self.s2.id)), [self.s3])
+        self.assertEqual([d['id'] for d in self.playlist.iter_dicts(limit=2)],
+                         [s['id'] for s in self.playlist.get_all_songs()[:2]])
+
+
+    def test_version_bumps_on_mutation(self):
+        versions = [self.playlist.version]
+        def changed():
+            versions.append(self.playlist.version)
+            return versions[-1] > versions[-2]
+
+        self.playlist.add_song(self.s1)
+        self.assertTrue(changed())
+        self.playlist.insert_at(0, self.s2)
+        self.assertTrue(changed())
+        self.playlist.add_song(self.s3)
+        self.assertTrue(changed())
+        self.playlist.toggle_favorite(self.s1.id)
+        self.assertTrue(changed())
+        self.playlist.mark_as_played(self.s1.id)
+        self.assertTrue(changed())
+        self.playlist.move(0, 2)
+        self.assertTrue(changed())
+        self.playlist.sort_by_title()
+        self.assertTrue(changed())
+        self.playlist.shuffle()
+        self.assertTrue(changed())
+        self.playlist.remove_song(self.s2.id)
+        self.assertTrue(changed())
+        self.playlist.touch(self.s1)
+        self.assertTrue(changed())
+
+    def test_version_unchanged_by_reads(self):
+        self.playlist.add_song(self.s1)
+        self.playlist.add_song(self.s2)
+        version = self.playlist.version
+        self.playlist.next_song()
+        self.playlist.prev_song()
+        self.playlist.get_all_songs()
+        self.playlist.get_favorites()
+        self.playlist.get_recently_played()
+        self.assertFalse(self.playlist.remove_song(self.s3.id))
+        self.assertFalse(self.playlist.toggle_favorite(self.s3.id))
+        self.assertEqual(self.playlist.version, version)
+
+    def test_favorites_index(self):
+        self.s3.is_favorite = True
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+        self.playlist.toggle_favorite(self.s1.id)
+        self.assertEqual([s["id"] for s in self.playlist.get_favorites()], [self.s3.id, self.s1.id])
+
+        self.playlist.toggle_favorite(self.s3.id)
+        self.playlist.remove_song(self.s1.id)
+        self.assertEqual(self.playlist.get_favorites(), [])
+
+    def test_recently_played_index(self):
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+        self.assertEqual(self.playlist.get_recently_played(), [])
+        for song in (self.s2, self.s1, self.s3, self.s2):
+            self.playlist.mark_as_played(song.id)
+        recent = [s["id"] for s in self.playlist.get_recently_played()]
+        self.assertEqual(recent, [self.s2.id, self.s3.id, self.s1.id])
+        self.assertEqual(len(self.playlist.get_recently_played(limit=2)), 2)
+
+        self.playlist.remove_song(self.s3.id)
+        self.assertEqual([s["id"] for s in self.playlist.get_recently_played()], [self.s2.id, self.s1.id])
+
+    def test_touch_reindexes_shared_song(self):
+        self.playlist.add_song(self.s1)
+        other = self.playlist_class()
+        other.add_song(self.s1)
+        other.toggle_favorite(self.s1.id)
+        other.mark_as_played(self.s1.id)
+        self.assertEqual(self.playlist.get_favorites(), [])
+        self.playlist.touch(self.s1)
+        self.assertEqual(len(self.playlist.get_favorites()), 1)
+        self.assertEqual(len(self.playlist.get_recently_played()), 1)
+
+    def apply(self, songs, ops):
+        """Replay changes_since ops on a client-side list of song dicts"""
+        songs = list(songs)
+        for op in ops:
+            if op["op"] == "add":
+                songs.insert(op["position"], op["song"])
+            elif op["op"] == "remove":
+                songs = [s for s in songs if s["id"] != op["id"]]
+            elif op["op"] == "move":
+                song = next(s for s in songs if s["id"] == op["id"])
+                songs.remove(song)
+                songs.insert(op["position"], song)
+            elif op["op"] == "update":
+                songs = [op["song"] if s["id"] == op["song"]["id"] else s for s in songs]
+            elif op["op"] == "order":
+                by_id = {s["id"]: s for s in songs}
+                songs = [by_id[song_id] for song_id in op["ids"]]
+        return songs
+
+    def test_changes_since(self):
+        self.playlist.add_song(self.s1)
+        self.playlist.add_song(self.s2)
+        version, snapshot = self.playlist.version, self.playlist.get_all_songs()
+        self.assertEqual(self.playlist.changes_since(version), [])
+
+        self.playlist.insert_at(1, self.s3)
+        self.playlist.toggle_favorite(self.s1.id)
+        self.playlist.mark_as_played(self.s1.id)
+        self.playlist.move_song(self.s1.id, 2)
+        self.playlist.remove_song(self.s2.id)
+        ops = self.playlist.changes_since(version)
+        self.assertEqual([op["op"] for op in ops], ["add", "update", "move", "remove"])
+        self.assertEqual(self.apply(snapshot, ops), self.playlist.get_all_songs())
+
+    def test_changes_since_reorder(self):
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+        version, snapshot = self.playlist.version, self.playlist.get_all_songs()
+        self.playlist.move_song(self.s3.id, 0)
+        self.playlist.sort_by_title()
+        self.playlist.move_song(self.s1.id, 1)
+        ops = self.playlist.changes_since(version)
+        self.assertEqual([op["op"] for op in ops], ["order"])
+        self.assertEqual(self.apply(snapshot, ops), self.playlist.get_all_songs())
+
+    def test_changes_since_too_old(self):
+        self.playlist.add_song(self.s1)
+        for _ in range(CHANGE_LOG_SIZE):
+            self.playlist.toggle_favorite(self.s1.id)
+        self.assertIsNone(self.playlist.changes_since(0))
+        self.assertIsNone(self.playlist.changes_since(self.playlist.version + 1))
+        self.assertEqual(len(self.playlist.changes_since(1)), 1)
+
+    def test_set_songs(self):
+        for song in (self.s1, self.s2, self.s3):
+            self.playlist.add_song(song)
+        self.playlist.next_song()
+        s4 = Song("Title4", "Artist4", "path4")
+        version = self.playlist.version
+        self.playlist.set_songs([self.s3, s4, self.s2])
+        self.assertEqual([s["title"] for s in self.playlist.get_all_songs()], ["Title3", "Title4", "Title2"])
+        self.assertEqual(self.playlist.get_current_song(), self.s2)
+        self.assertFalse(self.playlist.contains_song("path1"))
+        self.assertEqual(self.playlist.tail.prev.prev, self.playlist.head)
+        ops = [op["op"] for op in self.playlist.changes_since(version)]
+        self.assertEqual(ops, ["remove", "add", "order"])
+        # Nothing to change: the version stays put
+        version = self.playlist.version
+        self.playlist.set_songs([self.s3, s4, self.s2])
+        self.assertEqual(self.playlist.version, version)
+
+    def _fill(self, count):
+        songs = [Song(f"T{i}", "A", f"p{i}") for i in range(count)]
+        for song in songs:
+            self.playlist.add_song(song)
+        return songs
+
+    def test_shuffle_mode_keeps_stored_order(self):
+        songs = self._fill(20)
+        version = self.playlist.version
+        self.playlist.set_shuffle(True, seed=7)
+        played = [self.playlist.next_song() for _ in range(20)]
+        self.assertEqual(set(played), set(songs))
+        self.assertNotEqual(played, songs)
+        # The last song stays current at the end, as it does without shuffle
+        self.assertEqual(self.playlist.next_song(), played[-1])
+        self.assertEqual(self.playlist.prev_song(), played[-2])
+        self.assertEqual([s["title"] for s in self.playlist.get_all_songs()], [s.title for s in songs])
+        self.assertEqual(self.playlist.version, version)
+        self.playlist.set_shuffle(False)
+        self.assertIsNone(self.playlist.shuffle_state())
+        self.assertEqual(self.playlist.next_song(), self.playlist.get_at(self.playlist.index_of(played[-2].id) + 1))
+
+    def test_shuffle_state_resumes_order(self):
+        songs = self._fill(30)
+        self.playlist.set_shuffle(True)
+        played = [self.playlist.next_song() for _ in range(10)]
+        state = self.playlist.shuffle_state()
+        self.assertEqual(state["position"], 9)
+        upcoming = [self.playlist.next_song() for _ in range(5)]
+
+        # A reloaded copy resumes from the saved seed and position
+        copy = self.playlist_class()
+        for song in songs:
+            copy.add_song(song)
+        copy.set_shuffle(True, **state)
+        self.assertEqual(copy.get_current_song(), played[-1])
+        self.assertEqual([copy.next_song() for _ in range(5)], upcoming)
+        self.assertEqual(copy.prev_song(), upcoming[-2])
+
+        # Turning shuffle off undoes the draws, so the seed replays the same way
+        self.playlist.set_shuffle(False)
+        self.playlist.set_shuffle(True, seed=state["seed"])
+        self.assertEqual([self.playlist.next_song() for _ in range(10)], played)
+
+    def test_shuffle_mode_follows_edits(self):
+        songs = self._fill(40)
+        self.playlist.set_shuffle(True, seed=3)
+        played = [self.playlist.next_song() for _ in range(5)]
+        removed = [song for song in songs if song not in played][:25]
+        for song in removed + played[1:3]:
+            self.playlist.remove_song(song.id)
+        added = Song("New", "A", "new")
+        self.playlist.add_song(added)
+        self.playlist.move_song(songs[-1].id, 0)
+
+        # Back through what is left of the history, then on through every other song once
+        self.assertEqual(self.playlist.prev_song(), played[3])
+        self.assertEqual(self.playlist.prev_song(), played[0])
+        rest = [self.playlist.next_song() for _ in range(self.playlist.size + 5)]
+        self.assertEqual(rest[:2], [played[3], played[4]])
+        live = [self.playlist.get_at(i) for i in range(self.playlist.size)]
+        self.assertEqual(set(rest), set(live) - {played[0]})
+        self.assertIn(added, rest)
+
+        # A new shuffle after the edits draws over the current playlist order
+        self.playlist.set_shuffle(False)
+        self.playlist.set_shuffle(True, seed=3)
+        self.assertEqual(len({self.playlist.next_song() for _ in range(self.playlist.size)}), self.playlist.size)
+
+    def test_smart_shuffle_weights(self):
+        songs = self._fill(10)
+        songs[0].is_favorite = True
+        songs[1].play_count = 5
+        songs[2].last_played = datetime.now() - timedelta(seconds=RECENCY_HALF_LIFE)
+        self.playlist.set_shuffle(True, window=0)
+        self.playlist._smart._rng.seed(1)
+        self.assertEqual(self.playlist.shuffle_state(), {"window": 0})
+
+        counts = Counter(self.playlist.next_song() for _ in range(20000))
+        now = to_timestamp(datetime.now())
+        total = sum(smart_weight(song, now) for song in songs)
+        for song in songs:
+            self.assertAlmostEqual(counts[song] / 20000, smart_weight(song, now) / total, delta=0.01)
+        # Favorites weigh the most, heavily and recently played songs the least
+        self.assertEqual(counts.most_common(1)[0][0], songs[0])
+        self.assertLess(counts[songs[1]], counts[songs[3]])
+        self.assertLess(counts[songs[2]], counts[songs[3]])
+
+    def test_smart_shuffle_window_and_history(self):
+        self._fill(8)
+        self.playlist.set_shuffle(True, window=5)
+        picks = [self.playlist.next_song() for _ in range(100)]
+        for i in range(len(picks) - 5):
+            self.assertEqual(len(set(picks[i:i + 6])), 6)
+        self.assertEqual([self.playlist.prev_song() for _ in range(2)], [picks[-2], picks[-3]])
+        self.assertEqual(self.playlist.next_song(), picks[-2])
+        self.assertEqual(self.playlist.next_song(), picks[-1])
+
+        # A window longer than the playlist still leaves a song to pick
+        self.playlist.set_shuffle(True, window=50)
+        self.assertEqual(self.playlist.shuffle_state(), {"window": 50})
+        self.assertEqual(len({self.playlist.next_song() for _ in range(7)}), 7)
+        self.playlist.set_shuffle(False)
+        self.assertIsNone(self.playlist.shuffle_state())
+
+    def test_smart_shuffle_updates_without_rebuild(self):
+        songs = self._fill(20)
+        self.playlist.set_shuffle(True, window=0)
+        table = self.playlist._smart._nodes
+        for song in songs[:10]:
+            self.playlist.mark_as_played(song.id)
+        self.playlist.remove_song(songs[10].id)
+        added = Song("New", "A", "new")
+        self.playlist.add_song(added)
+        self.playlist.toggle_favorite(songs[15].id)
+        picks = {self.playlist.next_song() for _ in range(2000)}
+        self.assertIs(self.playlist._smart._nodes, table)
+        self.assertIn(added, picks)
+        self.assertNotIn(songs[10], picks)
+
+        # Past SMART_EXTRA_LIMIT songs outside the table, the next pick rebuilds it
+        for i in range(SMART_EXTRA_LIMIT + 1):
+            self.playlist.add_song(Song(f"Extra{i}", "A", f"extra{i}"))
+        self.playlist.next_song()
+        self.assertEqual(len(self.playlist._smart._nodes), self.playlist.size)
+
+    def test_song_dict_round_trip(self):
+        self.s1.duration = 183.2
+        copy = Song.from_dict(self.s1.to_dict())
+        self.assertEqual((copy.id, copy.duration), (self.s1.id, 183.2))
+        legacy = self.s2.to_dict()
+        del legacy["duration"]
+        self.assertIsNone(Song.from_dict(legacy).duration)
+
+    def test_malformed_ids_are_not_found(self):
+        self.playlist.add_song(self.s1)
+        for song_id in ("not-a-uuid", "123", "", None, 42, self.s1.id[:-1]):
+            self.assertIsNone(self.playlist.get_song(song_id))
+            self.assertFalse(self.playlist.remove_song(song_id))
+        self.assertEqual(self.playlist.size, 1)
+        # Any spelling of the same UUID finds the song
+        self.assertIs(self.playlist.get_song(self.s1.id.upper()), self.s1)
+
+class TestSong(unittest.TestCase):
+    def test_id_and_timestamps_round_trip(self):
+        song = Song("Title", "Artist", "path")
+        song.added_at = datetime(2023, 1, 2, 3, 4, 5, 999999)
+        song.last_played = datetime(2024, 5, 17, 13, 45, 12, 345678)
+        data = song.to_dict()
+        self.assertEqual((data["added_at"], data["last_played"]),
+                         ("2023-01-02T03:04:05.999999", "2024-05-17T13:45:12.345678"))
+        copy = Song.from_dict(data)
+        self.assertEqual((copy.key, copy.id), (song.key, song.id))
+        self.assertEqual((copy.added_ts, copy.last_played_ts), (song.added_ts, song.last_played_ts))
+        self.assertEqual(copy.to_dict(), data)
+
+    def test_never_played_round_trip(self):
+        song = Song("Title", "Artist", "path")
+        self.assertIsNone(song.to_dict()["last_played"])
+        copy = Song.from_dict(song.to_dict())
+        self.assertIsNone(copy.last_played_ts)
+        self.assertIsNone(copy.last_played)
+
+    def test_song_key(self):
+        song = Song("Title", "Artist", "path")
+        self.assertEqual(song_key(song.id), song.key)
+        for song_id in ("not-a-uuid", "", None, 42):
+            self.assertIsNone(song_key(song_id))
+
+    def test_artist_names_are_shared(self):
+        # Built at runtime, so the two names start out as distinct strings
+        first = Song("One", "".join(["Same ", "Artist"]), "p1")
+        second = Song("Two", "".join(["Same ", "Artist"]), "p2")
+        self.assertIs(first.artist, second.artist)
+        self.assertIs(Song.from_dict(first.to_dict()).artist, first.artist)
+
+class TestRecencyIndex(unittest.TestCase):
+    def test_out_of_order_inserts(self):
+        index = RecencyIndex()
+        songs = [Song(f"T{i}", "A", f"p{i}") for i in range(5)]
+        for song, ts in zip(songs, [30.0, 10.0, None, 50.0, 20.0]):
+            song.last_played_ts = ts
+            index.add(song)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.newest(3), [songs[3], songs[0], songs[4]])
+
+        songs[1].last_played_ts = 60.0
+        index.add(songs[1])
+        index.add(songs[3])  # Unchanged timestamp keeps its place
+        self.assertEqual(index.newest(2), [songs[1], songs[3]])
+        index.discard(songs[1])
+        self.assertEqual(index.newest(1), [songs[3]])
+
+class TestIndexedPlaylist(TestPlaylistADT):
+    playlist_class = IndexedPlaylist
+
+    def test_tree_tracks_list(self):
+        songs = [Song(f"T{i}", "A", f"p{i}") for i in range(50)]
+        for song in songs:
+            self.playlist.add_song(song)
+        self.playlist.shuffle()
+        self.playlist.move_song(songs[0].id, 25)
+        self.playlist.remove_song(songs[1].id)
+        self.playlist.sort_by_title()
+
+        ids = [s['id'] for s in self.playlist.get_all_songs()]
+        self.assertEqual(len(self.playlist._tree), len(ids))
+        for position, song_id in enumerate(ids):
+            self.assertEqual(self.playlist.get_at(position).id, song_id)
+            self.assertEqual(self.playlist.index_of(song_id), position)
 
 if __name__ == '__main__':
     unittest.main()
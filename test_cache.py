@@ -0,0 +1,46 @@
+import unittest
+from cache import ResponseCache
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_bytes=10)
+
+    def test_hit_requires_same_version(self):
+        self.cache.put("/a", "v1", b"abc")
+        self.assertEqual(self.cache.get("/a", "v1"), b"abc")
+        self.assertIsNone(self.cache.get("/a", "v2"))
+        self.assertIsNone(self.cache.get("/b", "v1"))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertAlmostEqual(stats['hit_ratio'], 1 / 3, places=3)
+
+    def test_put_replaces_older_version(self):
+        self.cache.put("/a", "v1", b"abc")
+        self.cache.put("/a", "v2", b"de")
+        self.assertEqual(self.cache.get("/a", "v2"), b"de")
+        self.assertEqual(self.cache.stats()['bytes'], 2)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put("/a", "v", b"aaaa")
+        self.cache.put("/b", "v", b"bbbb")
+        self.cache.get("/a", "v")
+        self.cache.put("/c", "v", b"cccc")
+        self.assertIsNone(self.cache.get("/b", "v"))
+        self.assertEqual(self.cache.get("/a", "v"), b"aaaa")
+        self.assertEqual(self.cache.get("/c", "v"), b"cccc")
+        self.assertLessEqual(self.cache.stats()['bytes'], 10)
+
+    def test_skips_oversized_body(self):
+        self.cache.put("/a", "v", b"x" * 11)
+        self.assertIsNone(self.cache.get("/a", "v"))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_capture_caches_after_exhaustion(self):
+        chunks = self.cache.capture("/a", "v", iter(["[1,", b"2]"]))
+        self.assertEqual(next(chunks), "[1,")
+        self.assertIsNone(self.cache.get("/a", "v"))
+        self.assertEqual(list(chunks), [b"2]"])
+        self.assertEqual(self.cache.get("/a", "v"), b"[1,2]")
+
+if __name__ == '__main__':
+    unittest.main()
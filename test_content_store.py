@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from content_store import ContentStore
+
+class TestContentStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.index = os.path.join(self.dir, "index.json")
+        self.store = ContentStore(self.dir, "music", self.index)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, file_path):
+        with open(self.store.path(file_path), "rb") as f:
+            return f.read()
+
+    def test_identical_upload_is_stored_once(self):
+        self.assertEqual(self.store.save(io.BytesIO(b"audio"), "a.mp3"), ("music/a.mp3", False))
+        self.assertEqual(self.store.save(io.BytesIO(b"audio"), "b.mp3"), ("music/a.mp3", True))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir, "music"))), ["a.mp3"])
+        stats = self.store.stats()
+        self.assertEqual((stats["files"], stats["duplicate_uploads"], stats["duplicate_upload_bytes"]), (1, 1, 5))
+
+    def test_taken_name_is_not_overwritten(self):
+        self.store.save(io.BytesIO(b"first"), "a.mp3")
+        file_path, duplicate = self.store.save(io.BytesIO(b"second"), "a.mp3")
+        self.assertFalse(duplicate)
+        self.assertNotEqual(file_path, "music/a.mp3")
+        self.assertEqual((self.read("music/a.mp3"), self.read(file_path)), (b"first", b"second"))
+
+    def test_recognizes_unindexed_file_with_same_name(self):
+        with open(os.path.join(self.dir, "music", "old.mp3"), "wb") as f:
+            f.write(b"audio")
+        self.assertEqual(self.store.save(io.BytesIO(b"audio"), "old.mp3"), ("music/old.mp3", True))
+
+    def test_index_files_finds_older_copies(self):
+        with open(os.path.join(self.dir, "music", "old.mp3"), "wb") as f:
+            f.write(b"audio")
+        self.store.index_files(["music/old.mp3", "music/missing.mp3"])
+        self.assertEqual(self.store.save(io.BytesIO(b"audio"), "new.mp3"), ("music/old.mp3", True))
+
+    def test_index_persists(self):
+        self.store.save(io.BytesIO(b"audio"), "a.mp3")
+        reopened = ContentStore(self.dir, "music", self.index)
+        self.assertEqual(reopened.save(io.BytesIO(b"audio"), "b.mp3"), ("music/a.mp3", True))
+        # Uploads append to the log instead of rewriting the index
+        self.assertFalse(os.path.exists(self.index))
+        with open(os.path.join(self.dir, "index.log")) as f:
+            self.assertEqual([json.loads(line)["entry"]["file_path"] for line in f], ["music/a.mp3"])
+
+    def test_log_is_compacted_into_the_index(self):
+        store = ContentStore(self.dir, "music", self.index, compact_every=3)
+        for i in range(4):
+            store.save(io.BytesIO(b"audio %d" % i), f"{i}.mp3")
+        with open(self.index) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        reopened = ContentStore(self.dir, "music", self.index)
+        self.assertEqual(reopened.stats()["files"], 4)
+
+    def test_torn_log_line_is_ignored_and_overwritten(self):
+        self.store.save(io.BytesIO(b"audio"), "a.mp3")
+        with open(os.path.join(self.dir, "index.log"), "a") as f:
+            f.write('{"hash": "tor')
+        reopened = ContentStore(self.dir, "music", self.index)
+        reopened.save(io.BytesIO(b"other"), "b.mp3")
+        self.assertEqual(ContentStore(self.dir, "music", self.index).stats()["files"], 2)
+
+    def test_upload_reference_is_released(self):
+        file_path, _ = self.store.save(io.BytesIO(b"audio"), "a.mp3")
+        duplicate, _ = self.store.save(io.BytesIO(b"audio"), "b.mp3")
+        self.store.release(file_path)
+        self.assertTrue(os.path.exists(self.store.path(file_path)))
+        # No song took the upload, so dropping the last reference deletes it
+        self.store.release(duplicate)
+        self.assertFalse(os.path.exists(self.store.path(file_path)))
+
+    def test_refcounts(self):
+        file_path, _ = self.store.save(io.BytesIO(b"audio"), "a.mp3")
+        self.store.reset_refs([file_path, file_path])
+        self.store.retain(file_path)
+        self.assertEqual(self.store.stats()["bytes_saved"], 10)
+        self.store.release(file_path)
+        self.store.release(file_path)
+        self.assertTrue(os.path.exists(self.store.path(file_path)))
+        self.store.release(file_path)
+        self.assertFalse(os.path.exists(self.store.path(file_path)))
+        # Uploading it again stores it again
+        self.assertEqual(self.store.save(io.BytesIO(b"audio"), "a.mp3"), (file_path, False))
+
+    def test_files_it_did_not_write_are_kept(self):
+        with open(os.path.join(self.dir, "music", "old.mp3"), "wb") as f:
+            f.write(b"audio")
+        self.store.index_files(["music/old.mp3"])
+        self.store.reset_refs(["music/old.mp3"])
+        self.store.release("music/old.mp3")
+        self.assertTrue(os.path.exists(self.store.path("music/old.mp3")))
+
+    def test_keeps_unused_files_when_asked(self):
+        store = ContentStore(self.dir, "music", delete_unused=False)
+        file_path, _ = store.save(io.BytesIO(b"audio"), "a.mp3")
+        store.retain(file_path)
+        store.release(file_path)
+        self.assertTrue(os.path.exists(store.path(file_path)))
+
+    def test_digest_only_for_files_it_wrote(self):
+        file_path, _ = self.store.save(io.BytesIO(b"audio"), "a.mp3")
+        self.assertEqual(len(self.store.digest(file_path)), 64)
+        with open(os.path.join(self.dir, "music", "old.mp3"), "wb") as f:
+            f.write(b"older")
+        self.store.index_files(["music/old.mp3"])
+        self.assertIsNone(self.store.digest("music/old.mp3"))
+
+    def test_shared_index_sees_other_processes(self):
+        first = ContentStore(self.dir, "music", self.index, shared=True)
+        second = ContentStore(self.dir, "music", self.index, shared=True)
+        file_path, _ = first.save(io.BytesIO(b"audio"), "a.mp3")
+        self.assertEqual(second.digest(file_path), first.digest(file_path))
+        self.assertEqual(second.save(io.BytesIO(b"other"), "b.mp3"), ("music/b.mp3", False))
+        # Neither write dropped the other's entry
+        reopened = ContentStore(self.dir, "music", self.index)
+        self.assertEqual(reopened.stats()["files"], 2)
+
+    def test_streams_in_chunks(self):
+        class Upload(io.BytesIO):
+            reads = 0
+            def read(self, size=-1):
+                self.reads += 1
+                assert size > 0, "read the whole upload at once"
+                return super().read(size)
+        upload = Upload(b"x" * (3 * 1024 * 1024))
+        self.store.save(upload, "big.mp3")
+        self.assertGreater(upload.reads, 3)
+        self.assertEqual([n for n in os.listdir(os.path.join(self.dir, "music")) if n.endswith(".tmp")], [])
+
+if __name__ == '__main__':
+    unittest.main()
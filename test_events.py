@@ -0,0 +1,46 @@
+import threading
+import unittest
+from events import EventBroker, RESYNC, format_event
+
+class TestEventBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = EventBroker(max_pending=3)
+
+    def test_fan_out(self):
+        a, b = self.broker.subscribe(), self.broker.subscribe()
+        self.broker.publish('played', {'song_id': 'x'})
+        expected = format_event('played', {'song_id': 'x'})
+        self.assertEqual(a.next(0), expected)
+        self.assertEqual(b.next(0), expected)
+        self.assertIsNone(a.next(0))
+        self.assertEqual(self.broker.stats()['delivered_count'], 2)
+
+    def test_unsubscribe(self):
+        a = self.broker.subscribe()
+        self.broker.unsubscribe(a)
+        self.broker.publish('playlists', {})
+        self.assertIsNone(a.next(0))
+        self.assertEqual(self.broker.stats()['subscribers'], 0)
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        slow, fast = self.broker.subscribe(), self.broker.subscribe()
+        for i in range(4):
+            self.broker.publish('playlist', {'version': i})
+            fast.next(0)
+        # The backlog is replaced, so a slow client never holds more than max_pending events
+        self.assertEqual(slow.next(0), RESYNC)
+        self.assertIsNone(slow.next(0))
+        self.assertEqual(slow.dropped, 3)
+        self.broker.publish('playlist', {'version': 4})
+        self.assertEqual(slow.next(0), format_event('playlist', {'version': 4}))
+        self.assertEqual(self.broker.stats()['resync_count'], 1)
+
+    def test_next_waits_for_publish(self):
+        subscription = self.broker.subscribe()
+        timer = threading.Timer(0.05, self.broker.publish, ('now_playing', {}))
+        timer.start()
+        self.assertEqual(subscription.next(timeout=5), format_event('now_playing', {}))
+        timer.join()
+
+if __name__ == '__main__':
+    unittest.main()
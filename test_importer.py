@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+from importer import ImportJob, scan_directory, song_tags
+from metadata import MetadataCache, read_metadata
+
+class TestImporter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.music = os.path.join(self.dir, "music")
+        os.makedirs(os.path.join(self.music, "album"))
+        for name in ("album/b.mp3", "album/a.MP3", "c.mp3", "notes.txt"):
+            with open(os.path.join(self.music, name), "wb") as f:
+                f.write(b"not really audio")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_song_tags_fall_back_to_file_name(self):
+        path = os.path.join(self.music, "c.mp3")
+        self.assertEqual(song_tags(path, read_metadata(path)), ("c", "Unknown Artist"))
+
+    def test_scan_directory(self):
+        found = [file_path for _, file_path in scan_directory(self.music, self.dir)]
+        self.assertEqual(found, ["music/c.mp3", "music/album/a.MP3", "music/album/b.mp3"])
+
+    def committer(self, commits):
+        def commit(entries):
+            commits.append(entries)
+            return len(entries)
+        return commit
+
+    def test_run_dedupes_and_commits_once(self):
+        commits = []
+        files = list(scan_directory(self.music, self.dir))
+        files.append(files[0])  # Same file listed twice
+        job = ImportJob("p", "test")
+        job.run(files, lambda paths: {"music/c.mp3"} & paths, self.committer(commits), processes=False)
+
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(sorted(commits[0]), [("music/album/a.MP3", "a", "Unknown Artist", None),
+                                              ("music/album/b.mp3", "b", "Unknown Artist", None)])
+        status = job.to_dict()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual((status["total"], status["processed"], status["added"], status["skipped"]), (4, 4, 2, 2))
+
+    def test_run_reads_only_cache_misses(self):
+        cache = MetadataCache()
+        cached = os.path.join(self.music, "c.mp3")
+        cache.put(cached, dict(read_metadata(cached), title="Cached", duration=61.5))
+        commits = []
+        job = ImportJob("p", "test")
+        job.run(scan_directory(self.music, self.dir), lambda paths: set(), self.committer(commits),
+                processes=False, cache=cache)
+
+        self.assertIn(("music/c.mp3", "Cached", "Unknown Artist", 61.5), commits[0])
+        self.assertEqual(job.to_dict()["cached"], 1)
+        self.assertEqual(len(cache), 3)
+
+    def test_commit_skips_songs_added_meanwhile(self):
+        job = ImportJob("p", "test")
+        # Another import added one of the files after is_known was asked
+        job.run(scan_directory(self.music, self.dir), lambda paths: set(), lambda entries: len(entries) - 1,
+                processes=False)
+        status = job.to_dict()
+        self.assertEqual((status["added"], status["skipped"]), (2, 1))
+
+    def test_failed_commit(self):
+        def commit(entries):
+            raise ValueError("playlist gone")
+        finished = []
+        job = ImportJob("p", "test")
+        job.start(scan_directory(self.music, self.dir), lambda paths: set(), commit, processes=False,
+                  finish=lambda: finished.append(job.to_dict()["status"])).join()
+        status = job.to_dict()
+        self.assertEqual((status["status"], status["message"]), ("failed", "playlist gone"))
+        self.assertEqual(finished, ["failed"])
+
+if __name__ == '__main__':
+    unittest.main()
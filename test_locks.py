@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+from locks import LockSet, RWLock
+
+class TestRWLock(unittest.TestCase):
+    def setUp(self):
+        self.lock = RWLock()
+
+    def run_thread(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def test_readers_share(self):
+        self.lock.acquire_read()
+        entered = threading.Event()
+        def reader():
+            with self.lock.reading():
+                entered.set()
+        self.run_thread(reader)
+        self.assertTrue(entered.wait(1))
+        self.lock.release_read()
+        self.assertEqual(self.lock.contended, 0)
+
+    def test_writer_excludes_readers(self):
+        self.lock.acquire_write()
+        entered = threading.Event()
+        def reader():
+            with self.lock.reading():
+                entered.set()
+        self.run_thread(reader)
+        self.assertFalse(entered.wait(0.05))
+        self.lock.release_write()
+        self.assertTrue(entered.wait(1))
+        self.assertEqual(self.lock.contended, 1)
+
+    def test_waiting_writer_blocks_new_readers(self):
+        self.lock.acquire_read()
+        order = []
+        def writer():
+            with self.lock.writing():
+                order.append('writer')
+        def reader():
+            with self.lock.reading():
+                order.append('reader')
+        writer_thread = self.run_thread(writer)
+        while not self.lock._waiting_writers:
+            time.sleep(0.001)
+        reader_thread = self.run_thread(reader)
+        time.sleep(0.05)
+        self.assertEqual(order, [])
+        self.lock.release_read()
+        writer_thread.join(1)
+        reader_thread.join(1)
+        self.assertEqual(order, ['writer', 'reader'])
+
+    def test_reentrant(self):
+        with self.lock.writing():
+            with self.lock.writing(), self.lock.reading():
+                pass
+            with self.lock.reading(), self.lock.reading():
+                pass
+        # Fully released: another thread can write
+        done = threading.Event()
+        self.run_thread(lambda: (self.lock.acquire_write(), done.set()))
+        self.assertTrue(done.wait(1))
+
+    def test_upgrade_refused(self):
+        with self.lock.reading():
+            with self.assertRaises(RuntimeError):
+                self.lock.acquire_write()
+
+    def test_counter_stays_consistent(self):
+        state = {'count': 0}
+        def worker():
+            for _ in range(200):
+                with self.lock.writing():
+                    count = state['count']
+                    time.sleep(0)
+                    state['count'] = count + 1
+                with self.lock.reading():
+                    state['count']
+        threads = [self.run_thread(worker) for _ in range(8)]
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(state['count'], 1600)
+
+class TestLockSet(unittest.TestCase):
+    def test_release_is_idempotent_and_reversed(self):
+        first, second = RWLock(), RWLock()
+        held = LockSet().write(first).read(second)
+        held.release()
+        held.release()
+        # Both free again: another thread can write both
+        done = threading.Event()
+        def writer():
+            with first.writing(), second.writing():
+                done.set()
+        threading.Thread(target=writer, daemon=True).start()
+        self.assertTrue(done.wait(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1
+from metadata import MetadataCache, MetadataWorker, content_hash, read_metadata
+
+# 100 silent MPEG-1 Layer III frames: 128 kbps, 44.1 kHz, ~2.6 seconds
+MP3_BYTES = (b"\xff\xfb\x90\x64" + b"\x00" * 413) * 100
+
+def write_mp3(path, title=None, cover=False):
+    with open(path, "wb") as f:
+        f.write(MP3_BYTES)
+    if title or cover:
+        tags = ID3()
+        if title:
+            tags.add(TIT2(encoding=3, text=title))
+            tags.add(TPE1(encoding=3, text="Artist"))
+            tags.add(TALB(encoding=3, text="Album"))
+        if cover:
+            tags.add(APIC(encoding=3, mime="image/png", type=3, desc="", data=b"png"))
+        tags.save(path)
+
+class TestReadMetadata(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_tags_and_audio_properties(self):
+        path = os.path.join(self.dir, "a.mp3")
+        write_mp3(path, title="Song", cover=True)
+        meta = read_metadata(path)
+        self.assertEqual((meta["title"], meta["artist"], meta["album"]), ("Song", "Artist", "Album"))
+        self.assertAlmostEqual(meta["duration"], 2.606, places=2)
+        self.assertEqual((meta["bitrate"], meta["sample_rate"], meta["has_cover"]), (128000, 44100, True))
+
+    def test_unreadable_file(self):
+        path = os.path.join(self.dir, "junk.mp3")
+        with open(path, "wb") as f:
+            f.write(b"not audio")
+        meta = read_metadata(path)
+        self.assertIsNone(meta["duration"])
+        self.assertFalse(meta["has_cover"])
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.song = os.path.join(self.dir, "a.mp3")
+        write_mp3(self.song, title="Song")
+        self.cache_file = os.path.join(self.dir, "cache.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lookup_reads_once(self):
+        cache = MetadataCache()
+        self.assertEqual(cache.lookup(self.song)["title"], "Song")
+        self.assertEqual(cache.lookup(self.song)["title"], "Song")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_changed_file_is_a_miss(self):
+        cache = MetadataCache()
+        cache.lookup(self.song)
+        write_mp3(self.song, title="Retagged")
+        stat = os.stat(self.song)
+        os.utime(self.song, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertEqual(cache.lookup(self.song)["title"], "Retagged")
+
+    def test_persists_across_instances(self):
+        cache = MetadataCache(self.cache_file)
+        cache.lookup(self.song)
+        cache.save()
+        reopened = MetadataCache(self.cache_file)
+        self.assertEqual(reopened.get(self.song)["title"], "Song")
+
+    def test_shared_file_merges_entries(self):
+        other = os.path.join(self.dir, "b.mp3")
+        write_mp3(other, title="Other")
+        first = MetadataCache(self.cache_file, shared=True)
+        second = MetadataCache(self.cache_file, shared=True)
+        first.lookup(self.song)
+        first.save()
+        second.lookup(other)
+        second.save()
+        self.assertEqual(second.get(self.song)["title"], "Song")
+        reopened = MetadataCache(self.cache_file)
+        self.assertEqual(len(reopened), 2)
+
+    def test_content_hash_matches_copies(self):
+        cache = MetadataCache(hash_content=True)
+        cache.lookup(self.song)
+        copy = os.path.join(self.dir, "copy.mp3")
+        shutil.copyfile(self.song, copy)
+        self.assertEqual(cache.get(copy)["title"], "Song")
+        self.assertEqual(cache.hash_hits, 1)
+        self.assertEqual(content_hash(copy), content_hash(self.song))
+
+    def test_without_hashing_copies_miss(self):
+        cache = MetadataCache()
+        cache.lookup(self.song)
+        copy = os.path.join(self.dir, "copy.mp3")
+        shutil.copyfile(self.song, copy)
+        self.assertIsNone(cache.get(copy))
+
+    def test_worker_reports_batches_and_saves(self):
+        batches = []
+        cache = MetadataCache(self.cache_file)
+        worker = MetadataWorker(cache, batches.append)
+        worker.enqueue("k", self.song)
+        worker.start()
+        worker.join()
+        self.assertEqual(batches[0][0][0], "k")
+        self.assertAlmostEqual(batches[0][0][1]["duration"], 2.606, places=2)
+        self.assertTrue(os.path.exists(self.cache_file))
+
+    def test_idle_worker_saves_outside_lookups(self):
+        cache = MetadataCache(self.cache_file)
+        MetadataWorker(cache, lambda results: None, save_interval=0.01).start()
+        cache.lookup(self.song)
+        for _ in range(200):
+            if os.path.exists(self.cache_file):
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(MetadataCache(self.cache_file)), 1)
+
+    def test_worker_survives_failing_batch(self):
+        batches = []
+        def on_batch(results):
+            batches.append(results)
+            if len(batches) == 1:
+                raise RuntimeError("store unavailable")
+        worker = MetadataWorker(MetadataCache(), on_batch)
+        worker.start()
+        worker.enqueue("first", self.song)
+        worker.join()
+        worker.enqueue("second", self.song)
+        worker.join()
+        self.assertEqual([batch[0][0] for batch in batches], ["first", "second"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import threading
+import unittest
+from adt import Playlist, Song
+from search import SearchIndex, tokenize
+
+class TestTokenize(unittest.TestCase):
+    def test_casefold_and_accents(self):
+        self.assertEqual(tokenize("Beyoncé – NAÏVE Straße"), ["beyonce", "naive", "strasse"])
+
+    def test_keeps_script_marks(self):
+        self.assertEqual(tokenize("கண்ணான கண்ணே"), ["கண்ணான", "கண்ணே"])
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.songs = [
+            Song("Love Story", "Taylor Swift", "p0"),
+            Song("Lovely", "Billie Eilish", "p1"),
+            Song("Crazy in Love", "Beyoncé", "p2"),
+            Song("Halo", "Beyoncé", "p3"),
+            Song("Glove Box", "Lovelace", "p4"),
+        ]
+        for song in self.songs:
+            self.index.add(song)
+
+    def titles(self, query, **kwargs):
+        return [song.title for song in self.index.search(query, **kwargs)]
+
+    def test_prefix_ranks_title_before_artist(self):
+        self.assertEqual(set(self.titles("lov")[:3]), {"Love Story", "Lovely", "Crazy in Love"})
+        self.assertEqual(self.titles("lov")[3:], ["Glove Box"])
+        self.assertEqual(self.titles("lov", limit=2), self.titles("lov")[:2])
+
+    def test_accent_insensitive(self):
+        self.assertEqual(sorted(self.titles("beyonce")), ["Crazy in Love", "Halo"])
+        self.assertEqual(sorted(self.titles("BEYONCÉ")), ["Crazy in Love", "Halo"])
+
+    def test_multi_word(self):
+        # Both words must match; the last is a prefix
+        self.assertEqual(self.titles("beyonce lo"), ["Crazy in Love"])
+        self.assertEqual(self.titles("love sto"), ["Love Story"])
+        # Trailing space makes the last word exact
+        self.assertEqual(self.titles("lovely "), ["Lovely"])
+        self.assertEqual(self.titles("beyonce crazy love"), ["Crazy in Love"])
+        self.assertEqual(self.titles("taylor halo"), [])
+
+    def test_multi_word_title_matches_first(self):
+        self.index.add(Song("Something", "Love Love Band", "p5"))
+        self.index.add(Song("Love Songs", "Halo Choir", "p6"))
+        titles = self.titles("love love")
+        self.assertEqual(titles[-1], "Something")
+        self.assertEqual(set(titles[:-1]), {"Love Story", "Crazy in Love", "Love Songs"})
+        # The last word matching only the artist ranks below a title match
+        self.assertEqual(self.titles("love ha"), ["Love Songs"])
+        self.assertEqual(self.titles("love sw"), ["Love Story"])
+
+    def test_remove(self):
+        self.index.remove(self.songs[3])
+        self.assertEqual(self.titles("halo"), [])
+        self.assertEqual(self.titles("beyonce"), ["Crazy in Love"])
+        self.assertEqual(len(self.index), 4)
+        self.index.add(self.songs[3])
+        self.assertEqual(self.titles("hal"), ["Halo"])
+
+    def test_filter(self):
+        playlist = Playlist()
+        playlist.add_song(self.songs[1])
+        playlist.add_song(self.songs[4])
+        self.assertEqual(self.titles("lov", accept=playlist.__contains__), ["Lovely", "Glove Box"])
+
+    def test_concurrent_searches_after_new_words(self):
+        for i in range(500):
+            self.index.add(Song(f"Word{i:03d}", "Artist", f"w{i}"))
+        results = []
+        def search():
+            results.append(len(self.index.search("word", limit=1000)))
+        threads = [threading.Thread(target=search) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [500] * 8)
+
+    def test_no_match(self):
+        self.assertEqual(self.titles(""), [])
+        self.assertEqual(self.titles("!!"), [])
+        self.assertEqual(self.titles("zzz"), [])
+
+if __name__ == '__main__':
+    unittest.main()
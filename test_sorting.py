@@ -1,5 +1,6 @@
 import unittest
-from adt import Playlist, Song
+from adt import Playlist, IndexedPlaylist, Song, ASC, DESC
+import random
 import time
 
 class TestSorting(unittest.TestCase):
@@ -48,5 +49,103 @@ class TestSorting(unittest.TestCase):
         self.assertTrue(empty_playlist.is_empty())
         self.assertEqual(len(empty_playlist.get_all_songs()), 0)
 
+    def test_sort_multiple_keys(self):
+        playlist = Playlist()
+        songs = [Song("b", "Y", "p1"), Song("a", "X", "p2"), Song("B", "X", "p3"), Song("c", "Y", "p4")]
+        songs[3].play_count = 5
+        for song in songs:
+            playlist.add_song(song)
+
+        playlist.sort([("artist", ASC), ("title", DESC)])
+        self.assertEqual([s['file_path'] for s in playlist.get_all_songs()], ["p3", "p2", "p4", "p1"])
+
+        playlist.sort([("play_count", DESC), ("title", ASC)])
+        # "b" and "B" tie on title, so they keep their previous order
+        self.assertEqual([s['file_path'] for s in playlist.get_all_songs()], ["p4", "p2", "p3", "p1"])
+        self.assertEqual(playlist.tail.song.file_path, "p1")
+
+    def test_sort_casefolds_titles(self):
+        playlist = Playlist()
+        for title in ["straße", "STRASSE", "Straßf", "Strasse"]:
+            playlist.add_song(Song(title, "A", title))
+        playlist.sort([("title", ASC)])
+        titles = [s['title'] for s in playlist.get_all_songs()]
+        self.assertEqual(titles, ["straße", "STRASSE", "Strasse", "Straßf"])
+
+    def test_sort_rejects_unknown_keys(self):
+        with self.assertRaises(ValueError):
+            self.playlist.sort([("genre", ASC)])
+        with self.assertRaises(ValueError):
+            self.playlist.sort([("title", "up")])
+
+class TestLargeSorting(unittest.TestCase):
+    SIZE = 10000
+
+    def build_playlist(self, titles, playlist_class=Playlist):
+        playlist = playlist_class()
+        for i, title in enumerate(titles):
+            playlist.add_song(Song(title, "Artist", f"path{i}"))
+        return playlist
+
+    def assert_links(self, playlist):
+        # Walk forwards and backwards and check both directions agree
+        forward = []
+        curr = playlist.head
+        while curr:
+            forward.append(curr)
+            curr = curr.next
+        backward = []
+        curr = playlist.tail
+        while curr:
+            backward.append(curr)
+            curr = curr.prev
+        self.assertEqual(len(forward), playlist.size)
+        self.assertEqual(forward, backward[::-1])
+        self.assertIs(playlist.current, playlist.head)
+
+    def test_sort_by_title_large(self):
+        # Far deeper than the recursion limit the old recursive merge hit
+        titles = [f"Song {random.randrange(self.SIZE):06d}" for _ in range(self.SIZE)]
+        playlist = self.build_playlist(titles)
+        playlist.sort_by_title()
+
+        sorted_titles = [s['title'] for s in playlist.get_all_songs()]
+        self.assertEqual(sorted_titles, sorted(titles))
+        self.assert_links(playlist)
+
+    def test_sort_by_title_is_stable(self):
+        titles = [random.choice(["b", "A", "a", "c"]) for _ in range(self.SIZE)]
+        playlist = self.build_playlist(titles)
+        original_ids = [s['id'] for s in playlist.get_all_songs()]
+        playlist.sort_by_title()
+
+        songs = playlist.get_all_songs()
+        expected = sorted(zip(titles, original_ids), key=lambda pair: pair[0].lower())
+        self.assertEqual([s['id'] for s in songs], [song_id for _, song_id in expected])
+        self.assert_links(playlist)
+
+    def test_sort_by_date_large(self):
+        playlist = self.build_playlist([f"T{i}" for i in range(self.SIZE)])
+        ids = [s['id'] for s in playlist.get_all_songs()]
+        playlist.sort_by_date()
+
+        # Newest first; equal timestamps keep their original order
+        songs = playlist.get_all_songs()
+        dates = [s['added_at'] for s in songs]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(sorted(s['id'] for s in songs), sorted(ids))
+        self.assert_links(playlist)
+
+    def test_sort_indexed_playlist_large(self):
+        titles = [f"Song {random.randrange(self.SIZE):06d}" for _ in range(self.SIZE)]
+        playlist = self.build_playlist(titles, IndexedPlaylist)
+        playlist.sort_by_title()
+
+        songs = playlist.get_all_songs()
+        self.assertEqual([s['title'] for s in songs], sorted(titles))
+        self.assertEqual(playlist.get_at(self.SIZE - 1).id, songs[-1]['id'])
+        self.assertEqual(playlist.index_of(songs[0]['id']), 0)
+        self.assert_links(playlist)
+
 if __name__ == '__main__':
     unittest.main()
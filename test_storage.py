@@ -0,0 +1,356 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from storage import BackgroundWriter, JsonStore, SqliteStore, atomic_write_json
+
+class TestJsonStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "playlists_data.json")
+        self.store = JsonStore(self.path, compact_every=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reopen(self):
+        return JsonStore(self.path, compact_every=3)
+
+    def test_load_empty(self):
+        data, ops = self.store.load()
+        self.assertIsNone(data)
+        self.assertEqual(ops, [])
+
+    def test_replay_after_snapshot(self):
+        self.store.snapshot({"playlists": {}})
+        self.store.record({"op": "switch", "playlist_id": "a"})
+        self.store.record({"op": "switch", "playlist_id": "b"})
+
+        data, ops = self.reopen().load()
+        self.assertEqual(data["playlists"], {})
+        self.assertEqual([op["playlist_id"] for op in ops], ["a", "b"])
+        self.assertEqual([op["seq"] for op in ops], [1, 2])
+
+    def test_snapshot_truncates_log(self):
+        self.store.record({"op": "switch", "playlist_id": "a"})
+        self.store.snapshot({"playlists": {}})
+        self.store.record({"op": "switch", "playlist_id": "b"})
+
+        store = self.reopen()
+        data, ops = store.load()
+        self.assertEqual(data["log_seq"], 1)
+        self.assertEqual([op["playlist_id"] for op in ops], ["b"])
+        # New records continue the sequence
+        self.assertEqual(store.seq, 2)
+
+    def test_skips_records_covered_by_snapshot(self):
+        # Simulate a crash after the snapshot rename but before the log was truncated
+        self.store.record({"op": "switch", "playlist_id": "a"})
+        atomic_write_json(self.path, {"playlists": {}, "log_seq": 1})
+
+        _, ops = self.reopen().load()
+        self.assertEqual(ops, [])
+
+    def test_ignores_torn_record(self):
+        self.store.snapshot({"playlists": {}})
+        self.store.record({"op": "switch", "playlist_id": "a"})
+        with open(self.store.log_path, "a") as f:
+            f.write('{"op": "swi')
+
+        _, ops = self.reopen().load()
+        self.assertEqual(len(ops), 1)
+
+    def test_needs_compaction(self):
+        for i in range(3):
+            self.assertFalse(self.store.needs_compaction())
+            self.store.record({"op": "switch", "playlist_id": str(i)})
+        self.assertTrue(self.store.needs_compaction())
+        self.store.snapshot({"playlists": {}})
+        self.assertFalse(self.store.needs_compaction())
+
+
+def song(song_id, title="T", play_count=0, last_played=None):
+    return {"id": song_id, "title": title, "artist": "A", "file_path": f"music/{song_id}.mp3",
+            "added_at": "2025-01-01T00:00:00", "is_favorite": False,
+            "last_played": last_played, "play_count": play_count}
+
+class TestSqliteStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "playlists.db")
+        self.store = SqliteStore(self.path)
+        self.store.snapshot({
+            "songs": [song("a"), song("b", play_count=3, last_played="2025-02-01T00:00:00"), song("c")],
+            "playlists": {
+                "p1": {"name": "Library", "description": "", "created_at": "2025-01-01T00:00:00",
+                       "song_ids": ["a", "b", "c"]},
+                "p2": {"name": "Other", "description": "", "created_at": "2025-01-01T00:00:00",
+                       "song_ids": ["b"]},
+            },
+            "current_playlist_id": "p1",
+        })
+
+    def tearDown(self):
+        self.store.conn.close()
+        shutil.rmtree(self.dir)
+
+    def song_ids(self, playlist_id="p1"):
+        data, _ = SqliteStore(self.path).load()
+        return data["playlists"][playlist_id]["song_ids"]
+
+    def loaded_songs(self):
+        data, _ = SqliteStore(self.path).load()
+        return {s["id"]: s for s in data["songs"]}
+
+    def test_load_empty(self):
+        store = SqliteStore(os.path.join(self.dir, "empty.db"))
+        self.assertEqual(store.load(), (None, []))
+
+    def test_snapshot_round_trip(self):
+        data, ops = SqliteStore(self.path).load()
+        self.assertEqual(ops, [])
+        self.assertEqual(list(data["playlists"]), ["p1", "p2"])
+        self.assertEqual(data["current_playlist_id"], "p1")
+        self.assertEqual(self.song_ids(), ["a", "b", "c"])
+        self.assertEqual(self.song_ids("p2"), ["b"])
+        # Each song is stored once
+        songs = self.loaded_songs()
+        self.assertEqual(sorted(songs), ["a", "b", "c"])
+        self.assertEqual((songs["b"]["play_count"], songs["b"]["last_played"]), (3, "2025-02-01T00:00:00"))
+        self.assertIsNone(songs["a"]["last_played"])
+
+    def test_duration_column(self):
+        self.store.record({"op": "add", "playlist_id": "p1", "song": dict(song("d"), duration=61.5)})
+        songs = self.loaded_songs()
+        self.assertEqual(songs["d"]["duration"], 61.5)
+        self.assertIsNone(songs["a"]["duration"])
+
+    def test_adds_duration_to_older_databases(self):
+        self.store.conn.execute("ALTER TABLE songs DROP COLUMN duration")
+        self.store.conn.commit()
+        self.assertIsNone(self.loaded_songs()["a"]["duration"])
+
+    def test_shuffle_state(self):
+        data, _ = SqliteStore(self.path).load()
+        self.assertIsNone(data["playlists"]["p1"]["shuffle"])
+        self.store.record({"op": "shuffle", "playlist_id": "p1", "seed": 42, "position": 7})
+        data, _ = SqliteStore(self.path).load()
+        self.assertEqual(data["playlists"]["p1"]["shuffle"], {"seed": 42, "position": 7})
+        # Only the cursor moved: no other process has anything to reload
+        self.assertEqual(self.store.stale_scopes(), [])
+        self.store.snapshot(data)
+        self.assertEqual(SqliteStore(self.path).load()[0]["playlists"]["p1"]["shuffle"], {"seed": 42, "position": 7})
+        # Smart shuffle keeps only its window
+        self.store.record({"op": "shuffle", "playlist_id": "p1", "window": 20})
+        self.assertEqual(SqliteStore(self.path).load()[0]["playlists"]["p1"]["shuffle"], {"window": 20})
+
+    def test_record_operations(self):
+        self.store.record({"op": "add", "playlist_id": "p1", "song": song("d")})
+        self.store.record({"op": "remove", "playlist_id": "p1", "song_id": "a"})
+        self.store.record({"op": "favorite", "playlist_id": "p1", "song_id": "c", "is_favorite": True})
+        self.store.record({"op": "played", "playlist_id": "p1", "song_id": "c", "play_count": 2,
+                           "last_played": "2025-03-01T00:00:00"})
+        self.store.record({"op": "switch", "playlist_id": "p2"})
+
+        data, _ = SqliteStore(self.path).load()
+        self.assertEqual(self.song_ids(), ["b", "c", "d"])
+        c = self.loaded_songs()["c"]
+        self.assertTrue(c["is_favorite"])
+        self.assertEqual(c["play_count"], 2)
+        self.assertEqual(data["current_playlist_id"], "p2")
+        # Removing the last entry of a song drops the song row too
+        count = self.store.conn.execute("SELECT COUNT(*) FROM songs WHERE id = 'a'").fetchone()[0]
+        self.assertEqual(count, 0)
+
+    def test_move(self):
+        self.store.record({"op": "move", "playlist_id": "p1", "song_id": "a", "position": 2})
+        self.assertEqual(self.song_ids(), ["b", "c", "a"])
+        self.store.record({"op": "move", "playlist_id": "p1", "song_id": "a", "position": 0})
+        self.assertEqual(self.song_ids(), ["a", "b", "c"])
+        self.store.record({"op": "move", "playlist_id": "p1", "song_id": "c", "position": 1})
+        self.assertEqual(self.song_ids(), ["a", "c", "b"])
+
+    def test_move_renumbers_when_gap_is_exhausted(self):
+        # Repeatedly bisecting the same gap runs out of float precision
+        for i in range(80):
+            song_id = "a" if i % 2 == 0 else "c"
+            self.store.record({"op": "move", "playlist_id": "p1", "song_id": song_id, "position": 1})
+        self.assertEqual(self.song_ids(), ["b", "c", "a"])
+
+    def test_other_processes_writes_are_stale(self):
+        self.store.load()
+        other = SqliteStore(self.path)
+        other.load()
+        self.store.record({"op": "add", "playlist_id": "p1", "song": song("d")})
+        self.assertEqual(self.store.stale_scopes(), [])
+        self.assertEqual(other.stale_scopes(), ["p1"])
+        version, songs = other.load_playlist_songs(["p1", "gone"])["p1"]
+        self.assertEqual([s["id"] for s in songs], ["a", "b", "c", "d"])
+        other.mark_seen("p1", version)
+        self.assertEqual(other.stale_scopes(), [])
+        # Song field changes are read song by song, without reloading playlists
+        self.store.record({"op": "favorite", "playlist_id": "p1", "song_id": "b", "is_favorite": True})
+        self.assertEqual(other.stale_scopes(), ["*songs"])
+        version, songs = other.load_changed_songs()
+        self.assertEqual([(s["id"], s["is_favorite"]) for s in songs], [("b", True)])
+        other.mark_seen("*songs", version)
+        self.assertEqual(other.load_changed_songs(), (version, []))
+        self.store.record({"op": "switch", "playlist_id": "p2"})
+        self.assertEqual(other.stale_scopes(), [""])
+        version, rows, current = other.load_registry()
+        self.assertEqual(([r[0] for r in rows], current), (["p1", "p2"], "p2"))
+
+    def test_own_write_after_another_stays_stale(self):
+        self.store.load()
+        other = SqliteStore(self.path)
+        other.load()
+        other.record({"op": "remove", "playlist_id": "p1", "song_id": "a"})
+        self.store.record({"op": "remove", "playlist_id": "p1", "song_id": "c"})
+        # Its own write does not hide the other one
+        self.assertEqual(self.store.stale_scopes(), ["p1"])
+        self.assertEqual(other.stale_scopes(), ["p1"])
+
+    def test_replace_leaves_other_playlists(self):
+        self.store.load()
+        other = SqliteStore(self.path)
+        other.record({"op": "add", "playlist_id": "p2", "song": song("d")})
+        self.store.record({
+            "op": "replace",
+            "playlists": {"p1": {"name": "Renamed", "description": "", "created_at": "2025-01-01T00:00:00",
+                                 "song_ids": ["c", "b"]},
+                          "p3": {"name": "New", "description": "", "created_at": "2025-01-02T00:00:00",
+                                 "song_ids": ["e"]}},
+            "deleted": [],
+            # Stale play counts do not overwrite stored ones
+            "songs": [song("c"), song("b"), song("e")],
+            "current_playlist_id": "p3",
+        })
+        data, _ = SqliteStore(self.path).load()
+        self.assertEqual(list(data["playlists"]), ["p1", "p2", "p3"])
+        self.assertEqual(data["playlists"]["p1"]["name"], "Renamed")
+        self.assertEqual(self.song_ids(), ["c", "b"])
+        self.assertEqual(self.song_ids("p2"), ["b", "d"])
+        songs = self.loaded_songs()
+        self.assertNotIn("a", songs)
+        self.assertEqual(songs["b"]["play_count"], 3)
+        self.assertEqual(data["current_playlist_id"], "p3")
+
+        self.store.record({"op": "replace", "playlists": {}, "deleted": ["p2"], "songs": [],
+                           "current_playlist_id": "p3"})
+        self.assertNotIn("d", self.loaded_songs())
+        self.assertEqual(sorted(r[0] for r in self.store.conn.execute("SELECT scope FROM versions")),
+                         ["", "*songs", "p1", "p3"])
+
+
+class FakeStore:
+    def __init__(self):
+        self.writes = []
+        self.wants_compaction = False
+
+    def needs_compaction(self):
+        return self.wants_compaction
+
+    def record(self, op):
+        self.writes.append(op)
+
+    def snapshot(self, data):
+        self.writes.append(data)
+
+class TestBackgroundWriter(unittest.TestCase):
+    def setUp(self):
+        self.store = FakeStore()
+        self.writer = BackgroundWriter(self.store, interval=60)
+
+    def test_debounced_until_flush(self):
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "a"})
+        self.assertEqual(self.store.writes, [])
+        self.assertEqual(self.writer.flush(), 1)
+        self.assertEqual(len(self.store.writes), 1)
+        self.assertEqual(self.writer.flush(), 0)
+
+    def test_no_compaction_while_snapshot_queued(self):
+        self.store.wants_compaction = True
+        self.assertTrue(self.writer.needs_compaction())
+        self.writer.snapshot({"playlists": {}})
+        self.assertFalse(self.writer.needs_compaction())
+        self.writer.flush()
+        self.assertTrue(self.writer.needs_compaction())
+
+    def test_coalesces_absolute_updates(self):
+        for count in range(1, 4):
+            self.writer.record({"op": "played", "playlist_id": "p", "song_id": "a", "play_count": count})
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "b"})
+        self.writer.record({"op": "played", "playlist_id": "p", "song_id": "a", "play_count": 4})
+        self.writer.flush()
+
+        # Only the latest play count is written, after the ops queued before it
+        self.assertEqual([op["op"] for op in self.store.writes], ["remove", "played"])
+        self.assertEqual(self.store.writes[1]["play_count"], 4)
+        stats = self.writer.stats()
+        self.assertEqual((stats["mutation_count"], stats["written_count"], stats["coalesced_count"]), (5, 2, 3))
+
+    def test_collapses_consecutive_moves(self):
+        self.writer.record({"op": "move", "playlist_id": "p", "song_id": "a", "position": 1})
+        self.writer.record({"op": "move", "playlist_id": "p", "song_id": "a", "position": 5})
+        self.writer.record({"op": "move", "playlist_id": "p", "song_id": "b", "position": 0})
+        self.writer.record({"op": "move", "playlist_id": "p", "song_id": "a", "position": 2})
+        self.writer.flush()
+        self.assertEqual([(op["song_id"], op["position"]) for op in self.store.writes],
+                         [("a", 5), ("b", 0), ("a", 2)])
+
+    def test_snapshot_supersedes_queued_ops(self):
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "a"})
+        self.writer.snapshot({"playlists": {}})
+        self.writer.record({"op": "switch", "playlist_id": "p"})
+        self.writer.flush()
+        self.assertEqual(self.store.writes, [{"playlists": {}}, {"op": "switch", "playlist_id": "p"}])
+
+    def test_sync_mode_writes_immediately(self):
+        writer = BackgroundWriter(self.store, sync=True)
+        writer.record({"op": "switch", "playlist_id": "p"})
+        self.assertEqual(len(self.store.writes), 1)
+        self.assertEqual(writer.stats()["flush_count"], 1)
+
+    def test_background_thread_flushes_and_stop_drains(self):
+        writer = BackgroundWriter(self.store, interval=0.01)
+        writer.start()
+        writer.record({"op": "switch", "playlist_id": "p"})
+        for _ in range(200):
+            if self.store.writes:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.store.writes), 1)
+        writer.record({"op": "switch", "playlist_id": "q"})
+        writer.stop()
+        self.assertEqual(self.store.writes[-1]["playlist_id"], "q")
+
+    def test_failed_flush_requeues_unwritten_ops(self):
+        failures = [OSError("disk full")]
+        record = self.store.record
+        def flaky_record(op):
+            if op["song_id"] == "b" and failures:
+                raise failures.pop()
+            record(op)
+        self.store.record = flaky_record
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "a"})
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "b"})
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "c"})
+        self.assertEqual(self.writer.flush(), 0)
+        self.writer.record({"op": "remove", "playlist_id": "p", "song_id": "d"})
+        self.assertEqual(self.writer.pending(), 3)
+        self.writer.flush()
+        self.assertEqual([op["song_id"] for op in self.store.writes], ["a", "b", "c", "d"])
+        self.assertEqual(self.writer.stats()["error_count"], 1)
+
+    def test_sync_mode_raises_write_errors(self):
+        writer = BackgroundWriter(self.store, sync=True)
+        def failing_snapshot(data):
+            raise OSError("disk full")
+        self.store.snapshot = failing_snapshot
+        with self.assertRaises(OSError):
+            writer.snapshot({"playlists": {}})
+        self.assertEqual(writer.pending(), 1)
+
+if __name__ == '__main__':
+    unittest.main()